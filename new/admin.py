@@ -1,10 +1,18 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django import forms
+from django.core.paginator import Paginator
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.functional import cached_property
 from django_json_widget.widgets import JSONEditorWidget
 from .models import (
     Home, AlternateHome, About, ServiceCategory, ServiceCategoryContent, 
     Service, ServiceContent, ServiceVariant, ServiceVariantContent
 )
+from .search import KINDS as SEARCH_KINDS, SEARCH_TABLE, is_indexed, match_expression
 from .widgets import (
     UniversalTinyMCEWidget, TinyMCEWidget, TinyMCESmallWidget, TinyMCEInlineWidget,
     CustomJSONWidget, SchemaJSONWidget
@@ -139,6 +147,74 @@ class ServiceVariantContentInline(admin.TabularInline):
     extra = 1
 
 
+# Changelists of the catalog (services and variants), which hold
+# thousands of rows: rows are read with their parent in one query and
+# without the rich text, in the order of the listing index, parents are
+# picked with autocompletes, search uses the full-text index and the
+# unfiltered list can be counted from its primary keys.
+class EstimatedCountPaginator(Paginator):
+    """
+    With ADMIN_ESTIMATED_COUNTS, counts the unfiltered list as the span of
+    its primary keys (two index lookups instead of a COUNT(*) over the
+    table). Deleted rows make the last pages short.
+    """
+    @cached_property
+    def count(self):
+        if settings.ADMIN_ESTIMATED_COUNTS and not self.object_list.query.where:
+            model = self.object_list.model
+            connection = connections[router.db_for_read(model)]
+            table = connection.ops.quote_name(model._meta.db_table)
+            pk = connection.ops.quote_name(model._meta.pk.column)
+            with connection.cursor() as cursor:
+                # Separate subqueries: SQLite only reads a lone MIN() or MAX() from the index
+                cursor.execute('SELECT (SELECT MIN({pk}) FROM {table}), (SELECT MAX({pk}) FROM {table})'.format(
+                    pk=pk, table=table,
+                ))
+                first, last = cursor.fetchone()
+            return last - first + 1 if first is not None else 0
+        return super().count
+
+
+class ParentListFilter(admin.RelatedFieldListFilter):
+    """Related filter reading only the pk and heading of the parents."""
+    def field_choices(self, field, request, model_admin):
+        return list(field.related_model._default_manager.order_by('heading').values_list('pk', 'heading'))
+
+
+class CatalogChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        return super().get_queryset(request, exclude_parameters).only(*self.model_admin.list_fields)
+
+
+class CatalogAdmin(admin.ModelAdmin):
+    # Fields read for the changelist rows
+    list_fields = ('heading', 'slug', 'order', 'updated_at', 'service_category__heading')
+    list_select_related = ['service_category']
+    autocomplete_fields = ['service_category']
+    search_fields = ['heading', 'slug']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    # The listing index, pk included so no other tiebreaker is added
+    ordering = ['service_category_id', 'order', 'heading', 'pk']
+
+    def get_changelist(self, request, **kwargs):
+        return CatalogChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        """Headings matching every word (full-text index), or the exact slug."""
+        expression = match_expression(search_term)
+        if not expression:
+            return queryset, False
+        if not is_indexed(SEARCH_KINDS[self.model], queryset.db):
+            # Not indexed yet: search_fields with icontains, slower but complete
+            return super().get_search_results(request, queryset, search_term)
+        matches = RawSQL(
+            'SELECT rowid / 3 FROM {table} WHERE {table} MATCH %s AND kind = %s'.format(table=SEARCH_TABLE),
+            ['heading : (%s)' % expression, SEARCH_KINDS[self.model]],
+        )
+        return queryset.filter(Q(pk__in=matches) | Q(slug=search_term.strip())), False
+
+
 # Main Admin Classes
 @admin.register(Home)
 class HomeAdmin(admin.ModelAdmin):
@@ -241,15 +317,13 @@ class ServiceCategoryAdmin(admin.ModelAdmin):
 
 
 @admin.register(Service)
-class ServiceAdmin(admin.ModelAdmin):
+class ServiceAdmin(CatalogAdmin):
     form = ServiceAdminForm
     inlines = [ServiceContentInline]
     list_display = ['heading', 'service_category', 'order', 'slug']
-    list_filter = ['service_category', 'order']
-    search_fields = ['heading', 'slug']
+    list_filter = [('service_category', ParentListFilter), 'order']
     prepopulated_fields = {'slug': ('heading',)}
     list_editable = ['order']
-    ordering = ['service_category', 'order', 'heading']
     
     fieldsets = (
         ('Basic Information', {
@@ -277,15 +351,14 @@ class ServiceAdmin(admin.ModelAdmin):
 
 
 @admin.register(ServiceVariant)
-class ServiceVariantAdmin(admin.ModelAdmin):
+class ServiceVariantAdmin(CatalogAdmin):
     form = ServiceVariantAdminForm
     inlines = [ServiceVariantContentInline]
     list_display = ['heading', 'service_category', 'order', 'slug']
-    list_filter = ['service_category', 'order']
-    search_fields = ['heading', 'slug']
+    # By category: a list of every service would not scale
+    list_filter = [('service_category__service_category', ParentListFilter), 'order']
     prepopulated_fields = {'slug': ('heading',)}
     list_editable = ['order']
-    ordering = ['service_category', 'order', 'heading']
     
     fieldsets = (
         ('Basic Information', {
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class NewConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'new'
+
+    def ready(self):
+        from . import compression, metrics, signals  # noqa: F401
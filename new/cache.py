@@ -0,0 +1,227 @@
+"""
+Full-page cache for the public views.
+
+Pages are stored per scheme, host and path. Of the query string only the
+parameters of ``PAGE_CACHE_QUERY_PARAMS``, the ones the cached views read,
+are part of the key: arbitrary query strings neither fill the cache nor
+miss it.
+
+Each cached page remembers the content tags it was rendered from
+(``'category:3'``, ``'services'`` ...) and the version every tag had at
+that moment. Saving or deleting content bumps the versions of its tags
+(see ``new.signals``), so every page that depended on it stops validating
+and is rendered again on the next request.
+
+A hit costs two cache reads and never touches the database. Pages are
+stored with their gzip and brotli bodies, compressed once when the page is
+rendered (see ``new.compression``).
+"""
+import hashlib
+import uuid
+from functools import wraps
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from .compression import encode_response, precompress
+from .models import (
+    Home, AlternateHome, About, ServiceCategory, ServiceCategoryContent,
+    Service, ServiceContent, ServiceVariant, ServiceVariantContent, PageSnapshot
+)
+
+# Bumped on every content change; used to detect saves that race a render.
+CONTENT_TAG = 'content'
+
+# Bumped when the site menu changes (see ``new.navigation``); every public
+# page shows the menu.
+NAVIGATION_TAG = 'navigation'
+
+# Bumped when the navigation tree changes, menu or not (a variant, say); no
+# page carries it, the processes only rebuild their tree.
+NAVIGATION_TREE_TAG = 'navigation-tree'
+
+# Carried by every category, service and variant page, whose other tags
+# name the objects it shows; only bulk operations bump them.
+PAGE_KIND_TAGS = {
+    kind: 'pages:%s' % kind
+    for kind in (PageSnapshot.SERVICE_CATEGORY, PageSnapshot.SERVICE, PageSnapshot.SERVICE_VARIANT)
+}
+
+# Every public page depends on at least one of these; bumping them all
+# invalidates the whole site (used after bulk operations).
+SITE_TAGS = (
+    'home', 'about', 'categories', 'services', 'variants', *PAGE_KIND_TAGS.values(),
+    NAVIGATION_TAG, NAVIGATION_TREE_TAG,
+)
+
+
+def get_page_cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def _tag_key(tag):
+    return 'page-tag:%s' % tag
+
+
+def _page_key(request):
+    params = sorted(
+        (name, values) for name, values in request.GET.lists() if name in settings.PAGE_CACHE_QUERY_PARAMS
+    )
+    url = '%s://%s%s?%s' % (request.scheme, request.get_host(), request.path, urlencode(params, doseq=True))
+    return 'page:%s' % hashlib.md5(url.encode()).hexdigest()
+
+
+def content_tags(instance):
+    """
+    Return the tags a saved or deleted ``instance`` invalidates.
+
+    Object tags (``'service:<pk>'``) cover pages that show the object or one
+    of its children, the "related" and "other" blocks included; list tags
+    (``'categories'``) cover the lists that can show any object of that
+    kind, such as the categories of the home page.
+    """
+    if isinstance(instance, (Home, AlternateHome)):
+        return {'home'}
+    if isinstance(instance, About):
+        return {'about'}
+    if isinstance(instance, ServiceCategory):
+        return {'category:%s' % instance.pk, 'categories'}
+    if isinstance(instance, ServiceCategoryContent):
+        return {'category:%s' % instance.service_category_id}
+    if isinstance(instance, Service):
+        return {
+            'service:%s' % instance.pk,
+            'category:%s' % instance.service_category_id,
+            'services',
+        }
+    if isinstance(instance, ServiceContent):
+        return {'service:%s' % instance.service_id}
+    if isinstance(instance, ServiceVariant):
+        tags = {
+            'variant:%s' % instance.pk,
+            'service:%s' % instance.service_category_id,
+            'variants',
+        }
+        # Category pages list the variants of all their services.
+        category_id = Service.objects.filter(
+            pk=instance.service_category_id
+        ).values_list('service_category_id', flat=True).first()
+        if category_id is not None:
+            tags.add('category:%s' % category_id)
+        return tags
+    if isinstance(instance, ServiceVariantContent):
+        return {'variant:%s' % instance.service_variant_id}
+    return set()
+
+
+def bump_tags(tags):
+    """Invalidate every cached page that depends on one of ``tags``."""
+    tags = set(tags) | {CONTENT_TAG}
+    get_page_cache().set_many({_tag_key(tag): uuid.uuid4().hex for tag in tags}, None)
+
+
+def _tag_versions(tags, create=False):
+    cache = get_page_cache()
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = cache.get_many(keys)
+    if create:
+        missing = [key for key in keys if key not in found]
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, None)
+        if missing:
+            found.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in found.items()}
+
+
+def tag_version(tag):
+    """Current version of ``tag``; changes whenever the tag is bumped."""
+    return _tag_versions([tag], create=True)[tag]
+
+
+def content_version():
+    """Version of ``CONTENT_TAG``; changes whenever any content is saved."""
+    return tag_version(CONTENT_TAG)
+
+
+def get_cached_page(request):
+    entry = get_page_cache().get(_page_key(request))
+    if entry is None:
+        return None
+    versions, response = entry
+    if _tag_versions(versions) != versions:
+        return None
+    return response
+
+
+def set_cached_page(request, response, tags):
+    versions = _tag_versions(tags, create=True)
+    if len(versions) != len(set(tags)):
+        return
+    get_page_cache().set(_page_key(request), (versions, response), settings.PAGE_CACHE_TIMEOUT)
+
+
+def tag_page(response, *tags):
+    """Declare the content tags ``response`` was rendered from."""
+    response.page_cache_tags = tags
+    return response
+
+
+def _store_page(request, response, generation):
+    tags = getattr(response, 'page_cache_tags', None)
+    if (
+        tags is not None
+        and response.status_code == 200
+        and not response.cookies
+        # Content saved while rendering; the page may already be stale.
+        and _tag_versions([CONTENT_TAG]) == generation
+    ):
+        precompress(response)
+        set_cached_page(request, response, tags)
+
+
+def _content_generation():
+    return _tag_versions([CONTENT_TAG], create=True)
+
+
+def cache_public_page(view_func):
+    """
+    Serve ``view_func`` from the page cache.
+
+    Only successful GET/HEAD responses tagged with ``tag_page()`` and
+    setting no cookies are stored. Works with async views too; their cache
+    calls run in worker threads, not in the thread the ORM calls queue on.
+    """
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view_func(request, *args, **kwargs)
+
+            response = await sync_to_async(get_cached_page, thread_sensitive=False)(request)
+            if response is not None:
+                return encode_response(request, response)
+
+            generation = await sync_to_async(_content_generation, thread_sensitive=False)()
+            response = await view_func(request, *args, **kwargs)
+            await sync_to_async(_store_page, thread_sensitive=False)(request, response, generation)
+            return encode_response(request, response)
+
+        return _wrapped_view
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view_func(request, *args, **kwargs)
+
+        response = get_cached_page(request)
+        if response is not None:
+            return encode_response(request, response)
+
+        generation = _content_generation()
+        response = view_func(request, *args, **kwargs)
+        _store_page(request, response, generation)
+        return encode_response(request, response)
+
+    return _wrapped_view
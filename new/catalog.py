@@ -0,0 +1,159 @@
+"""
+Generated catalogs for load testing (``create_test_data``) and the
+benchmark suite.
+
+Rows are inserted with ``bulk_create`` in batches, one transaction per
+batch, so neither signals nor per-row queries run: afterwards the render
+snapshots and image renditions are rebuilt with their commands. The
+placeholder images are drawn in a process pool and shared round-robin by
+the generated pages.
+"""
+from functools import cache
+from itertools import islice
+
+from django.db import transaction
+
+from .imaging import get_pool, placeholder_image
+from .richtext import render_rich_text
+from .models import (
+    ServiceCategory, ServiceCategoryContent, Service, ServiceContent,
+    ServiceVariant, ServiceVariantContent
+)
+
+# Size of the placeholder drawn for every image field
+PLACEHOLDER_SIZES = {
+    'image_m': (640, 800),
+    'image_t': (1024, 768),
+    'image_d': (1920, 1080),
+}
+PLACEHOLDER_COLORS = [
+    (13, 148, 136), (5, 150, 105), (51, 65, 85), (15, 118, 110),
+    (4, 120, 87), (30, 41, 59), (20, 184, 166), (16, 185, 129),
+]
+
+RICH_TEXT = (
+    '<h2>Why it matters</h2><p>Paragraph with <strong>bold</strong> and '
+    '<a href="https://example.com">a link</a>.</p><ul><li>One</li><li>Two</li></ul>'
+)
+
+
+def placeholder_images(count, workers):
+    """
+    Draw ``count`` placeholders per image field in ``workers`` processes.
+    Returns ``{field: [name, ...]}``.
+    """
+    jobs = [
+        (
+            '%s/placeholder-%s.jpg' % (field, index),
+            size,
+            PLACEHOLDER_COLORS[index % len(PLACEHOLDER_COLORS)],
+            'Placeholder %s' % (index + 1),
+        )
+        for field, size in PLACEHOLDER_SIZES.items()
+        for index in range(count)
+    ]
+    with get_pool(workers) as pool:
+        names = list(pool.map(placeholder_image, jobs))
+    return {
+        field: names[position * count:(position + 1) * count]
+        for position, field in enumerate(PLACEHOLDER_SIZES)
+    }
+
+
+def page_fields(name, index, prefix, images):
+    """Values of the required fields of a generated page."""
+    title = '%s %s' % (name, index)
+    fields = {
+        'heading': title,
+        'slug': '%s-%s-%s' % (prefix, name.lower(), index),
+        'alt': title,
+        'small_description': '<p>Short description of %s.</p>' % title,
+        'content': RICH_TEXT * 4,
+        'title': '%s | The One Solution' % title,
+        'meta_description': 'Meta description of %s' % title,
+        'meta_keywords': 'seo, marketing',
+        'schema': {'@context': 'https://schema.org', '@type': 'Service', 'name': title},
+        'og_title': title,
+        'og_type': 'website',
+        'og_url': 'https://example.com/',
+        'og_image': 'https://example.com/og.jpg',
+        'og_description': 'Open Graph description of %s' % title,
+        'og_site_name': 'The One Solution',
+    }
+    # bulk_create skips the pre_save signal that fills it
+    fields['rendered'] = {name: _rendered(fields[name]) for name in ('small_description', 'content')}
+    fields.update(_images(images, index))
+    return fields
+
+
+@cache
+def _rendered(value):
+    return render_rich_text(value)
+
+
+def _images(images, index):
+    return {field: names[index % len(names)] for field, names in images.items() if names}
+
+
+def bulk_insert(model, objects, batch_size):
+    """``bulk_create`` ``objects`` one transaction per batch; returns them with pks."""
+    created = []
+    objects = iter(objects)
+    while True:
+        batch = list(islice(objects, batch_size))
+        if not batch:
+            return created
+        with transaction.atomic():
+            created.extend(model.objects.bulk_create(batch))
+
+
+def generate_catalog(home, categories, services_per_category, variants_per_service,
+                     blocks_per_page=1, images=None, prefix='load', batch_size=1000):
+    """
+    Insert ``categories`` categories, each with ``services_per_category``
+    services of ``variants_per_service`` variants, and ``blocks_per_page``
+    content blocks per page. Returns the number of rows per model.
+    """
+    images = images or {}
+    category_objects = bulk_insert(ServiceCategory, (
+        ServiceCategory(home=home, **page_fields('Category', index, prefix, images))
+        for index in range(categories)
+    ), batch_size)
+    service_objects = bulk_insert(Service, (
+        Service(
+            service_category=category, order=number,
+            **page_fields('Service', index * services_per_category + number, prefix, images)
+        )
+        for index, category in enumerate(category_objects)
+        for number in range(services_per_category)
+    ), batch_size)
+    variant_objects = bulk_insert(ServiceVariant, (
+        ServiceVariant(
+            service_category=service, order=number,
+            **page_fields('Variant', index * variants_per_service + number, prefix, images)
+        )
+        for index, service in enumerate(service_objects)
+        for number in range(variants_per_service)
+    ), batch_size)
+
+    blocks = {}
+    for model, parent, pages in (
+        (ServiceCategoryContent, 'service_category', category_objects),
+        (ServiceContent, 'service', service_objects),
+        (ServiceVariantContent, 'service_variant', variant_objects),
+    ):
+        blocks[model] = len(bulk_insert(model, (
+            model(
+                content=RICH_TEXT, rendered={'content': _rendered(RICH_TEXT)},
+                **{parent: page}, **_images(images, page.pk + number)
+            )
+            for page in pages
+            for number in range(blocks_per_page)
+        ), batch_size))
+
+    return {
+        ServiceCategory: len(category_objects),
+        Service: len(service_objects),
+        ServiceVariant: len(variant_objects),
+        **blocks,
+    }
@@ -0,0 +1,157 @@
+"""
+Precompressed responses and files.
+
+Nothing is compressed per request. Bodies are compressed once, when they
+are produced, and the variant the client accepts is picked on the way out:
+
+* cached pages carry their gzip and brotli bodies in the page cache
+  (``new.cache``) and are served with ``Content-Encoding``;
+* ``collectstatic`` writes ``.gz`` and ``.br`` siblings of every collected
+  text file (``CompressedManifestStaticFilesStorage`` in ``new.storage``),
+  as does the static export next to each page, for nginx's
+  ``gzip_static on;`` and ``brotli_static on;`` (ngx_brotli).
+
+Brotli needs the ``brotli`` package (requirements.txt); without it only
+gzip is produced, which the ``new.W001`` system check reports. Like ``new.imaging`` this module must not import models: the
+spawned ``collectstatic`` workers unpickle its functions.
+"""
+import gzip
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core import checks
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content-Encoding: file suffix, in order of preference
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+# Files and bodies smaller than this are not worth a compressed variant
+MIN_SIZE = 256
+COMPRESSIBLE_EXTENSIONS = {
+    '.css', '.js', '.mjs', '.json', '.map', '.svg', '.html', '.htm', '.txt', '.xml',
+    '.ico', '.eot', '.otf', '.ttf',
+}
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+# Compression effort: static files are compressed at build time, pages on
+# the request that renders them
+LEVELS = {
+    'static': {'gzip': 9, 'br': 11},
+    'page': {'gzip': 6, 'br': 5},
+}
+
+ACCEPT_ENCODING_RE = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?')
+
+
+def compress(data, levels=LEVELS['page']):
+    """``{encoding: body}`` of ``data``, leaving out variants that do not save bytes."""
+    if len(data) < MIN_SIZE:
+        return {}
+    bodies = {}
+    if brotli is not None:
+        bodies['br'] = brotli.compress(data, quality=levels['br'])
+    # mtime=0: the same input gives the same bytes
+    bodies['gzip'] = gzip.compress(data, compresslevel=levels['gzip'], mtime=0)
+    return {encoding: body for encoding, body in bodies.items() if len(body) < len(data)}
+
+
+def accepted_encoding(request, encodings):
+    """The preferred of ``encodings`` that the ``Accept-Encoding`` of ``request`` allows, or None."""
+    accepted = {}
+    for match in ACCEPT_ENCODING_RE.finditer(request.headers.get('Accept-Encoding', '')):
+        try:
+            accepted[match.group(1).lower()] = float(match.group(2) or 1)
+        except ValueError:
+            continue
+    for encoding in ENCODINGS:
+        if encoding in encodings and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def precompress(response):
+    """Attach the compressed bodies of ``response`` when its content type is worth it."""
+    if response.streaming or not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES):
+        return
+    response.precompressed = compress(response.content)
+
+
+def encode_response(request, response):
+    """Serve the precompressed body of ``response`` that ``request`` accepts, if any."""
+    bodies = getattr(response, 'precompressed', None)
+    if not bodies or response.has_header('Content-Encoding'):
+        return response
+    patch_vary_headers(response, ['Accept-Encoding'])
+    encoding = accepted_encoding(request, bodies)
+    if encoding is None:
+        return response
+    response.content = bodies[encoding]
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Length'] = str(len(response.content))
+    # The encoded body is not byte-identical to the page (RFC 9110 8.8.3)
+    etag = response.get('ETag')
+    if etag and not etag.startswith('W/'):
+        response.headers['ETag'] = 'W/' + etag
+    return response
+
+
+def is_compressible(name):
+    return os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS
+
+
+def compress_file(filename, levels=LEVELS['static']):
+    """
+    Write the compressed siblings of ``filename`` (``<name>.gz``, ...)
+    unless they are newer than it; a sibling that would not save bytes is
+    removed. Returns the encodings written.
+    """
+    mtime = os.path.getmtime(filename)
+    targets = {encoding: filename + suffix for encoding, suffix in ENCODINGS.items()}
+    if brotli is None:
+        del targets['br']
+    if all(os.path.exists(target) and os.path.getmtime(target) >= mtime for target in targets.values()):
+        return []
+    with open(filename, 'rb') as f:
+        bodies = compress(f.read(), levels)
+    for encoding, target in targets.items():
+        if encoding in bodies:
+            temp = '%s.%s.tmp' % (target, os.getpid())
+            with open(temp, 'wb') as f:
+                f.write(bodies[encoding])
+            os.replace(temp, target)
+        elif os.path.exists(target):
+            os.remove(target)
+    return sorted(bodies)
+
+
+def compress_job(filename):
+    """``compress_file()`` for ``Executor.map``; returns errors instead of raising."""
+    try:
+        return filename, compress_file(filename), None
+    except OSError as exc:
+        return filename, [], str(exc)
+
+
+def get_pool(max_workers):
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+    )
+
+
+@checks.register(checks.Tags.compatibility)
+def check_brotli(app_configs, **kwargs):
+    if brotli is not None:
+        return []
+    return [
+        checks.Warning(
+            'The brotli package is not installed: pages and static files are only compressed with gzip.',
+            hint='pip install -r requirements.txt',
+            id='new.W001',
+        )
+    ]
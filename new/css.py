@@ -0,0 +1,155 @@
+"""
+Build-time Tailwind CSS (see the ``build_css`` command).
+
+The Tailwind CLI compiles only the utility classes found in the templates
+and in the rich text editors stored through TinyMCE. The output is saved
+as a content-hashed stylesheet, and for every page template the rules its
+above-the-fold markup (the navbar and the first section of the page) needs
+are extracted as critical CSS, which ``{% tailwind_css %}`` inlines while
+the full stylesheet loads without blocking rendering.
+"""
+import json
+import os
+import re
+
+from django.conf import settings
+
+# TinyMCE fields whose HTML is printed with |safe
+RICH_TEXT_FIELDS = ('small_description', 'content', 'vision', 'mission')
+
+BUILD_MANIFEST = 'tailwind.json'
+
+CLASS_ATTR_RE = re.compile(r'''\bclass\s*=\s*(?:"([^"]*)"|'([^']*)')''', re.IGNORECASE)
+FIRST_SECTION_RE = re.compile(r'<section\b.*?</section>', re.DOTALL | re.IGNORECASE)
+# ``.md\:flex``, ``.w-1\/2``, ``.hover\:bg-gray-100:hover``
+SELECTOR_CLASS_RE = re.compile(r'\.((?:\\.|[\w-])+)')
+
+
+def html_classes(html):
+    """Return every class name used in ``class`` attributes of ``html``."""
+    classes = set()
+    for match in CLASS_ATTR_RE.finditer(html):
+        classes.update((match.group(1) or match.group(2) or '').split())
+    return classes
+
+
+def content_classes():
+    """Classes used in the rich text stored in the database."""
+    from .signals import CONTENT_MODELS
+
+    classes = set()
+    for model in CONTENT_MODELS:
+        fields = [
+            field.attname for field in model._meta.concrete_fields
+            if field.attname in RICH_TEXT_FIELDS
+        ]
+        if not fields:
+            continue
+        for values in model.objects.values_list(*fields).iterator():
+            for value in values:
+                if value:
+                    classes.update(html_classes(value))
+    return classes
+
+
+def above_the_fold(template_source, base_source):
+    """
+    Return the markup seen before scrolling: the navbar of ``base_source``
+    (everything up to ``{% block content %}``) and the first ``<section>``
+    of the page template.
+    """
+    head, _, _ = base_source.partition('{% block content %}')
+    first_section = FIRST_SECTION_RE.search(template_source)
+    return head + (first_section.group(0) if first_section else '')
+
+
+def split_rules(css):
+    """
+    Split a stylesheet into ``(prelude, body)`` pairs of its top level
+    rules; the body of an at-rule is the stylesheet nested in it.
+    """
+    rules = []
+    depth = start = 0
+    prelude = None
+    index = 0
+    while index < len(css):
+        char = css[index]
+        if char == '/' and css.startswith('/*', index):
+            index = css.find('*/', index + 2)
+            if index == -1:
+                break
+            index += 2
+            if depth == 0:
+                start = index
+            continue
+        if char in '"\'':
+            index = css.find(char, index + 1) + 1 or len(css)
+            continue
+        if char == '{':
+            if depth == 0:
+                prelude = css[start:index].strip()
+                start = index + 1
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                rules.append((prelude, css[start:index]))
+                start = index + 1
+        elif char == ';' and depth == 0:
+            # @charset/@import
+            rules.append((css[start:index].strip(), None))
+            start = index + 1
+        index += 1
+    return rules
+
+
+def _selector_needed(selector, classes):
+    return all(
+        name.replace('\\', '') in classes
+        for name in SELECTOR_CLASS_RE.findall(selector)
+    )
+
+
+def critical_css(css, classes):
+    """
+    Keep the rules of ``css`` that apply to markup using ``classes``: the
+    element rules (preflight), at-rules such as ``@keyframes``, and every
+    class rule whose classes all occur in ``classes``.
+    """
+    output = []
+    for prelude, body in split_rules(css):
+        if body is None:
+            output.append(prelude + ';')
+        elif prelude.startswith(('@media', '@supports')):
+            nested = critical_css(body, classes)
+            if nested:
+                output.append('%s{%s}' % (prelude, nested))
+        elif prelude.startswith('@'):
+            output.append('%s{%s}' % (prelude, body))
+        else:
+            selectors = [
+                selector for selector in prelude.split(',')
+                if _selector_needed(selector, classes)
+            ]
+            if selectors:
+                output.append('%s{%s}' % (','.join(selectors), body))
+    return ''.join(output)
+
+
+_build = {}
+
+
+def get_build():
+    """
+    Return the last build (``{'stylesheet': ..., 'critical': {...}}``), or
+    ``None`` before ``build_css`` ran. Reloaded when the manifest changes.
+    """
+    filename = os.path.join(settings.TAILWIND_BUILD_DIR, BUILD_MANIFEST)
+    try:
+        mtime = os.stat(filename).st_mtime
+    except OSError:
+        return None
+    if _build.get('version') != (filename, mtime):
+        with open(filename, encoding='utf-8') as f:
+            _build.update(version=(filename, mtime), manifest=json.load(f))
+    return _build['manifest']
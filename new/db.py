@@ -0,0 +1,82 @@
+"""
+Read routing of the public pages.
+
+In production the SQLite file is opened twice (see ``DATABASES`` in
+``tos/settings.py``): ``default`` for the admin and every write, and
+``REPLICA``, a read-only connection to the same WAL-mode file. Reads made
+while a public page is served (``replica_reads``) go to the replica, so a
+page renders from the last committed state however long an admin save
+holds the write lock. Reads made inside a transaction of ``default`` (say
+rebuilding a snapshot, or a test case), or after the request wrote, stay
+on ``default`` to see its own writes.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+
+# State of the current ``replica_reads`` block: mutated, not set, so the
+# writes of the worker threads an async view calls into are seen too
+_replica_reads = ContextVar('replica_reads', default=None)
+
+
+@contextmanager
+def replica_reads():
+    """
+    Send the ORM reads made inside the block to the replica, when there is
+    one, until the block writes.
+    """
+    token = _replica_reads.set({'written': False})
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def read_from_replica(view_func):
+    """Serve ``view_func`` (sync or async) with ``replica_reads``."""
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_view(request, *args, **kwargs):
+            with replica_reads():
+                return await view_func(request, *args, **kwargs)
+
+        return _wrapped_view
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        with replica_reads():
+            return view_func(request, *args, **kwargs)
+
+    return _wrapped_view
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _replica_reads.get()
+        if (
+            state is not None
+            and not state['written']
+            and REPLICA in settings.DATABASES
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _replica_reads.get()
+        if state is not None:
+            state['written'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
@@ -0,0 +1,120 @@
+"""
+Static export of the public pages (see the ``export_static_site`` command).
+
+Every page is rendered from its snapshot context, so an exported file only
+has to be written again when the snapshot digest (or the templates, or the
+site menu) changed since the last export; the digests are kept in a
+manifest next to the exported files. Each page is written with its
+``.gz``/``.br`` siblings for nginx's ``gzip_static``/``brotli_static``
+(see ``new.compression``).
+
+Rendering runs in worker processes and, like ``new.imaging``, this module
+must not import models: the spawned workers unpickle these functions before
+Django is set up.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from .compression import ENCODINGS, compress_file
+from .css import get_build
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def templates_digest():
+    """
+    Digest of every project template and the CSS build; a change re-renders
+    all pages.
+    """
+    digest = hashlib.sha1()
+    build = get_build()
+    if build is not None:
+        digest.update(build['stylesheet'].encode())
+    for directory in settings.TEMPLATES[0]['DIRS']:
+        for root, dirs, files in sorted(os.walk(directory)):
+            dirs.sort()
+            for name in sorted(files):
+                filename = os.path.join(root, name)
+                digest.update(os.path.relpath(filename, directory).encode())
+                with open(filename, 'rb') as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+
+def output_file(root, path):
+    return os.path.join(root, path.strip('/'), 'index.html')
+
+
+def write_file(filename, content):
+    """Write ``content`` atomically, so nginx never serves half a page."""
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    temp = '%s.%s.tmp' % (filename, os.getpid())
+    with open(temp, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(temp, filename)
+
+
+def read_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(root, manifest):
+    write_file(os.path.join(root, MANIFEST_NAME), json.dumps(manifest, sort_keys=True))
+
+
+def remove_page(root, path):
+    filename = output_file(root, path)
+    for name in (filename, *(filename + suffix for suffix in ENCODINGS.values())):
+        if os.path.exists(name):
+            os.remove(name)
+    try:
+        os.removedirs(os.path.dirname(filename))
+    except OSError:
+        # Not empty (nested pages) or the export root itself
+        pass
+
+
+def setup_worker(base_url):
+    import django
+
+    django.setup()
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, urlsplit(base_url).hostname]
+
+
+def render_page(root, base_url, job):
+    """
+    Render one page (``(path, template_name, context)``) into ``root`` as
+    if it was requested from ``base_url``. Returns ``(path, error)``.
+    """
+    from django.test import RequestFactory
+
+    path, template_name, context = job
+    url = urlsplit(base_url)
+    request = RequestFactory().get(path, HTTP_HOST=url.netloc, secure=url.scheme == 'https')
+    try:
+        filename = output_file(root, path)
+        write_file(filename, render_to_string(template_name, context, request=request))
+        compress_file(filename)
+    except Exception as exc:
+        return path, str(exc)
+    return path, None
+
+
+def get_pool(max_workers, base_url):
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=setup_worker,
+        initargs=(base_url,),
+    )
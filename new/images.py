@@ -0,0 +1,152 @@
+"""
+Responsive image renditions.
+
+Editors upload the desktop image (``image_d``) as the master; ``image_m`` and
+``image_t`` are optional art-directed crops. After an upload, every source
+image is resized to the widths of the roles it serves and encoded to WebP
+plus AVIF (JPEG when Pillow has no AVIF support). Encoding runs in a process
+pool off the request path; the results are stored as ``ImageRendition``
+rows, which the snapshots attach to each image so ``{% picture %}`` can emit
+``srcset``/``sizes``.
+"""
+import logging
+from collections import defaultdict
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+
+from .imaging import encode_all, get_pool, original_width, rendition_formats
+from .models import ImageRendition
+
+logger = logging.getLogger(__name__)
+
+IMAGE_ROLES = ('image_m', 'image_t', 'image_d')
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = get_pool(settings.IMAGE_RENDITION_WORKERS)
+    return _executor
+
+
+def record_renditions(results, replace=False):
+    """
+    Store the encoded ``results`` over the renditions of the same source,
+    width and format; with ``replace``, over every rendition of their
+    sources.
+    """
+    encoded = {(result['source'], result['width'], result['format']) for result in results}
+    previous = {
+        pk: name
+        for pk, source, width, image_format, name in ImageRendition.objects.filter(
+            source__in={result['source'] for result in results}
+        ).values_list('pk', 'source', 'width', 'format', 'file')
+        if replace or (source, width, image_format) in encoded
+    }
+    # Re-encoded renditions get new names: the old files are removed
+    stale = set(previous.values()) - {result['file'] for result in results}
+    ImageRendition.objects.filter(pk__in=previous).delete()
+    ImageRendition.objects.bulk_create(ImageRendition(**result) for result in results)
+    for name in stale:
+        default_storage.delete(name)
+
+
+def source_widths(instance):
+    """
+    Map every image file of ``instance`` to the rendition widths it needs.
+
+    An empty ``image_m``/``image_t`` falls back to the master image, which
+    then also needs the widths of that role.
+    """
+    master = getattr(instance, 'image_d', None)
+    widths = {}
+    for role in IMAGE_ROLES:
+        image = getattr(instance, role, None)
+        if not image:
+            image = master
+        if image:
+            widths.setdefault(image.name, set()).update(settings.IMAGE_RENDITION_WIDTHS[role])
+    return widths
+
+
+def _store_renditions(model_label, pk, results):
+    from .signals import invalidate_content
+    from .cache import content_tags
+
+    record_renditions(results)
+    instance = apps.get_model(model_label)._default_manager.filter(pk=pk).first()
+    if instance is not None:
+        invalidate_content(content_tags(instance))
+
+
+def _renditions_done(model_label, pk, future):
+    close_old_connections()
+    try:
+        _store_renditions(model_label, pk, [result for results in future.result() for result in results])
+    except Exception:
+        logger.exception('Could not build image renditions for %s %s', model_label, pk)
+    finally:
+        close_old_connections()
+
+
+def stored_renditions(sources=None):
+    """Map every source (of ``sources``) to the ``(width, format)`` of its renditions."""
+    renditions = ImageRendition.objects.all()
+    if sources is not None:
+        renditions = renditions.filter(source__in=sources)
+    stored = defaultdict(set)
+    for source, width, image_format in renditions.values_list('source', 'width', 'format'):
+        stored[source].add((width, image_format))
+    return stored
+
+
+def missing_widths(source, needed, formats, stored):
+    """The widths of ``needed`` that ``source`` lacks a rendition of in one of ``formats``."""
+    missing = {width for width in needed if any((width, image_format) not in stored for image_format in formats)}
+    if missing and stored:
+        # Widths above the original were encoded at the original width
+        largest = max(width for width, _ in stored)
+        wider = {width for width in missing if width > largest}
+        if wider and all((largest, image_format) in stored for image_format in formats):
+            if original_width(source) == largest:
+                missing -= wider
+    return missing
+
+
+def rendition_jobs(widths, formats, stored):
+    """``(source, widths, formats)`` of the renditions of ``widths`` (source: widths) not ``stored``."""
+    jobs = []
+    for source, needed in widths.items():
+        missing = missing_widths(source, needed, formats, stored.get(source, set()))
+        if missing:
+            jobs.append((source, sorted(missing), formats))
+    return jobs
+
+
+def missing_rendition_jobs(instance, formats=None):
+    """Return ``(source, widths, formats)`` for the renditions ``instance``'s images lack."""
+    widths = source_widths(instance)
+    if not widths:
+        return []
+    return rendition_jobs(widths, formats or rendition_formats(), stored_renditions(widths))
+
+
+def schedule_renditions(instance):
+    """Queue the renditions of ``instance``'s images that don't exist yet."""
+    jobs = missing_rendition_jobs(instance)
+    if not jobs:
+        return
+    if not settings.IMAGE_RENDITIONS_ASYNC:
+        _store_renditions(
+            instance._meta.label, instance.pk,
+            [result for results in encode_all(jobs) for result in results],
+        )
+        return
+    future = get_executor().submit(encode_all, jobs)
+    future.add_done_callback(partial(_renditions_done, instance._meta.label, instance.pk))
@@ -0,0 +1,162 @@
+"""
+Image encoding for the rendition pipeline (see ``new.images``).
+
+Everything here runs in worker processes and must not import models: the
+spawned workers unpickle these functions before Django is set up.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+MIME_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+# EXIF orientations that exif_transpose() turns by 90 degrees
+EXIF_ORIENTATION = 0x0112
+ROTATED = {5, 6, 7, 8}
+
+def rendition_formats():
+    from PIL import features
+
+    return ['avif' if features.check('avif') else 'jpeg', 'webp']
+
+
+def _rendition_name(source, width, image_format, data):
+    # The hash of the bytes makes the name immutable (see new/media.py)
+    stem, _ = os.path.splitext(source)
+    extension = 'jpg' if image_format == 'jpeg' else image_format
+    return 'renditions/%s-%sw.%s.%s' % (stem, width, hashlib.md5(data).hexdigest()[:12], extension)
+
+
+def original_width(source):
+    """Width of the image ``source`` as encoded, EXIF orientation applied; None if unreadable."""
+    from PIL import Image
+
+    # Only the header is read
+    try:
+        with default_storage.open(source) as fh:
+            image = Image.open(fh)
+            width, height = image.size
+            if image.getexif().get(EXIF_ORIENTATION) in ROTATED:
+                return height
+            return width
+    except OSError:
+        return None
+
+
+def encode_renditions(source, widths, formats):
+    """
+    Resize ``source`` (a storage name) to ``widths`` and encode it to
+    ``formats``. Never upscales: widths above the original collapse to the
+    original width. Runs in a worker process.
+    """
+    from PIL import Image, ImageOps
+
+    with default_storage.open(source) as fh:
+        original = ImageOps.exif_transpose(Image.open(fh))
+        original.load()
+
+    results = []
+    for width in sorted({min(width, original.width) for width in widths}):
+        height = round(original.height * width / original.width)
+        image = original.resize((width, height), Image.LANCZOS)
+        for image_format in formats:
+            converted = image
+            if image_format == 'jpeg' and image.mode != 'RGB':
+                converted = image.convert('RGB')
+            elif image.mode not in ('RGB', 'RGBA'):
+                converted = image.convert('RGBA')
+            buffer = io.BytesIO()
+            converted.save(buffer, format=image_format.upper(), **settings.IMAGE_RENDITION_OPTIONS[image_format])
+            data = buffer.getvalue()
+            name = _rendition_name(source, width, image_format, data)
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(data))
+            results.append({
+                'source': source,
+                'format': image_format,
+                'width': width,
+                'height': height,
+                'file': name,
+            })
+    return results
+
+
+def placeholder_image(job):
+    """
+    Draw a labelled placeholder image of ``size`` and store it as ``name``
+    (used by ``create_test_data``). Returns the stored name.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    name, size, color, label = job
+    width, height = size
+    image = Image.new('RGB', size, color)
+    draw = ImageDraw.Draw(image)
+    # A few shapes so the encoders see something closer to a photo
+    for step in range(1, 6):
+        inset = step * min(width, height) // 14
+        draw.ellipse((inset, inset, width - inset, height - inset), outline=(255, 255, 255), width=2)
+    font = ImageFont.load_default(size=max(16, height // 10))
+    draw.text((width // 2, height // 2), label, fill=(255, 255, 255), font=font, anchor='mm')
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def video_poster(name, size=(1280, 720)):
+    """
+    Draw the poster of a video facade that has no uploaded poster and store
+    it as ``name``. Returns the stored name.
+    """
+    from PIL import Image, ImageDraw
+
+    if default_storage.exists(name):
+        return name
+    width, height = size
+    top, bottom = (15, 118, 110), (15, 23, 42)
+    image = Image.new('RGB', size)
+    draw = ImageDraw.Draw(image)
+    for y in range(height):
+        ratio = y / (height - 1)
+        draw.line((0, y, width, y), fill=tuple(round(a + (b - a) * ratio) for a, b in zip(top, bottom)))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=80, optimize=True, progressive=True)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def setup_worker():
+    import django
+
+    django.setup()
+
+
+def encode_all(jobs):
+    return [encode_renditions(source, widths, formats) for source, widths, formats in jobs]
+
+
+def encode_job(job):
+    """``encode_renditions()`` for ``Executor.map``; returns errors instead of raising."""
+    source, widths, formats = job
+    try:
+        return source, encode_renditions(source, widths, formats), None
+    except Exception as exc:
+        return source, [], str(exc)
+
+
+def get_pool(max_workers):
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=setup_worker,
+    )
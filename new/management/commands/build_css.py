@@ -0,0 +1,116 @@
+import glob
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from new.cache import SITE_TAGS, bump_tags
+from new.css import (
+    BUILD_MANIFEST, above_the_fold, content_classes, critical_css, html_classes
+)
+from new.snapshots import PAGE_TEMPLATES
+
+TAILWIND_CONFIG = '''module.exports = {
+  content: %s,
+  theme: {extend: {}},
+  plugins: [],
+}
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Compile the Tailwind CSS used by the templates and the stored rich '
+        'text into a hashed stylesheet plus critical CSS per page template. '
+        'Needs the Tailwind CSS v3 CLI (TAILWIND_CLI).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-collectstatic', action='store_false', dest='collectstatic',
+            help='Do not run collectstatic before publishing the build (with '
+                 'DEBUG, which links the original files)',
+        )
+
+    def handle(self, *args, **options):
+        template_dir = str(settings.TEMPLATES[0]['DIRS'][0])
+        build_dir = str(settings.TAILWIND_BUILD_DIR)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # Rich text classes, as markup the CLI scans like the templates
+            classes = sorted(content_classes())
+            content_file = os.path.join(tmp, 'content.html')
+            with open(content_file, 'w', encoding='utf-8') as f:
+                f.write('<div class="%s"></div>\n' % ' '.join(classes))
+
+            config_file = os.path.join(tmp, 'tailwind.config.js')
+            with open(config_file, 'w', encoding='utf-8') as f:
+                f.write(TAILWIND_CONFIG % json.dumps([
+                    os.path.join(template_dir, '**', '*.html'),
+                    content_file,
+                ]))
+
+            output_file = os.path.join(tmp, 'tailwind.css')
+            command = shlex.split(settings.TAILWIND_CLI) + [
+                '--config', config_file,
+                '--input', str(settings.TAILWIND_INPUT),
+                '--output', output_file,
+                '--minify',
+            ]
+            try:
+                subprocess.run(command, check=True, capture_output=True, text=True)
+            except FileNotFoundError:
+                raise CommandError(
+                    'Tailwind CLI %r not found; install the standalone CLI or '
+                    'set TAILWIND_CLI' % settings.TAILWIND_CLI
+                )
+            except subprocess.CalledProcessError as exc:
+                raise CommandError('Tailwind CLI failed:\n%s' % exc.stderr)
+            with open(output_file, encoding='utf-8') as f:
+                css = f.read()
+
+        digest = hashlib.sha256(css.encode()).hexdigest()[:12]
+        stylesheet = 'css/tailwind.%s.css' % digest
+        os.makedirs(build_dir, exist_ok=True)
+        with open(os.path.join(build_dir, os.path.basename(stylesheet)), 'w', encoding='utf-8') as f:
+            f.write(css)
+
+        with open(os.path.join(template_dir, 'base.html'), encoding='utf-8') as f:
+            base_source = f.read()
+        critical = {}
+        for template_name in sorted(set(PAGE_TEMPLATES.values())):
+            with open(os.path.join(template_dir, template_name), encoding='utf-8') as f:
+                markup = above_the_fold(f.read(), base_source)
+            # The hero may show rich text (small_description) of any page
+            critical[template_name] = critical_css(css, html_classes(markup) | set(classes))
+
+        # Outside DEBUG {% static %} only links what the manifest has: the
+        # pages may link the new stylesheet once it is collected
+        if options['collectstatic']:
+            call_command('collectstatic', interactive=False, verbosity=0)
+
+        manifest_file = os.path.join(build_dir, BUILD_MANIFEST)
+        with open(manifest_file + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'stylesheet': stylesheet, 'critical': critical}, f)
+        os.replace(manifest_file + '.tmp', manifest_file)
+
+        # Stylesheets of earlier builds
+        for filename in glob.glob(os.path.join(build_dir, 'tailwind.*.css')):
+            if os.path.basename(filename) != os.path.basename(stylesheet):
+                os.remove(filename)
+
+        # Cached pages still link the previous stylesheet
+        bump_tags(SITE_TAGS)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Built %s (%s bytes, %s rich text classes); critical CSS: %s' % (
+                stylesheet, len(css), len(classes),
+                ', '.join('%s %s bytes' % (name, len(block)) for name, block in critical.items()),
+            )
+        ))
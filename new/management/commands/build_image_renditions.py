@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from new.cache import SITE_TAGS
+from new.images import record_renditions, rendition_jobs, source_widths, stored_renditions
+from new.imaging import encode_job, get_pool, rendition_formats
+from new.signals import CONTENT_MODELS, invalidate_content
+
+
+class Command(BaseCommand):
+    help = 'Generate the responsive renditions of every uploaded image'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Re-encode every rendition, replacing the ones no longer needed',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.IMAGE_RENDITION_WORKERS,
+            help='Number of encoder processes (default: IMAGE_RENDITION_WORKERS)',
+        )
+
+    def handle(self, *args, **options):
+        widths = {}
+        for model in CONTENT_MODELS:
+            if not hasattr(model, 'image_d'):
+                continue
+            for instance in model.objects.only('image_m', 'image_t', 'image_d').iterator():
+                for source, needed in source_widths(instance).items():
+                    widths.setdefault(source, set()).update(needed)
+
+        formats = rendition_formats()
+        if options['force']:
+            jobs = [(source, sorted(needed), formats) for source, needed in widths.items()]
+        else:
+            jobs = rendition_jobs(widths, formats, stored_renditions())
+        self.stdout.write('Encoding %s images to %s...' % (len(jobs), ', '.join(formats)))
+
+        encoded = 0
+        with get_pool(options['workers']) as pool:
+            for source, results, error in pool.map(encode_job, jobs, chunksize=4):
+                if error:
+                    self.stderr.write('Skipped %s: %s' % (source, error))
+                    continue
+                record_renditions(results, replace=options['force'])
+                encoded += 1
+
+        if encoded:
+            invalidate_content(SITE_TAGS)
+        self.stdout.write(self.style.SUCCESS('Built renditions for %s images' % encoded))
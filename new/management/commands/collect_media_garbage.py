@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from new.uploads import collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Remove the uploaded images, and their renditions, that no content model references'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=float, default=24,
+            help='Keep unreferenced files modified within this many hours (default: 24)',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.MEDIA_GC_WORKERS,
+            help='Number of threads scanning and removing files (default: MEDIA_GC_WORKERS)',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would be removed without removing anything',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        stats = collect_garbage(options['grace'] * 3600, options['workers'], options['dry_run'])
+        self.stdout.write('Scanned %s files in %.1fs; %s unreferenced files are within the grace period' % (
+            stats['scanned'], time.perf_counter() - started, stats['kept'],
+        ))
+        self.stdout.write(self.style.SUCCESS('%s %s files (%.1f MB)' % (
+            'Would remove' if options['dry_run'] else 'Removed', stats['removed'], stats['bytes'] / 1e6,
+        )))
@@ -1,9 +1,53 @@
-from django.core.management.base import BaseCommand
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from new.cache import SITE_TAGS
+from new.catalog import generate_catalog, placeholder_images
 from new.models import Home, About, ServiceCategory, ServiceCategoryContent
+from new.signals import invalidate_content
+from new.structured_data import refresh_descendants
 
 
 class Command(BaseCommand):
-    help = 'Create test data to verify TinyMCE setup'
+    help = (
+        'Create test data to verify TinyMCE setup. With --categories, also '
+        'generate a catalog of that size for load testing.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--categories', type=int, default=0,
+            help='Number of generated service categories (default: 0)',
+        )
+        parser.add_argument(
+            '--services-per-category', type=int, default=40,
+            help='Services generated per category (default: 40)',
+        )
+        parser.add_argument(
+            '--variants-per-service', type=int, default=10,
+            help='Variants generated per service (default: 10)',
+        )
+        parser.add_argument(
+            '--blocks-per-page', type=int, default=1,
+            help='Content blocks generated per category, service and variant (default: 1)',
+        )
+        parser.add_argument(
+            '--images', type=int, default=12,
+            help='Placeholder images drawn per image field, shared by the pages (default: 12; 0 for none)',
+        )
+        parser.add_argument(
+            '--prefix', default='load',
+            help='Slug prefix of the generated pages (default: load)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows inserted per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.IMAGE_RENDITION_WORKERS,
+            help='Processes drawing the placeholder images (default: IMAGE_RENDITION_WORKERS)',
+        )
 
     def handle(self, *args, **options):
         # Create test Home instance
@@ -25,6 +69,7 @@ class Command(BaseCommand):
                 'og_image': 'https://example.com/image.jpg',
                 'og_description': 'Test OG description',
                 'og_site_name': 'The One Solution',
+                'slug': 'test-home-page',
             }
         )
         
@@ -64,6 +109,7 @@ class Command(BaseCommand):
         service_category, created = ServiceCategory.objects.get_or_create(
             slug="test-service-category",
             defaults={
+                'home': home,
                 'heading': 'Digital Marketing Services',
                 'small_description': '<p>Comprehensive <strong>digital marketing solutions</strong> for your business.</p>',
                 'content': '<h2>Our Services</h2><p>We offer a wide range of digital marketing services...</p>',
@@ -98,9 +144,50 @@ class Command(BaseCommand):
         else:
             self.stdout.write(self.style.WARNING('ServiceCategory instance already exists'))
 
+        if options['categories']:
+            self.generate_catalog(home, options)
+
         self.stdout.write(
             self.style.SUCCESS(
                 'Test data created successfully! '
                 'You can now test TinyMCE in the Django admin at /admin/'
             )
         )
+
+    def generate_catalog(self, home, options):
+        prefix = options['prefix']
+        if ServiceCategory.objects.filter(slug__startswith='%s-category-' % prefix).exists():
+            raise CommandError(
+                'A catalog with the prefix %r already exists; pass another --prefix' % prefix
+            )
+
+        started = time.perf_counter()
+        images = {}
+        if options['images']:
+            images = placeholder_images(options['images'], options['workers'])
+            self.stdout.write('Drew %s placeholder images in %.1fs' % (
+                sum(len(names) for names in images.values()), time.perf_counter() - started,
+            ))
+
+        counts = generate_catalog(
+            home,
+            categories=options['categories'],
+            services_per_category=options['services_per_category'],
+            variants_per_service=options['variants_per_service'],
+            blocks_per_page=options['blocks_per_page'],
+            images=images,
+            prefix=prefix,
+            batch_size=options['batch_size'],
+        )
+        # bulk_create sends no signals
+        refresh_descendants(home)
+        invalidate_content(SITE_TAGS)
+
+        for model, count in counts.items():
+            self.stdout.write('Created %s %s rows' % (count, model._meta.object_name))
+        self.stdout.write(self.style.SUCCESS(
+            'Generated %s rows in %.1fs. Run rebuild_related_items, '
+            'rebuild_search_index, rebuild_snapshots and build_image_renditions '
+            'to prepare the pages.'
+            % (sum(counts.values()), time.perf_counter() - started)
+        ))
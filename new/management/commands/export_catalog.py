@@ -0,0 +1,69 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from new.transfer import (
+    MODELS, MediaCopier, export_file, export_records, media_names, write_csv, write_jsonl
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Export the catalog (home page, categories, services, variants and '
+        'their content blocks) to a JSONL or CSV file, see new/transfer.py'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to write')
+        parser.add_argument(
+            '--format', choices=['jsonl', 'csv'],
+            help='Dump format (default: from the file extension, else jsonl)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows read per query (default: 1000)',
+        )
+        parser.add_argument(
+            '--media-to',
+            help='Also copy the referenced media files into this directory',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Parallel media copies (default: 8)',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        dump_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        media = MediaCopier(export_file, options['media_to'], options['workers']) if options['media_to'] else None
+        counts = Counter()
+
+        def tracked(records):
+            for name, parent, fields in records:
+                counts[name] += 1
+                if media is not None:
+                    media.add(media_names(MODELS[name][0], fields))
+                yield name, parent, fields
+
+        started = time.perf_counter()
+        write = write_csv if dump_format == 'csv' else write_jsonl
+        try:
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                write(f, tracked(export_records(options['batch_size'])))
+        finally:
+            copied = media.finish() if media is not None else {}
+        elapsed = time.perf_counter() - started
+
+        for name in MODELS:
+            self.stdout.write('Exported %s %s rows' % (counts[name], name))
+        for outcome, names in sorted(copied.items()):
+            self.stdout.write('Media %s: %s files' % (outcome, len(names)))
+        if 'missing' in copied:
+            self.stderr.write('Missing media: %s' % ', '.join(sorted(copied['missing'])[:20]))
+        total = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            'Exported %s rows to %s in %.1fs (%.0f rows/s)' % (total, path, elapsed, total / elapsed if elapsed else 0)
+        ))
+        if any(outcome.startswith('failed') for outcome in copied):
+            raise CommandError('Some media files could not be copied')
@@ -0,0 +1,125 @@
+import os
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from new.export import (
+    get_pool, output_file, read_manifest, remove_page,
+    render_page, templates_digest, write_manifest
+)
+from new.models import PageSnapshot
+from new.navigation import get_navigation
+from new.snapshots import PAGE_TEMPLATES, published_pages, store_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Prerender every public page to static HTML (<path>/index.html) for '
+        'nginx. Only pages whose content changed since the last export are '
+        'rendered again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default=str(settings.STATIC_EXPORT_ROOT),
+            help='Export directory (default: STATIC_EXPORT_ROOT)',
+        )
+        parser.add_argument(
+            '--base-url', default=settings.STATIC_EXPORT_BASE_URL,
+            help='Scheme and host the pages are served from (default: STATIC_EXPORT_BASE_URL)',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.STATIC_EXPORT_WORKERS,
+            help='Number of render processes (default: STATIC_EXPORT_WORKERS)',
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Render every page, even when unchanged',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of pages handed to the workers at once (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        root = options['output']
+        base_url = options['base_url'].rstrip('/')
+        batch_size = options['batch_size']
+
+        # Bring the snapshots up to date; they are what the pages render from
+        published = set(published_pages())
+        fresh = set(PageSnapshot.objects.filter(stale=False).values_list('kind', 'slug'))
+        pending = iter(sorted(published - fresh))
+        while True:
+            batch = list(islice(pending, batch_size))
+            if not batch:
+                break
+            store_snapshots(batch)
+
+        manifest = read_manifest(root)
+        templates = templates_digest()
+        # Every page shows the site menu
+        navigation = get_navigation().digest
+        if (
+            options['full']
+            or manifest.get('templates') != templates
+            or manifest.get('navigation') != navigation
+            or manifest.get('base_url') != base_url
+        ):
+            previous = {}
+        else:
+            previous = manifest.get('pages', {})
+
+        pages = {}
+        seen = set()
+        failed = unchanged = 0
+
+        def changed_pages():
+            nonlocal unchanged
+            snapshots = PageSnapshot.objects.only(
+                'kind', 'slug', 'path', 'context', 'digest'
+            ).order_by('pk')
+            for snapshot in snapshots.iterator(chunk_size=batch_size):
+                if (snapshot.kind, snapshot.slug) not in published:
+                    continue
+                seen.add(snapshot.path)
+                digest = snapshot.digest
+                if previous.get(snapshot.path) == digest and os.path.exists(output_file(root, snapshot.path)):
+                    pages[snapshot.path] = digest
+                    unchanged += 1
+                    continue
+                yield snapshot.path, digest, (snapshot.path, PAGE_TEMPLATES[snapshot.kind], snapshot.context)
+
+        rendered = 0
+        with get_pool(options['workers'], base_url) as pool:
+            render = partial(render_page, root, base_url)
+            changed = changed_pages()
+            while True:
+                batch = list(islice(changed, batch_size))
+                if not batch:
+                    break
+                digests = {path: digest for path, digest, job in batch}
+                for path, error in pool.map(render, [job for path, digest, job in batch], chunksize=16):
+                    if error:
+                        # Left out of the manifest so the next run retries it
+                        self.stderr.write('Failed to render %s: %s' % (path, error))
+                        failed += 1
+                        continue
+                    pages[path] = digests[path]
+                    rendered += 1
+                self.stdout.write('Rendered %s pages...' % rendered)
+
+        # Pages deleted or renamed since the last export
+        removed = [path for path in manifest.get('pages', {}) if path not in seen]
+        for path in removed:
+            remove_page(root, path)
+
+        write_manifest(root, {
+            'templates': templates, 'navigation': navigation, 'base_url': base_url, 'pages': pages,
+        })
+        self.stdout.write(self.style.SUCCESS(
+            'Exported to %s: %s rendered, %s unchanged, %s removed, %s failed'
+            % (root, rendered, unchanged, len(removed), failed)
+        ))
@@ -0,0 +1,74 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from new.transfer import CatalogImporter, MediaCopier, get_pool, import_file, read_csv, read_jsonl
+
+
+class Command(BaseCommand):
+    help = (
+        'Import a catalog dump written by export_catalog: pages are upserted '
+        'by slug and their content blocks replaced, see new/transfer.py'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSONL or CSV dump to read')
+        parser.add_argument(
+            '--format', choices=['jsonl', 'csv'],
+            help='Dump format (default: from the file extension, else jsonl)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Rows written per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--media-from',
+            help='Copy the referenced media files from this directory (say, the '
+                 'MEDIA_ROOT of the source or the --media-to of the export)',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Parallel rich text renderers and media copies (default: 8)',
+        )
+        parser.add_argument(
+            '--skip-renditions', action='store_true',
+            help='Do not encode the responsive renditions of the imported images',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        dump_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        read = read_csv if dump_format == 'csv' else read_jsonl
+        media = MediaCopier(import_file, options['media_from'], options['workers']) if options['media_from'] else None
+        importer = CatalogImporter(options['batch_size'], media)
+
+        started = time.perf_counter()
+        error = None
+        try:
+            with open(path, encoding='utf-8', newline='') as f, get_pool(options['workers']) as importer.pool:
+                importer.load(read(f))
+        except ValueError as exc:
+            error = exc
+        finally:
+            copied = media.finish() if media is not None else {}
+        elapsed = time.perf_counter() - started
+
+        for name, (rows, created) in importer.counts.items():
+            self.stdout.write('Imported %s %s rows (%s new)' % (rows, name, created))
+        for outcome, names in sorted(copied.items()):
+            self.stdout.write('Media %s: %s files' % (outcome, len(names)))
+        if 'missing' in copied:
+            self.stderr.write('Missing media: %s' % ', '.join(sorted(copied['missing'])[:20]))
+        total = sum(rows for rows, created in importer.counts.values())
+        self.stdout.write('Wrote %s rows in %.1fs (%.0f rows/s)' % (total, elapsed, total / elapsed if elapsed else 0))
+
+        if total:
+            started = time.perf_counter()
+            importer.finish()
+            self.stdout.write('Rebuilt the search and related items indexes in %.1fs' % (time.perf_counter() - started))
+        if error is not None:
+            raise CommandError('%s: %s (the batches before it were imported)' % (path, error))
+        if total and not options['skip_renditions']:
+            call_command('build_image_renditions', stdout=self.stdout, stderr=self.stderr)
+        self.stdout.write(self.style.SUCCESS('Imported %s rows from %s' % (total, path)))
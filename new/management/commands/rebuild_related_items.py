@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from new.cache import PAGE_KIND_TAGS
+from new.related import INDEXES, rebuild_related
+from new.signals import invalidate_content
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the relatedness index behind the "related" and "other" blocks of service and variant pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind', choices=sorted(INDEXES), action='append',
+            help='Only rebuild the index of this kind of page (repeatable; default: all)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows read and written per query (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        kinds = options['kind'] or sorted(INDEXES)
+        for kind in kinds:
+            started = time.perf_counter()
+            count = rebuild_related(kind, options['batch_size'])
+            self.stdout.write('Indexed %s %s pages in %.1fs' % (count, kind, time.perf_counter() - started))
+
+        # Every page of those kinds shows the new lists
+        invalidate_content({PAGE_KIND_TAGS[kind] for kind in kinds})
+        self.stdout.write(self.style.SUCCESS('Rebuilt the relatedness index'))
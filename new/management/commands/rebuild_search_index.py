@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from new.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of the category, service and variant pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Pages read and written per query (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = rebuild_index(options['batch_size'])
+        for kind, count in counts.items():
+            self.stdout.write('Indexed %s %s pages' % (count, kind))
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt the search index of %s pages in %.1fs' % (sum(counts.values()), time.perf_counter() - started)
+        ))
@@ -0,0 +1,47 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from new.models import PageSnapshot
+from new.snapshots import published_pages, store_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the render snapshots of the public pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stale', action='store_true',
+            help='Only rebuild snapshots that were invalidated by a content change',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of pages written per transaction (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        if options['stale']:
+            pages = iter(list(PageSnapshot.objects.filter(stale=True).values_list('kind', 'slug')))
+        else:
+            pages = published_pages()
+
+        total = 0
+        while True:
+            batch = list(islice(pages, options['batch_size']))
+            if not batch:
+                break
+            total += store_snapshots(batch)
+            self.stdout.write('Built %s snapshots...' % total)
+
+        if not options['stale']:
+            # Pages whose object was deleted or renamed since the last build
+            published = set(published_pages())
+            orphans = [
+                pk for pk, kind, slug in PageSnapshot.objects.values_list('pk', 'kind', 'slug').iterator()
+                if (kind, slug) not in published
+            ]
+            PageSnapshot.objects.filter(pk__in=orphans).delete()
+            if orphans:
+                self.stdout.write('Removed %s orphaned snapshots' % len(orphans))
+
+        self.stdout.write(self.style.SUCCESS('Rebuilt %s snapshots' % total))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from new.cache import SITE_TAGS
+from new.richtext import render_rich_text, rich_text_fields
+from new.signals import CONTENT_MODELS, invalidate_content
+
+
+class Command(BaseCommand):
+    help = (
+        'Process the rich text of every page and content block again into '
+        'its rendered column (after changing the rules in new/richtext.py)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Rows written per query (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        for model in CONTENT_MODELS:
+            fields = rich_text_fields(model)
+            if not fields:
+                continue
+            rows = []
+            for row in model.objects.only(*fields, 'rendered').iterator(chunk_size=options['batch_size']):
+                rendered = {field: render_rich_text(getattr(row, field)) for field in fields}
+                if rendered != row.rendered:
+                    row.rendered = rendered
+                    rows.append(row)
+            # bulk_update sends no signals and keeps updated_at
+            model.objects.bulk_update(rows, ['rendered'], batch_size=options['batch_size'])
+            self.stdout.write('Updated %s %s rows' % (len(rows), model._meta.object_name))
+
+        invalidate_content(SITE_TAGS)
+        self.stdout.write(self.style.SUCCESS('Rendered the rich text in %.1fs' % (time.perf_counter() - started)))
@@ -0,0 +1,161 @@
+"""
+Delivery of the uploaded media files (``MEDIA_URL``).
+
+The ``media`` view (see new/views.py) only checks the name: with
+``MEDIA_ACCEL`` set, the response is headers only and the front server
+sends the file itself, from its own file descriptor, with its own range
+and conditional request handling. The Django worker is free as soon as
+the headers are out:
+
+* ``'nginx'``: ``X-Accel-Redirect: <MEDIA_ACCEL_PREFIX><name>``, to an
+  internal location aliased to ``MEDIA_ROOT``::
+
+      location /protected-media/ {
+          internal;
+          alias /srv/tos/media/;
+      }
+
+* ``'sendfile'``: ``X-Sendfile: <absolute path>`` (Apache mod_xsendfile,
+  lighttpd).
+
+Without a front server (``MEDIA_ACCEL = None``, development) the file is
+streamed by ``FileResponse``, with ``ETag``/``Last-Modified`` and 304s, and
+single byte ranges (206, or 416 past the end) for the video players and
+download resumes. Multiple ranges get the whole file, as RFC 9110 allows.
+
+Uploads and renditions are named by a hash of their bytes (see
+new/storage.py and new/imaging.py): they are never rewritten, so they are
+cached for a year with ``immutable``. Files under other names (uploaded
+before, generated posters) may be replaced and are cached for an hour.
+"""
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+# <name>.<12 hex digits>.<extension> (renditions) or .../<sha256>.<extension>
+# (uploads, see new/storage.py)
+HASHED_NAME_RE = re.compile(r'(\.[0-9a-f]{12}|/[0-9a-f]{64})\.[A-Za-z0-9]+$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=3600'
+
+
+def is_hashed(name):
+    return bool(HASHED_NAME_RE.search(name))
+
+
+def cache_control(name):
+    return IMMUTABLE if is_hashed(name) else REVALIDATE
+
+
+def media_path(name):
+    """Absolute path of the media file ``name``; names outside ``MEDIA_ROOT`` are a 400."""
+    return safe_join(settings.MEDIA_ROOT, name)
+
+
+def accel_response(name, filename):
+    """Headers-only response that makes the front server send ``filename``."""
+    response = HttpResponse(content_type=mimetypes.guess_type(name)[0] or 'application/octet-stream')
+    if settings.MEDIA_ACCEL == 'nginx':
+        response.headers['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + name
+    else:
+        response.headers['X-Sendfile'] = filename
+    response.headers['Cache-Control'] = cache_control(name)
+    return response
+
+
+def byte_range(header, size):
+    """
+    ``(start, end)`` (inclusive) of the single range of a ``Range`` header
+    in a file of ``size`` bytes, or None to send the whole file. Raises
+    ValueError when the range starts past the end.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', '') or size == 0:
+        # An empty file has no byte to range over: sent whole (and empty)
+        return None
+    first, last = match.groups()
+    if not first:
+        # The last N bytes
+        if int(last) == 0:
+            raise ValueError('Empty suffix range')
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start > end:
+        if last and start > int(last):
+            # Invalid, not unsatisfiable: ignored
+            return None
+        raise ValueError('Range starts past the end')
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+class RangeFile:
+    """Reads ``length`` bytes of the open file ``f`` from ``start``."""
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+
+def file_response(request, name, filename):
+    """Stream ``filename`` from this process, honouring conditional and range requests."""
+    try:
+        st = os.stat(filename)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404('No media file %s' % name)
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404('No media file %s' % name)
+
+    size, last_modified = st.st_size, int(st.st_mtime)
+    etag = '"%x-%x"' % (st.st_mtime_ns, size)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        requested = request.headers.get('Range') if request.method in ('GET', 'HEAD') else None
+        try:
+            span = byte_range(requested, size) if requested and _if_range_matches(request, etag, last_modified) else None
+        except ValueError:
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = 'bytes */%s' % size
+            return response
+        f = open(filename, 'rb')
+        if span is None:
+            response = FileResponse(f, content_type=content_type)
+        else:
+            start, end = span
+            response = FileResponse(RangeFile(f, start, end - start + 1), content_type=content_type, status=206)
+            response.headers['Content-Range'] = 'bytes %s-%s/%s' % (start, end, size)
+            response.headers['Content-Length'] = str(end - start + 1)
+        response.headers['Last-Modified'] = http_date(last_modified)
+    response.headers['ETag'] = etag
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Cache-Control'] = cache_control(name)
+    return response
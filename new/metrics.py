@@ -0,0 +1,233 @@
+"""
+Request instrumentation.
+
+``RequestMetricsMiddleware`` measures every request and, for the view it
+resolved to (its URL name: ``home``, ``service_detail``, ``admin:index``
+...), records
+
+* the wall time until the response is returned,
+* the number and total time of the database queries, on every connection,
+* the time spent rendering templates (see ``DjangoTemplates``).
+
+They are aggregated into in-process histograms that the ``metrics`` view serves in the Prometheus
+text format. Each worker process keeps its own histograms: scrape every
+worker, and use ``rate()``, as a restart resets them. The responses to
+staff users, or to everyone with ``SERVER_TIMING``, also get them as a
+``Server-Timing`` header (shown by the network panel of the browser's
+developer tools); the public would otherwise learn which pages miss the
+caches.
+
+The request being measured lives in a context variable and the queries are
+counted by an execute wrapper added to each connection when it is opened,
+so the async views, whose ORM calls run in another thread, are measured
+too. Several of those threads can run queries of the same request at once,
+so the counters are updated under a lock of the request. The overhead is a
+few microseconds per request and per query.
+"""
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    __slots__ = ('started', 'queries', 'db', 'template', 'rendering', 'lock')
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+        # Depth of nested template renders; only the outermost is timed
+        self.rendering = 0
+
+    def server_timing(self, total):
+        return ', '.join([
+            'db;dur=%.1f;desc="%s queries"' % (self.db * 1000, self.queries),
+            'tmpl;dur=%.1f' % (self.template * 1000),
+            'total;dur=%.1f' % (total * 1000),
+        ])
+
+
+class Histogram:
+    """A Prometheus histogram with a series per label values tuple."""
+    def __init__(self, name, documentation, buckets, labels=('view', 'status')):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labels = labels
+        # Label values: [count per bucket (non-cumulative) and +Inf, sum]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, values, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(values)
+            if series is None:
+                series = self.series[values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def expose(self):
+        lines = [
+            '# HELP %s %s' % (self.name, self.documentation),
+            '# TYPE %s histogram' % self.name,
+        ]
+        with self.lock:
+            series = {values: list(counts) for values, counts in self.series.items()}
+        for values, counts in sorted(series.items()):
+            labels = ','.join('%s="%s"' % (name, _escape(value)) for name, value in zip(self.labels, values))
+            cumulative = 0
+            for bound, count in zip((*map(_format_bound, self.buckets), '+Inf'), counts):
+                cumulative += count
+                lines.append('%s_bucket{%s,le="%s"} %s' % (self.name, labels, bound, cumulative))
+            lines.append('%s_sum{%s} %r' % (self.name, labels, float(counts[-1])))
+            lines.append('%s_count{%s} %s' % (self.name, labels, cumulative))
+        return lines
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    return repr(float(bound))
+
+
+REQUEST_DURATION = Histogram(
+    'tos_request_duration_seconds', 'Wall time of the request until the response is returned.', DURATION_BUCKETS,
+)
+DB_DURATION = Histogram(
+    'tos_request_db_duration_seconds', 'Time spent in database queries per request.', DURATION_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'tos_request_db_queries', 'Database queries per request.', QUERY_BUCKETS,
+)
+TEMPLATE_DURATION = Histogram(
+    'tos_request_template_duration_seconds', 'Time spent rendering templates per request.', DURATION_BUCKETS,
+)
+HISTOGRAMS = [REQUEST_DURATION, DB_DURATION, DB_QUERIES, TEMPLATE_DURATION]
+
+
+def expose():
+    """Every histogram in the Prometheus text format."""
+    return '\n'.join(line for histogram in HISTOGRAMS for line in histogram.expose()) + '\n'
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = perf_counter() - started
+        with timings.lock:
+            timings.db += duration
+            timings.queries += 1
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return super().render(context, request)
+        with timings.lock:
+            outermost = not timings.rendering
+            timings.rendering += 1
+        started = perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            duration = perf_counter() - started
+            with timings.lock:
+                if outermost:
+                    timings.template += duration
+                timings.rendering -= 1
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The Django template backend, timing the renders of the measured requests."""
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
+
+
+class RequestMetricsMiddleware:
+    """Measures each request; goes first in ``MIDDLEWARE`` to measure all of it."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = self.record(request, response, timings)
+        if settings.SERVER_TIMING or _is_staff(getattr(request, 'user', None)):
+            response.headers['Server-Timing'] = timings.server_timing(total)
+        return response
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = self.record(request, response, timings)
+        if settings.SERVER_TIMING or (hasattr(request, 'auser') and _is_staff(await request.auser())):
+            response.headers['Server-Timing'] = timings.server_timing(total)
+        return response
+
+    def record(self, request, response, timings):
+        total = perf_counter() - timings.started
+        match = request.resolver_match
+        labels = (match.view_name if match else 'unresolved', '%dxx' % (response.status_code // 100))
+        REQUEST_DURATION.observe(labels, total)
+        DB_DURATION.observe(labels, timings.db)
+        DB_QUERIES.observe(labels, timings.queries)
+        TEMPLATE_DURATION.observe(labels, timings.template)
+        return total
+
+
+def _is_staff(user):
+    return user is not None and user.is_staff
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-17 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def attach_categories_to_home(apps, schema_editor):
+    Home = apps.get_model('new', 'Home')
+    ServiceCategory = apps.get_model('new', 'ServiceCategory')
+    home = Home.objects.order_by('pk').first()
+    if home is not None:
+        ServiceCategory.objects.filter(home__isnull=True).update(home=home)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new', '0004_alter_service_options_alter_servicevariant_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='home',
+            name='slug',
+            field=models.SlugField(default='', unique=True),
+        ),
+        migrations.AddField(
+            model_name='servicecategory',
+            name='home',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='country', to='new.home'),
+        ),
+        migrations.RunPython(attach_categories_to_home, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='servicecategory',
+            name='home',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='country', to='new.home'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new', '0005_home_slug_servicecategory_home'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('home', 'Home'), ('about', 'About'), ('service_category', 'Service category'), ('service', 'Service'), ('service_variant', 'Service variant')], max_length=20)),
+                ('slug', models.SlugField(blank=True, default='')),
+                ('path', models.CharField(max_length=500)),
+                ('context', models.JSONField()),
+                ('tags', models.JSONField(default=list)),
+                ('stale', models.BooleanField(default=False)),
+                ('generation', models.PositiveIntegerField(default=0)),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'slug'), name='unique_page_snapshot')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PageSnapshotDependency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(db_index=True, max_length=100)),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dependencies', to='new.pagesnapshot')),
+            ],
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new', '0006_pagesnapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='about',
+            name='image_d',
+            field=models.ImageField(help_text='Master image; mobile and tablet sizes are generated from it', upload_to='image_d/'),
+        ),
+        migrations.AlterField(
+            model_name='about',
+            name='image_m',
+            field=models.ImageField(blank=True, help_text='Optional mobile crop, generated from the desktop image when empty', upload_to='image_m/'),
+        ),
+        migrations.AlterField(
+            model_name='about',
+            name='image_t',
+            field=models.ImageField(blank=True, help_text='Optional tablet crop, generated from the desktop image when empty', upload_to='image_t/'),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='image_d',
+            field=models.ImageField(help_text='Master image; mobile and tablet sizes are generated from it', upload_to='image_d/'),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='image_m',
+            field=models.ImageField(blank=True, help_text='Optional mobile crop, generated from the desktop image when empty', upload_to='image_m/'),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='image_t',
+            field=models.ImageField(blank=True, help_text='Optional tablet crop, generated from the desktop image when empty', upload_to='image_t/'),
+        ),
+        migrations.AlterField(
+            model_name='servicecategory',
+            name='image_d',
+            field=models.ImageField(help_text='Master image; mobile and tablet sizes are generated from it', upload_to='image_d/'),
+        ),
+        migrations.AlterField(
+            model_name='servicecategory',
+            name='image_m',
+            field=models.ImageField(blank=True, help_text='Optional mobile crop, generated from the desktop image when empty', upload_to='image_m/'),
+        ),
+        migrations.AlterField(
+            model_name='servicecategory',
+            name='image_t',
+            field=models.ImageField(blank=True, help_text='Optional tablet crop, generated from the desktop image when empty', upload_to='image_t/'),
+        ),
+        migrations.AlterField(
+            model_name='servicevariant',
+            name='image_d',
+            field=models.ImageField(help_text='Master image; mobile and tablet sizes are generated from it', upload_to='image_d/'),
+        ),
+        migrations.AlterField(
+            model_name='servicevariant',
+            name='image_m',
+            field=models.ImageField(blank=True, help_text='Optional mobile crop, generated from the desktop image when empty', upload_to='image_m/'),
+        ),
+        migrations.AlterField(
+            model_name='servicevariant',
+            name='image_t',
+            field=models.ImageField(blank=True, help_text='Optional tablet crop, generated from the desktop image when empty', upload_to='image_t/'),
+        ),
+        migrations.CreateModel(
+            name='ImageRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(db_index=True, max_length=255)),
+                ('format', models.CharField(max_length=10)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('file', models.ImageField(max_length=255, upload_to='renditions/')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('source', 'format', 'width'), name='unique_image_rendition')],
+            },
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:23
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_snapshots_stale(apps, schema_editor):
+    # Rebuilt on their next read, which fills in digest and modified_at
+    PageSnapshot = apps.get_model('new', 'PageSnapshot')
+    PageSnapshot.objects.update(stale=True, generation=F('generation') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new', '0007_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='about',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='alternatehome',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='home',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='pagesnapshot',
+            name='digest',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='pagesnapshot',
+            name='modified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='servicecategory',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='servicecategorycontent',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='servicecontent',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='servicevariant',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='servicevariantcontent',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(mark_snapshots_stale, migrations.RunPython.noop),
+    ]
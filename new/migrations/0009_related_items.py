@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new', '0008_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceNeighbour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('same_parent', models.BooleanField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='new.service')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='new.service')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ServiceVariantNeighbour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('same_parent', models.BooleanField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='new.servicevariant')),
+                ('service_variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='new.servicevariant')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TermVector',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('home', 'Home'), ('about', 'About'), ('service_category', 'Service category'), ('service', 'Service'), ('service_variant', 'Service variant')], max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('terms', models.JSONField(default=dict)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_term_vector')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new', '0009_related_items'),
+    ]
+
+    operations = [
+        # Filled by the rebuild_search_index command and kept in sync by
+        # new/signals.py, see new/search.py
+        migrations.RunSQL(
+            "CREATE VIRTUAL TABLE new_search USING fts5("
+            "slug UNINDEXED, kind UNINDEXED, heading, body, "
+            "tokenize = 'porter unicode61 remove_diacritics 2')",
+            'DROP TABLE new_search',
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:53
+
+from django.db import migrations, models
+from django.db.models import F
+
+RICH_TEXT_MODELS = (
+    'Home', 'About', 'ServiceCategory', 'ServiceCategoryContent', 'Service',
+    'ServiceContent', 'ServiceVariant', 'ServiceVariantContent',
+)
+
+
+def render_rich_text(apps, schema_editor):
+    from new.richtext import render_rich_text, rich_text_fields
+
+    for name in RICH_TEXT_MODELS:
+        model = apps.get_model('new', name)
+        fields = rich_text_fields(model)
+        rows = []
+        for row in model.objects.only(*fields).iterator(chunk_size=1000):
+            row.rendered = {field: render_rich_text(getattr(row, field)) for field in fields}
+            rows.append(row)
+        model.objects.bulk_update(rows, ['rendered'], batch_size=500)
+    # The snapshots print the rendered column from now on
+    PageSnapshot = apps.get_model('new', 'PageSnapshot')
+    PageSnapshot.objects.update(stale=True, generation=F('generation') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new', '0010_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='about',
+            name='rendered',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='home',
+            name='rendered',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='rendered',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='servicecategory',
+            name='rendered',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='servicecategorycontent',
+            name='rendered',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='servicecontent',
+            name='rendered',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='servicevariant',
+            name='rendered',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='servicevariantcontent',
+            name='rendered',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(render_rich_text, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:57
+
+import new.video
+from django.db import migrations, models
+from django.db.models import F
+
+CONTENT_MODELS = ('ServiceCategoryContent', 'ServiceContent', 'ServiceVariantContent')
+
+
+def prepare_videos(apps, schema_editor):
+    from new.video import prepare_video
+
+    for name in CONTENT_MODELS:
+        model = apps.get_model('new', name)
+        rows = []
+        for row in model.objects.exclude(youtube_video_embed='').only(
+            'youtube_video_embed', 'youtube_video_id', 'youtube_poster'
+        ).iterator(chunk_size=1000):
+            prepare_video(row)
+            rows.append(row)
+        model.objects.bulk_update(rows, ['youtube_video_embed', 'youtube_video_id', 'youtube_poster'], batch_size=500)
+    # The snapshots render the facades from now on
+    PageSnapshot = apps.get_model('new', 'PageSnapshot')
+    PageSnapshot.objects.update(stale=True, generation=F('generation') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new', '0011_rendered_rich_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicecategorycontent',
+            name='youtube_poster',
+            field=models.ImageField(blank=True, help_text='Shown until the video is played. Generated when left empty.', upload_to='youtube_posters/'),
+        ),
+        migrations.AddField(
+            model_name='servicecategorycontent',
+            name='youtube_video_id',
+            field=models.CharField(blank=True, editable=False, max_length=11),
+        ),
+        migrations.AddField(
+            model_name='servicecontent',
+            name='youtube_poster',
+            field=models.ImageField(blank=True, help_text='Shown until the video is played. Generated when left empty.', upload_to='youtube_posters/'),
+        ),
+        migrations.AddField(
+            model_name='servicecontent',
+            name='youtube_video_id',
+            field=models.CharField(blank=True, editable=False, max_length=11),
+        ),
+        migrations.AddField(
+            model_name='servicevariantcontent',
+            name='youtube_poster',
+            field=models.ImageField(blank=True, help_text='Shown until the video is played. Generated when left empty.', upload_to='youtube_posters/'),
+        ),
+        migrations.AddField(
+            model_name='servicevariantcontent',
+            name='youtube_video_id',
+            field=models.CharField(blank=True, editable=False, max_length=11),
+        ),
+        migrations.AlterField(
+            model_name='servicecategorycontent',
+            name='youtube_video_embed',
+            field=models.URLField(blank=True, help_text='Any YouTube link; stored as the privacy-enhanced embed URL.', validators=[new.video.validate_youtube_url]),
+        ),
+        migrations.AlterField(
+            model_name='servicecontent',
+            name='youtube_video_embed',
+            field=models.URLField(blank=True, help_text='Any YouTube link; stored as the privacy-enhanced embed URL.', validators=[new.video.validate_youtube_url]),
+        ),
+        migrations.AlterField(
+            model_name='servicevariantcontent',
+            name='youtube_video_embed',
+            field=models.URLField(blank=True, help_text='Any YouTube link; stored as the privacy-enhanced embed URL.', validators=[new.video.validate_youtube_url]),
+        ),
+        migrations.RunPython(prepare_videos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 00:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new', '0012_youtube_facades'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['service_category', 'order', 'heading'], name='service_listing'),
+        ),
+        migrations.AddIndex(
+            model_name='serviceneighbour',
+            index=models.Index(fields=['service', 'rank'], name='serviceneighbour_rank'),
+        ),
+        migrations.AddIndex(
+            model_name='servicevariant',
+            index=models.Index(fields=['service_category', 'order', 'heading'], name='servicevariant_listing'),
+        ),
+        migrations.AddIndex(
+            model_name='servicevariantneighbour',
+            index=models.Index(fields=['service_variant', 'rank'], name='servicevariantneighbour_rank'),
+        ),
+        # Rank the full-text matches by new.search.RANK_FUNCTION
+        migrations.RunSQL(
+            "INSERT INTO new_search (new_search, rank) VALUES ('rank', 'bm25(0.0, 0.0, 10.0, 1.0)')",
+            "INSERT INTO new_search (new_search, rank) VALUES ('rank', 'bm25()')",
+        ),
+    ]
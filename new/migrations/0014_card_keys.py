@@ -0,0 +1,19 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def invalidate_snapshots(apps, schema_editor):
+    # The snapshots give every card the key it is cached by from now on
+    PageSnapshot = apps.get_model('new', 'PageSnapshot')
+    PageSnapshot.objects.update(stale=True, generation=F('generation') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new', '0013_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(invalidate_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,165 @@
+# Generated by Django 5.2.5 on 2026-10-18 00:52
+
+from collections import Counter
+
+import new.storage
+from django.db import migrations, models
+
+IMAGE_MODELS = (
+    'About', 'ServiceCategory', 'ServiceCategoryContent', 'Service', 'ServiceContent',
+    'ServiceVariant', 'ServiceVariantContent',
+)
+
+
+def count_references(apps, schema_editor):
+    # The files uploaded so far, under their original names
+    references = Counter()
+    for model_name in IMAGE_MODELS:
+        model = apps.get_model('new', model_name)
+        fields = [field.name for field in model._meta.fields if isinstance(field, models.ImageField)]
+        for names in model.objects.values_list(*fields).iterator():
+            references.update(name for name in names if name)
+    StoredFile = apps.get_model('new', 'StoredFile')
+    StoredFile.objects.bulk_create(
+        [StoredFile(name=name, references=count) for name, count in references.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new', '0014_card_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('references', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='about',
+            name='image_d',
+            field=models.ImageField(help_text='Master image; mobile and tablet sizes are generated from it', storage=new.storage.upload_storage, upload_to='image_d/'),
+        ),
+        migrations.AlterField(
+            model_name='about',
+            name='image_m',
+            field=models.ImageField(blank=True, help_text='Optional mobile crop, generated from the desktop image when empty', storage=new.storage.upload_storage, upload_to='image_m/'),
+        ),
+        migrations.AlterField(
+            model_name='about',
+            name='image_t',
+            field=models.ImageField(blank=True, help_text='Optional tablet crop, generated from the desktop image when empty', storage=new.storage.upload_storage, upload_to='image_t/'),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='image_d',
+            field=models.ImageField(help_text='Master image; mobile and tablet sizes are generated from it', storage=new.storage.upload_storage, upload_to='image_d/'),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='image_m',
+            field=models.ImageField(blank=True, help_text='Optional mobile crop, generated from the desktop image when empty', storage=new.storage.upload_storage, upload_to='image_m/'),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='image_t',
+            field=models.ImageField(blank=True, help_text='Optional tablet crop, generated from the desktop image when empty', storage=new.storage.upload_storage, upload_to='image_t/'),
+        ),
+        migrations.AlterField(
+            model_name='servicecategory',
+            name='image_d',
+            field=models.ImageField(help_text='Master image; mobile and tablet sizes are generated from it', storage=new.storage.upload_storage, upload_to='image_d/'),
+        ),
+        migrations.AlterField(
+            model_name='servicecategory',
+            name='image_m',
+            field=models.ImageField(blank=True, help_text='Optional mobile crop, generated from the desktop image when empty', storage=new.storage.upload_storage, upload_to='image_m/'),
+        ),
+        migrations.AlterField(
+            model_name='servicecategory',
+            name='image_t',
+            field=models.ImageField(blank=True, help_text='Optional tablet crop, generated from the desktop image when empty', storage=new.storage.upload_storage, upload_to='image_t/'),
+        ),
+        migrations.AlterField(
+            model_name='servicecategorycontent',
+            name='image_d',
+            field=models.ImageField(blank=True, storage=new.storage.upload_storage, upload_to='image_d/'),
+        ),
+        migrations.AlterField(
+            model_name='servicecategorycontent',
+            name='image_m',
+            field=models.ImageField(blank=True, storage=new.storage.upload_storage, upload_to='image_m/'),
+        ),
+        migrations.AlterField(
+            model_name='servicecategorycontent',
+            name='image_t',
+            field=models.ImageField(blank=True, storage=new.storage.upload_storage, upload_to='image_t/'),
+        ),
+        migrations.AlterField(
+            model_name='servicecategorycontent',
+            name='youtube_poster',
+            field=models.ImageField(blank=True, help_text='Shown until the video is played. Generated when left empty.', storage=new.storage.upload_storage, upload_to='youtube_posters/'),
+        ),
+        migrations.AlterField(
+            model_name='servicecontent',
+            name='image_d',
+            field=models.ImageField(blank=True, storage=new.storage.upload_storage, upload_to='image_d/'),
+        ),
+        migrations.AlterField(
+            model_name='servicecontent',
+            name='image_m',
+            field=models.ImageField(blank=True, storage=new.storage.upload_storage, upload_to='image_m/'),
+        ),
+        migrations.AlterField(
+            model_name='servicecontent',
+            name='image_t',
+            field=models.ImageField(blank=True, storage=new.storage.upload_storage, upload_to='image_t/'),
+        ),
+        migrations.AlterField(
+            model_name='servicecontent',
+            name='youtube_poster',
+            field=models.ImageField(blank=True, help_text='Shown until the video is played. Generated when left empty.', storage=new.storage.upload_storage, upload_to='youtube_posters/'),
+        ),
+        migrations.AlterField(
+            model_name='servicevariant',
+            name='image_d',
+            field=models.ImageField(help_text='Master image; mobile and tablet sizes are generated from it', storage=new.storage.upload_storage, upload_to='image_d/'),
+        ),
+        migrations.AlterField(
+            model_name='servicevariant',
+            name='image_m',
+            field=models.ImageField(blank=True, help_text='Optional mobile crop, generated from the desktop image when empty', storage=new.storage.upload_storage, upload_to='image_m/'),
+        ),
+        migrations.AlterField(
+            model_name='servicevariant',
+            name='image_t',
+            field=models.ImageField(blank=True, help_text='Optional tablet crop, generated from the desktop image when empty', storage=new.storage.upload_storage, upload_to='image_t/'),
+        ),
+        migrations.AlterField(
+            model_name='servicevariantcontent',
+            name='image_d',
+            field=models.ImageField(blank=True, storage=new.storage.upload_storage, upload_to='image_d/'),
+        ),
+        migrations.AlterField(
+            model_name='servicevariantcontent',
+            name='image_m',
+            field=models.ImageField(blank=True, storage=new.storage.upload_storage, upload_to='image_m/'),
+        ),
+        migrations.AlterField(
+            model_name='servicevariantcontent',
+            name='image_t',
+            field=models.ImageField(blank=True, storage=new.storage.upload_storage, upload_to='image_t/'),
+        ),
+        migrations.AlterField(
+            model_name='servicevariantcontent',
+            name='youtube_poster',
+            field=models.ImageField(blank=True, help_text='Shown until the video is played. Generated when left empty.', storage=new.storage.upload_storage, upload_to='youtube_posters/'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
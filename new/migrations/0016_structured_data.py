@@ -0,0 +1,195 @@
+# Generated by Django 5.2.5 on 2026-10-18 00:58
+
+import json
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.utils.html import strip_tags
+
+# Frozen copy of new/structured_data.py as of this migration, run on the
+# historical models: later changes to the module or the models must not
+# change (or break) this backfill
+PAGE_MODELS = ('Home', 'About', 'ServiceCategory', 'Service', 'ServiceVariant')
+# Relations followed to the ancestors of a page, and the page paths
+ANCESTORS = {
+    'ServiceCategory': 'home',
+    'Service': 'service_category__home',
+    'ServiceVariant': 'service_category__service_category__home',
+}
+PATHS = {
+    'ServiceCategory': '/services/%s/',
+    'Service': '/service/%s/',
+    'ServiceVariant': '/service-variant/%s/',
+}
+JSON_ESCAPES = {ord('<'): '\\u003C', ord('>'): '\\u003E', ord('&'): '\\u0026'}
+BATCH_SIZE = 500
+
+
+def absolute_url(url):
+    if url.startswith('/') and not url.startswith('//'):
+        return settings.SITE_URL.rstrip('/') + url
+    return urljoin(settings.SITE_URL.rstrip('/') + '/', url)
+
+
+def page_url(page):
+    return getattr(page, 'canonical_url', None) or absolute_url(PATHS[type(page).__name__] % page.slug)
+
+
+def trail(page):
+    name = type(page).__name__
+    if name == 'ServiceVariant':
+        return [page.service_category.service_category, page.service_category, page]
+    if name == 'Service':
+        return [page.service_category, page]
+    if name == 'ServiceCategory':
+        return [page]
+    return []
+
+
+def organization(home, full=False):
+    node = {
+        '@type': 'Organization',
+        '@id': absolute_url('/#organization'),
+        'name': (home.og_site_name or home.title) if home is not None else '',
+        'url': absolute_url('/'),
+    }
+    if full and home is not None:
+        node['description'] = home.meta_description
+        if home.og_image:
+            node['image'] = absolute_url(home.og_image)
+    return node
+
+
+def breadcrumbs(pages):
+    items = [('Home', absolute_url('/'))] + [(page.heading, page_url(page)) for page in pages]
+    return {
+        '@type': 'BreadcrumbList',
+        'itemListElement': [
+            {'@type': 'ListItem', 'position': position, 'name': name, 'item': url}
+            for position, (name, url) in enumerate(items, 1)
+        ],
+    }
+
+
+def service_node(page, pages, home):
+    url = page_url(page)
+    node = {
+        '@type': 'Service',
+        '@id': url + '#service',
+        'name': page.heading,
+        'description': page.meta_description or strip_tags(page.small_description).strip(),
+        'url': url,
+        'provider': organization(home),
+    }
+    if len(pages) > 1:
+        node['serviceType'] = pages[-2].heading
+    if page.image_d:
+        node['image'] = absolute_url(page.image_d.url)
+    elif page.og_image:
+        node['image'] = absolute_url(page.og_image)
+    return node
+
+
+def _types(node):
+    types = node.get('@type', [])
+    return {types} if isinstance(types, str) else set(types)
+
+
+def _manual_nodes(schema):
+    if isinstance(schema, str):
+        try:
+            schema = json.loads(schema)
+        except ValueError:
+            return []
+    if isinstance(schema, dict):
+        schema = schema['@graph'] if isinstance(schema.get('@graph'), list) else [schema]
+    if not isinstance(schema, list):
+        return []
+    return [
+        {key: value for key, value in node.items() if key != '@context'}
+        for node in schema if isinstance(node, dict) and node
+    ]
+
+
+def _override(node, manual):
+    for key, value in manual.items():
+        if isinstance(value, dict) and isinstance(node.get(key), dict):
+            _override(node[key], value)
+        else:
+            node[key] = value
+
+
+def merge(graph, schema):
+    for manual in _manual_nodes(schema):
+        node = next((node for node in graph if _types(node) & _types(manual)), None)
+        if node is None:
+            graph.append(manual)
+        else:
+            _override(node, manual)
+    return graph
+
+
+def structured_data(page, home):
+    pages = trail(page)
+    if pages:
+        graph = [service_node(page, pages, pages[0].home), breadcrumbs(pages)]
+    else:
+        graph = [organization(page if type(page).__name__ == 'Home' else home, full=True)]
+    graph = merge(graph, page.schema)
+    data = {'@context': 'https://schema.org', '@graph': graph}
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).translate(JSON_ESCAPES)
+
+
+def serialize_structured_data(apps, schema_editor):
+    home = apps.get_model('new', 'Home').objects.order_by('pk').first()
+    for name in PAGE_MODELS:
+        model = apps.get_model('new', name)
+        queryset = model.objects.all()
+        if name in ANCESTORS:
+            queryset = queryset.select_related(ANCESTORS[name])
+        rows = []
+        for page in queryset.iterator(chunk_size=BATCH_SIZE):
+            page.structured_data = structured_data(page, home)
+            rows.append(page)
+        model.objects.bulk_update(rows, ['structured_data'], batch_size=BATCH_SIZE)
+    # The snapshots print the structured_data column from now on
+    PageSnapshot = apps.get_model('new', 'PageSnapshot')
+    PageSnapshot.objects.update(stale=True, generation=F('generation') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new', '0015_stored_files'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='about',
+            name='structured_data',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='home',
+            name='structured_data',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='structured_data',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='servicecategory',
+            name='structured_data',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='servicevariant',
+            name='structured_data',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(serialize_structured_data, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+import html
+import re
+
+from django.db import migrations
+
+# Frozen copy of the rows of new/search.py as of this migration: kind,
+# rowid offset, page model, content block model and its page field
+PAGES = (
+    ('service_category', 0, 'ServiceCategory', 'ServiceCategoryContent', 'service_category'),
+    ('service', 1, 'Service', 'ServiceContent', 'service'),
+    ('service_variant', 2, 'ServiceVariant', 'ServiceVariantContent', 'service_variant'),
+)
+TEXT_FIELDS = ('small_description', 'content', 'meta_keywords')
+BATCH_SIZE = 1000
+
+TAG_RE = re.compile(r'<[^>]*>')
+SPACE_RE = re.compile(r'\s+')
+
+
+def plain_text(value):
+    return SPACE_RE.sub(' ', html.unescape(TAG_RE.sub(' ', value or ''))).strip()
+
+
+def _rows(apps, kind, offset, model_name, block_model_name, field):
+    model = apps.get_model('new', model_name)
+    block_model = apps.get_model('new', block_model_name)
+    pages = model.objects.only('slug', 'heading', *TEXT_FIELDS).order_by('pk')
+    batch = []
+    for page in pages.iterator(chunk_size=BATCH_SIZE):
+        batch.append(page)
+        if len(batch) == BATCH_SIZE:
+            yield _page_rows(block_model, kind, offset, field, batch)
+            batch = []
+    if batch:
+        yield _page_rows(block_model, kind, offset, field, batch)
+
+
+def _page_rows(block_model, kind, offset, field, pages):
+    blocks = {}
+    for page_id, content in block_model.objects.filter(
+        **{'%s__in' % field: pages}
+    ).order_by('pk').values_list(field, 'content'):
+        blocks.setdefault(page_id, []).append(content)
+    return [
+        (
+            page.pk * len(PAGES) + offset, page.slug, kind, page.heading,
+            ' '.join(plain_text(text) for text in [*(getattr(page, name) for name in TEXT_FIELDS), *blocks.get(page.pk, [])]),
+        )
+        for page in pages
+    ]
+
+
+def index_pages(apps, schema_editor):
+    # The index was only filled by rebuild_search_index; an index filled
+    # already is kept
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM new_search LIMIT 1')
+        if cursor.fetchone() is not None:
+            return
+        for page in PAGES:
+            for rows in _rows(apps, *page):
+                cursor.executemany(
+                    'INSERT INTO new_search (rowid, slug, kind, heading, body) VALUES (%s, %s, %s, %s, %s)', rows,
+                )
+        cursor.execute("INSERT INTO new_search (new_search) VALUES ('optimize')")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new', '0016_structured_data'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_pages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,138 @@
+import html
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import F
+
+# Frozen copy of new/related.py as of this migration: kind, page model,
+# neighbour model and its source field
+INDEXES = (
+    ('service', 'Service', 'ServiceNeighbour', 'service'),
+    ('service_variant', 'ServiceVariant', 'ServiceVariantNeighbour', 'service_variant'),
+)
+TEXT_FIELDS = {'heading': 3, 'meta_keywords': 2, 'small_description': 1, 'content': 1}
+STORED_TERMS = 64
+MATCH_TERMS = 24
+MAX_POSTINGS = 1000
+BATCH_SIZE = 1000
+
+TAG_RE = re.compile(r'<[^>]*>')
+SPACE_RE = re.compile(r'\s+')
+WORD_RE = re.compile(r'[^\W_]{2,}')
+STOP_WORDS = frozenset('''
+    about after all also an and any are as at be been but by can do does for
+    from has have how if in into is it its more most no not of on or our out
+    over so such than that the their them then there these they this to up
+    us was we were what when which who why will with you your
+'''.split())
+
+
+def plain_text(value):
+    return SPACE_RE.sub(' ', html.unescape(TAG_RE.sub(' ', value or ''))).strip()
+
+
+def item_terms(instance):
+    counts = Counter()
+    for field, weight in TEXT_FIELDS.items():
+        for word in WORD_RE.findall(plain_text(getattr(instance, field)).lower()):
+            if word not in STOP_WORDS:
+                counts[word] += weight
+    return dict(counts.most_common(STORED_TERMS))
+
+
+def neighbour_lists(vectors, items, limit):
+    """``(pk, neighbour, same_parent, rank, score)`` of every item of ``items``."""
+    parents = dict(items)
+    position = {pk: position for position, (pk, _) in enumerate(items)}
+    children = defaultdict(list)
+    for pk, parent in items:
+        children[parent].append(pk)
+
+    frequencies = Counter(term for terms in vectors.values() for term in terms)
+    weights = {}
+    postings = defaultdict(list)
+    for pk, terms in vectors.items():
+        item_weights = {
+            term: (1 + math.log(count)) * math.log(len(vectors) / frequencies[term])
+            for term, count in terms.items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in item_weights.values()))
+        if not norm:
+            continue
+        strongest = sorted(item_weights.items(), key=lambda item: -item[1])[:MATCH_TERMS]
+        weights[pk] = {term: weight / norm for term, weight in strongest if weight}
+        for term, weight in weights[pk].items():
+            postings[term].append((pk, weight))
+
+    for pk, parent in items:
+        scores = defaultdict(float)
+        for term, weight in weights.get(pk, {}).items():
+            if len(postings[term]) > MAX_POSTINGS:
+                continue
+            for other, other_weight in postings[term]:
+                scores[other] += weight * other_weight
+        scores.pop(pk, None)
+
+        groups = {True: [], False: []}
+        for other, score in sorted(scores.items(), key=lambda item: (-item[1], position[item[0]])):
+            group = groups[parents[other] == parent]
+            if len(group) < limit:
+                group.append((other, score))
+        # Padding, in display order
+        for same_parent, candidates in ((True, children[parent]), (False, position)):
+            group = groups[same_parent]
+            chosen = {other for other, _ in group}
+            for other in candidates:
+                if len(group) >= limit:
+                    break
+                if other != pk and other not in chosen and (parents[other] == parent) == same_parent:
+                    group.append((other, 0.0))
+        for same_parent, group in groups.items():
+            for rank, (other, score) in enumerate(group):
+                yield pk, other, same_parent, rank, round(score, 6)
+
+
+def index_related(apps, schema_editor):
+    # The neighbour tables were only filled by rebuild_related_items; an
+    # index built already is kept
+    TermVector = apps.get_model('new', 'TermVector')
+    PageSnapshot = apps.get_model('new', 'PageSnapshot')
+    limit = getattr(settings, 'RELATED_ITEMS', 3)
+    for kind, model_name, neighbour_model_name, source in INDEXES:
+        if TermVector.objects.filter(kind=kind).exists():
+            continue
+        model = apps.get_model('new', model_name)
+        neighbour_model = apps.get_model('new', neighbour_model_name)
+        items = list(model.objects.order_by('order', 'heading', 'pk').values_list('pk', 'service_category_id'))
+        vectors = {
+            instance.pk: item_terms(instance)
+            for instance in model.objects.only(*TEXT_FIELDS).iterator(chunk_size=BATCH_SIZE)
+        }
+        TermVector.objects.bulk_create(
+            (TermVector(kind=kind, object_id=pk, terms=terms) for pk, terms in vectors.items()),
+            batch_size=BATCH_SIZE,
+        )
+        neighbour_model.objects.all().delete()
+        neighbour_model.objects.bulk_create(
+            (
+                neighbour_model(**{'%s_id' % source: pk}, neighbour_id=other, same_parent=same_parent, rank=rank, score=score)
+                for pk, other, same_parent, rank, score in neighbour_lists(vectors, items, limit)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        # The pages printed their related items before the index existed
+        PageSnapshot.objects.filter(kind=kind).update(stale=True, generation=F('generation') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new', '0017_search_backfill'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_related, migrations.RunPython.noop),
+    ]
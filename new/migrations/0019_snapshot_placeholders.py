@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:47
+
+from django.db import migrations, models
+
+
+def clear_placeholder_dependencies(apps, schema_editor):
+    # Snapshots without a digest are placeholders from now on, which have
+    # no dependencies; the ones left from before 0008 are stale already
+    PageSnapshotDependency = apps.get_model('new', 'PageSnapshotDependency')
+    PageSnapshotDependency.objects.filter(snapshot__digest='').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new', '0018_related_backfill'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pagesnapshot',
+            index=models.Index(condition=models.Q(('digest', '')), fields=['digest'], name='pagesnapshot_placeholder'),
+        ),
+        migrations.RunPython(clear_placeholder_dependencies, migrations.RunPython.noop),
+    ]
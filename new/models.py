@@ -1,4 +1,8 @@
 from django.db import models
+
+from .storage import upload_storage
+from .video import validate_youtube_url
+
 #  Create your models here.
 
 class Home(models.Model):
@@ -20,6 +24,11 @@ class Home(models.Model):
     og_site_name = models.TextField()
     canonical_url = models.URLField(blank=True, null=True, help_text="Preferred URL for this page")
     slug = models.SlugField(unique=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+    # Processed rich text, see new/richtext.py
+    rendered = models.JSONField(default=dict, blank=True, editable=False)
+    # JSON-LD serialized on save, see new/structured_data.py
+    structured_data = models.TextField(blank=True, editable=False)
 
     def __str__(self):
         return self.heading
@@ -28,15 +37,16 @@ class AlternateHome(models.Model):
     home = models.ForeignKey(Home, on_delete=models.CASCADE)
     href_lang = models.CharField(max_length=200, null=True, blank=True)
     link = models.URLField()
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.link
 
 class About(models.Model):
     heading = models.CharField(max_length=300)
-    image_m = models.ImageField(upload_to='image_m/')
-    image_t = models.ImageField(upload_to='image_t/')
-    image_d = models.ImageField(upload_to='image_d/')
+    image_m = models.ImageField(upload_to='image_m/', storage=upload_storage, blank=True, help_text="Optional mobile crop, generated from the desktop image when empty")
+    image_t = models.ImageField(upload_to='image_t/', storage=upload_storage, blank=True, help_text="Optional tablet crop, generated from the desktop image when empty")
+    image_d = models.ImageField(upload_to='image_d/', storage=upload_storage, help_text="Master image; mobile and tablet sizes are generated from it")
     alt = models.CharField(max_length=1000)
     small_description = models.TextField()
     content = models.TextField()
@@ -55,16 +65,21 @@ class About(models.Model):
     og_description = models.TextField()
     og_site_name = models.TextField()
     slug = models.SlugField(unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Processed rich text, see new/richtext.py
+    rendered = models.JSONField(default=dict, blank=True, editable=False)
+    # JSON-LD serialized on save, see new/structured_data.py
+    structured_data = models.TextField(blank=True, editable=False)
 
     def __str__(self):
         return self.heading
     
 class ServiceCategory(models.Model):
-    home = models.ForiegnKey(Home, on_delete=models.CASCADE, related_name="country")
+    home = models.ForeignKey(Home, on_delete=models.CASCADE, related_name="country")
     heading = models.CharField(max_length=300)
-    image_m = models.ImageField(upload_to='image_m/')
-    image_t = models.ImageField(upload_to='image_t/')
-    image_d = models.ImageField(upload_to='image_d/')
+    image_m = models.ImageField(upload_to='image_m/', storage=upload_storage, blank=True, help_text="Optional mobile crop, generated from the desktop image when empty")
+    image_t = models.ImageField(upload_to='image_t/', storage=upload_storage, blank=True, help_text="Optional tablet crop, generated from the desktop image when empty")
+    image_d = models.ImageField(upload_to='image_d/', storage=upload_storage, help_text="Master image; mobile and tablet sizes are generated from it")
     alt = models.CharField(max_length=1000)
     small_description = models.TextField()
     content = models.TextField()
@@ -80,6 +95,11 @@ class ServiceCategory(models.Model):
     og_description = models.TextField()
     og_site_name = models.TextField()
     slug = models.SlugField(unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Processed rich text, see new/richtext.py
+    rendered = models.JSONField(default=dict, blank=True, editable=False)
+    # JSON-LD serialized on save, see new/structured_data.py
+    structured_data = models.TextField(blank=True, editable=False)
     
     def __str__(self):
 
@@ -87,18 +107,30 @@ class ServiceCategory(models.Model):
     
 class ServiceCategoryContent(models.Model):
     service_category = models.ForeignKey(ServiceCategory, on_delete=models.CASCADE)
-    image_m = models.ImageField(upload_to='image_m/', blank=True)
-    image_t = models.ImageField(upload_to='image_t/', blank=True)
-    image_d = models.ImageField(upload_to='image_d/', blank=True)
+    image_m = models.ImageField(upload_to='image_m/', storage=upload_storage, blank=True)
+    image_t = models.ImageField(upload_to='image_t/', storage=upload_storage, blank=True)
+    image_d = models.ImageField(upload_to='image_d/', storage=upload_storage, blank=True)
     content = models.TextField(blank=True)
-    youtube_video_embed = models.URLField(blank=True)
+    youtube_video_embed = models.URLField(
+        blank=True, validators=[validate_youtube_url],
+        help_text='Any YouTube link; stored as the privacy-enhanced embed URL.'
+    )
+    # Set on save, see new/video.py
+    youtube_video_id = models.CharField(max_length=11, blank=True, editable=False)
+    youtube_poster = models.ImageField(
+        upload_to='youtube_posters/', storage=upload_storage, blank=True,
+        help_text='Shown until the video is played. Generated when left empty.'
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    # Processed rich text, see new/richtext.py
+    rendered = models.JSONField(default=dict, blank=True, editable=False)
 
 class Service(models.Model):
     service_category = models.ForeignKey(ServiceCategory, on_delete=models.CASCADE)
     heading = models.CharField(max_length=300)
-    image_m = models.ImageField(upload_to='image_m/')
-    image_t = models.ImageField(upload_to='image_t/')
-    image_d = models.ImageField(upload_to='image_d/')
+    image_m = models.ImageField(upload_to='image_m/', storage=upload_storage, blank=True, help_text="Optional mobile crop, generated from the desktop image when empty")
+    image_t = models.ImageField(upload_to='image_t/', storage=upload_storage, blank=True, help_text="Optional tablet crop, generated from the desktop image when empty")
+    image_d = models.ImageField(upload_to='image_d/', storage=upload_storage, help_text="Master image; mobile and tablet sizes are generated from it")
     alt = models.CharField(max_length=1000)
     small_description = models.TextField()
     content = models.TextField()
@@ -115,27 +147,48 @@ class Service(models.Model):
     og_description = models.TextField()
     og_site_name = models.TextField()
     slug = models.SlugField(unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Processed rich text, see new/richtext.py
+    rendered = models.JSONField(default=dict, blank=True, editable=False)
+    # JSON-LD serialized on save, see new/structured_data.py
+    structured_data = models.TextField(blank=True, editable=False)
     
     class Meta:
         ordering = ['order', 'heading']
+        indexes = [
+            # The services of a category, in display order
+            models.Index(fields=['service_category', 'order', 'heading'], name='service_listing'),
+        ]
     
     def __str__(self):
         return self.heading
 
 class ServiceContent(models.Model):
     service = models.ForeignKey(Service, on_delete=models.CASCADE)
-    image_m = models.ImageField(upload_to='image_m/', blank=True)
-    image_t = models.ImageField(upload_to='image_t/', blank=True)
-    image_d = models.ImageField(upload_to='image_d/', blank=True)
+    image_m = models.ImageField(upload_to='image_m/', storage=upload_storage, blank=True)
+    image_t = models.ImageField(upload_to='image_t/', storage=upload_storage, blank=True)
+    image_d = models.ImageField(upload_to='image_d/', storage=upload_storage, blank=True)
     content = models.TextField(blank=True)
-    youtube_video_embed = models.URLField(blank=True)
+    youtube_video_embed = models.URLField(
+        blank=True, validators=[validate_youtube_url],
+        help_text='Any YouTube link; stored as the privacy-enhanced embed URL.'
+    )
+    # Set on save, see new/video.py
+    youtube_video_id = models.CharField(max_length=11, blank=True, editable=False)
+    youtube_poster = models.ImageField(
+        upload_to='youtube_posters/', storage=upload_storage, blank=True,
+        help_text='Shown until the video is played. Generated when left empty.'
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    # Processed rich text, see new/richtext.py
+    rendered = models.JSONField(default=dict, blank=True, editable=False)
 
 class ServiceVariant(models.Model):
     service_category = models.ForeignKey(Service, on_delete=models.CASCADE)
     heading = models.CharField(max_length=300)
-    image_m = models.ImageField(upload_to='image_m/')
-    image_t = models.ImageField(upload_to='image_t/')
-    image_d = models.ImageField(upload_to='image_d/')
+    image_m = models.ImageField(upload_to='image_m/', storage=upload_storage, blank=True, help_text="Optional mobile crop, generated from the desktop image when empty")
+    image_t = models.ImageField(upload_to='image_t/', storage=upload_storage, blank=True, help_text="Optional tablet crop, generated from the desktop image when empty")
+    image_d = models.ImageField(upload_to='image_d/', storage=upload_storage, help_text="Master image; mobile and tablet sizes are generated from it")
     alt = models.CharField(max_length=1000)
     small_description = models.TextField()
     content = models.TextField()
@@ -153,17 +206,177 @@ class ServiceVariant(models.Model):
     og_site_name = models.TextField(blank=True, null=True)
     canonical_url = models.URLField(blank=True, null=True, help_text="Preferred URL for this page")
     slug = models.SlugField(unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Processed rich text, see new/richtext.py
+    rendered = models.JSONField(default=dict, blank=True, editable=False)
+    # JSON-LD serialized on save, see new/structured_data.py
+    structured_data = models.TextField(blank=True, editable=False)
 
     class Meta:
         ordering = ['order', 'heading']
+        indexes = [
+            # The variants of a service, in display order
+            models.Index(fields=['service_category', 'order', 'heading'], name='servicevariant_listing'),
+        ]
 
     def __str__(self):
         return self.heading
 
 class ServiceVariantContent(models.Model):
     service_variant = models.ForeignKey(ServiceVariant, on_delete=models.CASCADE)
-    image_m = models.ImageField(upload_to='image_m/', blank=True)
-    image_t = models.ImageField(upload_to='image_t/', blank=True)
-    image_d = models.ImageField(upload_to='image_d/', blank=True)
+    image_m = models.ImageField(upload_to='image_m/', storage=upload_storage, blank=True)
+    image_t = models.ImageField(upload_to='image_t/', storage=upload_storage, blank=True)
+    image_d = models.ImageField(upload_to='image_d/', storage=upload_storage, blank=True)
     content = models.TextField(blank=True)
-    youtube_video_embed = models.URLField(blank=True)
\ No newline at end of file
+    youtube_video_embed = models.URLField(
+        blank=True, validators=[validate_youtube_url],
+        help_text='Any YouTube link; stored as the privacy-enhanced embed URL.'
+    )
+    # Set on save, see new/video.py
+    youtube_video_id = models.CharField(max_length=11, blank=True, editable=False)
+    youtube_poster = models.ImageField(
+        upload_to='youtube_posters/', storage=upload_storage, blank=True,
+        help_text='Shown until the video is played. Generated when left empty.'
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    # Processed rich text, see new/richtext.py
+    rendered = models.JSONField(default=dict, blank=True, editable=False)
+
+class PageSnapshot(models.Model):
+    """
+    Serialized template context of one public page, see ``new.snapshots``.
+    """
+    HOME = 'home'
+    ABOUT = 'about'
+    SERVICE_CATEGORY = 'service_category'
+    SERVICE = 'service'
+    SERVICE_VARIANT = 'service_variant'
+    KIND_CHOICES = [
+        (HOME, 'Home'),
+        (ABOUT, 'About'),
+        (SERVICE_CATEGORY, 'Service category'),
+        (SERVICE, 'Service'),
+        (SERVICE_VARIANT, 'Service variant'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    slug = models.SlugField(blank=True, default="")
+    path = models.CharField(max_length=500)
+    context = models.JSONField()
+    tags = models.JSONField(default=list)
+    stale = models.BooleanField(default=False)
+    # Incremented on every invalidation so a rebuild racing a save is discarded
+    generation = models.PositiveIntegerField(default=0)
+    built_at = models.DateTimeField(auto_now=True)
+    # Digest of context and tags, and when it last changed (ETag/Last-Modified)
+    digest = models.CharField(max_length=40, blank=True, default="")
+    modified_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'slug'], name='unique_page_snapshot'),
+        ]
+        indexes = [
+            # The placeholders of first builds, see new.snapshots.build_snapshot
+            models.Index(fields=['digest'], condition=models.Q(digest=''), name='pagesnapshot_placeholder'),
+        ]
+
+    def __str__(self):
+        return self.path
+
+
+class PageSnapshotDependency(models.Model):
+    snapshot = models.ForeignKey(PageSnapshot, on_delete=models.CASCADE, related_name='dependencies')
+    tag = models.CharField(max_length=100, db_index=True)
+
+    def __str__(self):
+        return self.tag
+
+
+class ImageRendition(models.Model):
+    """
+    Resized and re-encoded copy of an uploaded image, see ``new.images``.
+    """
+    source = models.CharField(max_length=255, db_index=True)
+    format = models.CharField(max_length=10)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    file = models.ImageField(upload_to='renditions/', max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'format', 'width'], name='unique_image_rendition'),
+        ]
+
+    def __str__(self):
+        return self.file.name
+
+
+class StoredFile(models.Model):
+    """
+    An uploaded file and the number of image fields naming it, see
+    ``new.uploads``.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+class ServiceNeighbour(models.Model):
+    """
+    Precomputed "related" (same category) or "other" service shown on a
+    service page, see ``new.related``.
+    """
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='neighbours')
+    neighbour = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='+')
+    same_parent = models.BooleanField()
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['service', 'rank'], name='serviceneighbour_rank'),
+        ]
+
+    def __str__(self):
+        return '%s -> %s' % (self.service_id, self.neighbour_id)
+
+
+class ServiceVariantNeighbour(models.Model):
+    """
+    Precomputed "related" (same service) or "other" variant shown on a
+    variant page, see ``new.related``.
+    """
+    service_variant = models.ForeignKey(ServiceVariant, on_delete=models.CASCADE, related_name='neighbours')
+    neighbour = models.ForeignKey(ServiceVariant, on_delete=models.CASCADE, related_name='+')
+    same_parent = models.BooleanField()
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['service_variant', 'rank'], name='servicevariantneighbour_rank'),
+        ]
+
+    def __str__(self):
+        return '%s -> %s' % (self.service_variant_id, self.neighbour_id)
+
+
+class TermVector(models.Model):
+    """
+    Term counts of a service or variant, kept so the relatedness index can
+    be updated for one saved item without reading every page again.
+    """
+    kind = models.CharField(max_length=20, choices=PageSnapshot.KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    terms = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_term_vector'),
+        ]
+
+    def __str__(self):
+        return '%s %s' % (self.kind, self.object_id)
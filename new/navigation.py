@@ -0,0 +1,180 @@
+"""
+Site menu: the category → service → variant tree, shared by every page.
+
+The ``navigation`` context processor gives each template ``navigation``,
+the whole tree, and ``breadcrumbs``, the trail of the requested page
+through it. Both are lazy: admin pages and other templates that never use
+them cost nothing. The menu of ``base.html`` shows every category with its
+first ``MENU_SERVICES`` services and the number of the others.
+
+The tree is built from three flat ``values_list`` queries and kept in the
+process, keyed by the version of ``NAVIGATION_TREE_TAG`` in the page cache.
+A request reads that version (one cache read) and rebuilds the tree only
+when it moved. Saving a category, service or variant bumps that tag when it
+changes a heading, slug, order or parent (``tree_changed``, see
+``new.signals``), as do the bulk operations through ``SITE_TAGS``.
+
+Every page shows the menu, so the pages depend on ``NAVIGATION_TAG``
+instead, bumped only when what the menu shows changes
+(``navigation_changed``): a variant, or a service below the first ones of
+its category, leaves the cached pages alone. The ``digest`` of what the
+menu shows is part of the page ETags and of the static export manifest,
+and the templates cache the rendered menu under it. The breadcrumbs of a
+page show its parents, whose changes evict it anyway.
+"""
+import hashlib
+import threading
+from collections import defaultdict, namedtuple
+
+from django.utils.functional import SimpleLazyObject
+
+from .cache import NAVIGATION_TREE_TAG, tag_version
+from .models import ServiceCategory, Service, ServiceVariant, PageSnapshot
+from .snapshots import page_path
+
+# Fields of each model in the tree; a change bumps NAVIGATION_TREE_TAG
+NAVIGATION_FIELDS = {
+    ServiceCategory: ('heading', 'slug'),
+    Service: ('heading', 'slug', 'order', 'service_category_id'),
+    ServiceVariant: ('heading', 'slug', 'order', 'service_category_id'),
+}
+# Services listed under each category, as in base.html
+MENU_SERVICES = 6
+SLUG_PLACEHOLDER = 'navigation-slug'
+
+NavItem = namedtuple('NavItem', 'heading url children')
+
+
+class Navigation:
+    """
+    ``categories``: a tuple of ``NavItem``, each with its services as
+    ``children``, and theirs, the variants. ``trails`` maps the path of every
+    page of the tree to the items from its category down to it.
+    """
+    __slots__ = ('version', 'digest', 'categories', 'trails')
+
+    def __init__(self, version, digest, categories, trails):
+        self.version = version
+        self.digest = digest
+        self.categories = categories
+        self.trails = trails
+
+    def breadcrumbs(self, path):
+        return self.trails.get(path, ())
+
+
+_navigation = None
+_lock = threading.Lock()
+
+
+def _url_format(kind):
+    # One reverse() per kind instead of one per page
+    return page_path(kind, SLUG_PLACEHOLDER).replace(SLUG_PLACEHOLDER, '%s')
+
+
+def _menu(services):
+    """
+    What the menu shows of ``services``, rows of (pk, category id, order,
+    heading, slug): the first services of each category and their number.
+    """
+    category_services = defaultdict(list)
+    for pk, category_id, order, heading, slug in sorted(services, key=lambda row: (row[2], row[3], row[0])):
+        category_services[category_id].append((heading, slug))
+    return {
+        category_id: (tuple(rows[:MENU_SERVICES]), len(rows))
+        for category_id, rows in category_services.items()
+    }
+
+
+def build_navigation(version):
+    categories = list(ServiceCategory.objects.order_by('pk').values_list('pk', 'heading', 'slug'))
+    services = list(
+        Service.objects.order_by('order', 'heading', 'pk').values_list('pk', 'service_category_id', 'order', 'heading', 'slug')
+    )
+    variants = list(
+        ServiceVariant.objects.order_by('order', 'heading', 'pk').values_list('service_category_id', 'heading', 'slug')
+    )
+    menu = _menu(services)
+    digest = hashlib.sha1(repr([(category, menu.get(category[0])) for category in categories]).encode()).hexdigest()
+
+    service_url = _url_format(PageSnapshot.SERVICE)
+    variant_url = _url_format(PageSnapshot.SERVICE_VARIANT)
+    category_url = _url_format(PageSnapshot.SERVICE_CATEGORY)
+
+    service_variants = defaultdict(list)
+    for service_id, heading, slug in variants:
+        service_variants[service_id].append(NavItem(heading, variant_url % slug, ()))
+    category_services = defaultdict(list)
+    for pk, category_id, order, heading, slug in services:
+        category_services[category_id].append(
+            NavItem(heading, service_url % slug, tuple(service_variants[pk]))
+        )
+    tree = tuple(
+        NavItem(heading, category_url % slug, tuple(category_services[pk]))
+        for pk, heading, slug in categories
+    )
+
+    trails = {}
+    for category in tree:
+        trails[category.url] = (category,)
+        for service in category.children:
+            trails[service.url] = (category, service)
+            for variant in service.children:
+                trails[variant.url] = (category, service, variant)
+    return Navigation(version, digest, tree, trails)
+
+
+def get_navigation():
+    """The tree of the current ``NAVIGATION_TREE_TAG`` version, built once per process."""
+    global _navigation
+    version = tag_version(NAVIGATION_TREE_TAG)
+    navigation = _navigation
+    if navigation is None or navigation.version != version:
+        with _lock:
+            navigation = _navigation
+            if navigation is None or navigation.version != version:
+                navigation = _navigation = build_navigation(version)
+    return navigation
+
+
+def request_navigation(request):
+    """``get_navigation()``, once per request: the ETag and the markup show the same tree."""
+    if not hasattr(request, '_navigation'):
+        request._navigation = get_navigation()
+    return request._navigation
+
+
+def _service_row(page):
+    return (page.pk, page.service_category_id, page.order, page.heading, page.slug)
+
+
+def tree_changed(page, stored):
+    """Whether saving ``page`` over ``stored`` (None when created) changes the tree."""
+    return stored is None or any(
+        getattr(page, field) != getattr(stored, field) for field in NAVIGATION_FIELDS[type(page)]
+    )
+
+
+def navigation_changed(page, stored):
+    """Whether saving ``page`` over ``stored`` (None when created) changes the menu."""
+    if type(page) is ServiceVariant or not tree_changed(page, stored):
+        return False
+    if type(page) is not Service or stored is None:
+        return True
+    # Only the first services of a category are shown: compare the menu of
+    # its categories with the service as stored and as saved
+    services = [
+        row for row in Service.objects.filter(
+            service_category__in={page.service_category_id, stored.service_category_id},
+        ).values_list('pk', 'service_category_id', 'order', 'heading', 'slug')
+        if row[0] != page.pk
+    ]
+    return _menu(services + [_service_row(stored)]) != _menu(services + [_service_row(page)])
+
+
+def navigation(request):
+    """Context processor: the site menu and the breadcrumbs of the requested page."""
+    return {
+        'navigation': SimpleLazyObject(lambda: request_navigation(request)),
+        'breadcrumbs': SimpleLazyObject(lambda: request_navigation(request).breadcrumbs(request.path_info)),
+    }
@@ -0,0 +1,350 @@
+"""
+Relatedness index of services and variants.
+
+Every service and variant is reduced to the counts of the words of its
+heading, meta keywords, short description and content (``TermVector``).
+Weighted by TF-IDF, the cosine similarity of two items ranks the "related"
+items (same parent) and the "other" items (another parent) of a page; the
+top ``RELATED_ITEMS`` of both are stored as neighbour rows, which the
+snapshot builders join in a single query. Items with too few similar items
+are padded in display order, like the pages chose them before.
+
+``rebuild_related`` builds the index of a kind from scratch (the
+``rebuild_related_items`` command). Saving or deleting an item only
+recomputes the lists of that item and of the items it shares terms with,
+in a background thread (see ``new.signals``).
+
+The index is kept in the process between updates and updated in place:
+the document frequencies are maintained incrementally and only the saved
+items are weighed again, so an update costs the items it touches plus one
+light query of the display order. The other items keep the weights of the
+frequencies they were indexed with until the index is loaded again, which
+happens when another process (or ``rebuild_related``) wrote term vectors
+meanwhile.
+"""
+import logging
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Max
+
+from .models import (
+    Service, ServiceVariant, ServiceNeighbour, ServiceVariantNeighbour, PageSnapshot, TermVector
+)
+from .search import plain_text
+
+logger = logging.getLogger(__name__)
+
+# Kind: (model, neighbour model, its source field, page cache tag prefix)
+INDEXES = {
+    PageSnapshot.SERVICE: (Service, ServiceNeighbour, 'service', 'service'),
+    PageSnapshot.SERVICE_VARIANT: (ServiceVariant, ServiceVariantNeighbour, 'service_variant', 'variant'),
+}
+KINDS = {model: kind for kind, (model, *rest) in INDEXES.items()}
+
+# Fields read and the weight of their words
+TEXT_FIELDS = {'heading': 3, 'meta_keywords': 2, 'small_description': 1, 'content': 1}
+# Terms stored per item, and the strongest of them used to find similar items
+STORED_TERMS = 64
+MATCH_TERMS = 24
+# Terms shared by more items than this are skipped when looking for
+# candidates; their weight is low anyway and they would make it quadratic
+MAX_POSTINGS = 1000
+
+WORD_RE = re.compile(r'[^\W_]{2,}')
+STOP_WORDS = frozenset('''
+    about after all also an and any are as at be been but by can do does for
+    from has have how if in into is it its more most no not of on or our out
+    over so such than that the their them then there these they this to up
+    us was we were what when which who why will with you your
+'''.split())
+
+
+def item_terms(instance):
+    """Weighted word counts of ``instance``, the most frequent ``STORED_TERMS``."""
+    counts = Counter()
+    for field, weight in TEXT_FIELDS.items():
+        text = plain_text(getattr(instance, field))
+        for word in WORD_RE.findall(text.lower()):
+            if word not in STOP_WORDS:
+                counts[word] += weight
+    return dict(counts.most_common(STORED_TERMS))
+
+
+class RelatednessIndex:
+    """
+    TF-IDF vectors of all items of a kind, with an inverted index to score
+    an item against the items it shares terms with.
+
+    ``vectors`` maps pk to term counts; ``items`` lists ``(pk, parent_id)``
+    in display order.
+    """
+    def __init__(self, vectors, items):
+        self.set_items(items)
+        self.vectors = {pk: terms for pk, terms in vectors.items() if pk in self.parents}
+        self.frequencies = Counter(term for terms in self.vectors.values() for term in terms)
+        self.weights = {}
+        self.postings = defaultdict(dict)
+        for pk in self.vectors:
+            self._weigh(pk)
+
+    def set_items(self, items):
+        """Set the display order of the items, ``(pk, parent_id)``."""
+        self.parents = dict(items)
+        self.position = {pk: position for position, (pk, _) in enumerate(items)}
+        self.children = defaultdict(list)
+        for pk, parent in items:
+            self.children[parent].append(pk)
+        for pk in [pk for pk in getattr(self, 'vectors', ()) if pk not in self.parents]:
+            self.update(pk, None)
+
+    def _weigh(self, pk):
+        for term in self.weights.pop(pk, {}):
+            del self.postings[term][pk]
+        terms = self.vectors.get(pk)
+        if not terms:
+            return
+        weights = {
+            term: (1 + math.log(count)) * math.log(len(self.vectors) / self.frequencies[term])
+            for term, count in terms.items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        if not norm:
+            return
+        strongest = sorted(weights.items(), key=lambda item: -item[1])[:MATCH_TERMS]
+        self.weights[pk] = {term: weight / norm for term, weight in strongest if weight}
+        for term, weight in self.weights[pk].items():
+            self.postings[term][pk] = weight
+
+    def update(self, pk, terms):
+        """Index the term counts ``terms`` of ``pk``, or drop it when None."""
+        old = self.vectors.pop(pk, None)
+        if old:
+            self.frequencies.subtract(old.keys())
+        if terms is not None and pk in self.parents:
+            self.vectors[pk] = terms
+            self.frequencies.update(terms.keys())
+        self._weigh(pk)
+
+    def scores(self, pk):
+        """Similarity of ``pk`` to every item it shares a term with."""
+        scores = defaultdict(float)
+        for term, weight in self.weights.get(pk, {}).items():
+            postings = self.postings[term]
+            if len(postings) > MAX_POSTINGS:
+                continue
+            for other, other_weight in postings.items():
+                scores[other] += weight * other_weight
+        scores.pop(pk, None)
+        return scores
+
+    def neighbours(self, pk, limit, scores=None):
+        """
+        The ``limit`` most similar items of the same parent and of other
+        parents, as ``(neighbour, same_parent, rank, score)``.
+        """
+        if scores is None:
+            scores = self.scores(pk)
+        parent = self.parents[pk]
+        groups = {True: [], False: []}
+        for other, score in sorted(scores.items(), key=lambda item: (-item[1], self.position[item[0]])):
+            group = groups[self.parents[other] == parent]
+            if len(group) < limit:
+                group.append((other, score))
+
+        # Padding, in display order
+        for same_parent, candidates in ((True, self.children[parent]), (False, self.position)):
+            group = groups[same_parent]
+            chosen = {other for other, _ in group}
+            for other in candidates:
+                if len(group) >= limit:
+                    break
+                if other != pk and other not in chosen and (self.parents[other] == parent) == same_parent:
+                    group.append((other, 0.0))
+        return [
+            (other, same_parent, rank, round(score, 6))
+            for same_parent, group in groups.items()
+            for rank, (other, score) in enumerate(group)
+        ]
+
+
+def _items(kind):
+    return list(INDEXES[kind][0].objects.order_by('order', 'heading', 'pk').values_list('pk', 'service_category_id'))
+
+
+def load_index(kind, vectors=None):
+    if vectors is None:
+        vectors = dict(TermVector.objects.filter(kind=kind).values_list('object_id', 'terms'))
+    return RelatednessIndex(vectors, _items(kind))
+
+
+# Kind: (term vector state, index) of the index kept by this process
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def _term_state(kind):
+    # Term vectors are replaced, never updated, and their ids never reused:
+    # the count and the last id change with every write
+    state = TermVector.objects.filter(kind=kind).aggregate(count=Count('pk'), last=Max('pk'))
+    return state['count'], state['last']
+
+
+def _index_vectors(kind, pks, existing):
+    """
+    Store the term vectors of ``pks`` and apply them to the index kept by
+    the process, loaded again when the vectors changed elsewhere.
+    """
+    state = _term_state(kind)
+    cached = _indexes.pop(kind, None)
+    if cached is not None and cached[0] == state:
+        index = cached[1]
+        index.set_items(_items(kind))
+    else:
+        index = load_index(kind)
+
+    vectors = {pk: item_terms(instance) for pk, instance in existing.items()}
+    with transaction.atomic():
+        deleted = set(TermVector.objects.filter(kind=kind, object_id__in=pks).values_list('pk', flat=True))
+        TermVector.objects.filter(pk__in=deleted).delete()
+        created = TermVector.objects.bulk_create(
+            TermVector(kind=kind, object_id=pk, terms=terms) for pk, terms in vectors.items()
+        )
+    for pk in pks:
+        index.update(pk, vectors.get(pk))
+
+    # Kept only when no other process wrote meanwhile
+    last = max(vector.pk for vector in created) if created else state[1]
+    if last not in deleted:
+        expected = (state[0] - len(deleted) + len(created), last)
+        if _term_state(kind) == expected:
+            _indexes[kind] = (expected, index)
+    return index
+
+
+def _neighbour_rows(kind, index, pks):
+    neighbour_model, source = INDEXES[kind][1:3]
+    return [
+        neighbour_model(**{'%s_id' % source: pk}, neighbour_id=other, same_parent=same_parent, rank=rank, score=score)
+        for pk in pks
+        for other, same_parent, rank, score in index.neighbours(pk, settings.RELATED_ITEMS)
+    ]
+
+
+def rebuild_related(kind, batch_size=1000):
+    """Index every item of ``kind`` and store all neighbour lists. Returns the number of items."""
+    model, neighbour_model = INDEXES[kind][:2]
+    vectors = {
+        instance.pk: item_terms(instance)
+        for instance in model.objects.only(*TEXT_FIELDS).iterator(chunk_size=batch_size)
+    }
+    index = load_index(kind, vectors)
+    with transaction.atomic():
+        TermVector.objects.filter(kind=kind).delete()
+        TermVector.objects.bulk_create(
+            (TermVector(kind=kind, object_id=pk, terms=terms) for pk, terms in vectors.items()),
+            batch_size=batch_size,
+        )
+        neighbour_model.objects.all().delete()
+        neighbour_model.objects.bulk_create(_neighbour_rows(kind, index, index.position), batch_size=batch_size)
+    return len(index.position)
+
+
+def update_related(kind, pks, refresh=()):
+    """
+    Re-index the items ``pks`` of ``kind`` after they were saved or deleted,
+    then recompute the lists of those items, of the items sharing terms
+    with them and of ``refresh``. Returns the pks whose list changed.
+    """
+    model, neighbour_model, source = INDEXES[kind][:3]
+    pks = set(pks)
+    existing = {instance.pk: instance for instance in model.objects.filter(pk__in=pks).only(*TEXT_FIELDS)}
+    with _index_lock:
+        index = _index_vectors(kind, pks, existing)
+        return _update_neighbours(kind, index, existing, refresh)
+
+
+def _update_neighbours(kind, index, existing, refresh):
+    neighbour_model, source = INDEXES[kind][1:3]
+    candidates = {pk for pk in set(refresh) | set(existing) if pk in index.parents}
+    for pk in existing:
+        candidates.update(index.scores(pk))
+
+    stored = defaultdict(list)
+    for pk, other, same_parent, rank in neighbour_model.objects.filter(
+        **{'%s__in' % source: candidates}
+    ).order_by('same_parent', 'rank').values_list(source, 'neighbour', 'same_parent', 'rank'):
+        stored[pk].append((other, same_parent, rank))
+
+    changed = []
+    for pk in candidates:
+        current = sorted((other, same_parent, rank) for other, same_parent, rank, _ in index.neighbours(pk, settings.RELATED_ITEMS))
+        if current != sorted(stored[pk]):
+            changed.append(pk)
+    with transaction.atomic():
+        neighbour_model.objects.filter(**{'%s__in' % source: changed}).delete()
+        neighbour_model.objects.bulk_create(_neighbour_rows(kind, index, changed))
+    return changed
+
+
+def listing_items(instance):
+    """Pks of the items whose lists show ``instance``."""
+    kind = KINDS[type(instance)]
+    neighbour_model, source = INDEXES[kind][1:3]
+    return list(neighbour_model.objects.filter(neighbour=instance.pk).values_list(source, flat=True))
+
+
+def _update_related(kind, pks, refresh):
+    from .signals import invalidate_content
+
+    changed = update_related(kind, pks, refresh)
+    if changed:
+        invalidate_content({'%s:%s' % (INDEXES[kind][3], pk) for pk in changed})
+
+
+_executor = None
+_pending = {}
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # One thread: updates of a kind run one at a time
+        _executor = ThreadPoolExecutor(max_workers=1)
+    return _executor
+
+
+def _drain(kind):
+    with _lock:
+        pks, refresh = _pending.pop(kind)
+    close_old_connections()
+    try:
+        _update_related(kind, pks, refresh)
+    except Exception:
+        logger.exception('Could not update the related items of %s %s', kind, sorted(pks))
+    finally:
+        close_old_connections()
+
+
+def schedule_related_update(kind, pk, refresh=()):
+    """
+    Queue the update of the index for the saved or deleted item ``pk``;
+    updates queued meanwhile (say the services of a deleted category) are
+    merged into one.
+    """
+    if not settings.RELATED_ITEMS_ASYNC:
+        _update_related(kind, {pk}, refresh)
+        return
+    with _lock:
+        queued = kind in _pending
+        pks, pending_refresh = _pending.setdefault(kind, (set(), set()))
+        pks.add(pk)
+        pending_refresh.update(refresh)
+    if not queued:
+        get_executor().submit(_drain, kind)
@@ -0,0 +1,253 @@
+"""
+Save-time processing of the TinyMCE rich text.
+
+When a page or content block is saved (see ``new.signals``) the HTML of
+each of its ``RICH_TEXT_FIELDS`` is processed once and stored in the
+model's ``rendered`` column, which the templates print instead of the raw
+field:
+
+* sanitized: only the tags and attributes of ``ALLOWED_TAGS`` are kept,
+  scripts and event handlers are dropped, links and sources must use a
+  safe URL scheme and iframes must embed YouTube. Inline styles keep only
+  the declarations of ``STYLE_PROPERTIES`` with plain values (read after
+  decoding CSS escapes), and ids and anchor names get ``ID_PREFIX`` so
+  they cannot clobber the ids of the page around them;
+* images get ``loading="lazy"``, ``decoding="async"`` and, for uploads in
+  ``MEDIA_ROOT``, their intrinsic ``width``/``height``;
+* minified: comments and redundant whitespace are removed, and unclosed
+  tags are closed.
+
+``render_rich_text`` (the command) processes the stored rows in bulk.
+"""
+import html
+import re
+from html.parser import HTMLParser
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousOperation
+from django.core.files.storage import default_storage
+
+from .css import RICH_TEXT_FIELDS
+
+# Tag: attributes allowed on it (besides GLOBAL_ATTRIBUTES)
+ALLOWED_TAGS = {
+    'a': {'href', 'target', 'rel', 'name'},
+    'abbr': set(), 'b': set(), 'blockquote': {'cite'}, 'br': set(), 'caption': set(),
+    'code': set(), 'dd': set(), 'del': set(), 'div': set(), 'dl': set(), 'dt': set(),
+    'em': set(), 'figcaption': set(), 'figure': set(),
+    'h1': set(), 'h2': set(), 'h3': set(), 'h4': set(), 'h5': set(), 'h6': set(),
+    'hr': set(), 'i': set(), 'ins': set(), 'li': {'value'}, 'mark': set(),
+    'ol': {'start', 'type', 'reversed'}, 'p': set(), 'pre': set(), 's': set(),
+    'small': set(), 'span': set(), 'strong': set(), 'sub': set(), 'sup': set(),
+    'table': set(), 'tbody': set(), 'td': {'colspan', 'rowspan'}, 'tfoot': set(),
+    'th': {'colspan', 'rowspan', 'scope'}, 'thead': set(), 'tr': set(), 'u': set(),
+    'ul': set(),
+    'img': {'src', 'alt', 'width', 'height', 'srcset', 'sizes', 'loading', 'decoding'},
+    'iframe': {'src', 'width', 'height', 'title', 'allow', 'allowfullscreen', 'loading', 'referrerpolicy'},
+}
+GLOBAL_ATTRIBUTES = {'class', 'id', 'title', 'lang', 'dir', 'style'}
+# Removed with everything inside them
+DROPPED_TAGS = {'script', 'style', 'template', 'noscript', 'object', 'embed', 'applet', 'form', 'textarea', 'select'}
+VOID_TAGS = {'br', 'hr', 'img'}
+BLOCK_TAGS = {
+    'blockquote', 'caption', 'dd', 'div', 'dl', 'dt', 'figcaption', 'figure',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'li', 'ol', 'p', 'pre', 'table',
+    'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'ul', 'br', 'iframe',
+}
+URL_ATTRIBUTES = {'href', 'src', 'cite'}
+URL_SCHEMES = {'', 'http', 'https', 'mailto', 'tel'}
+IFRAME_HOSTS = {'www.youtube.com', 'youtube.com', 'www.youtube-nocookie.com'}
+# Inline style properties TinyMCE writes (alignment, colours, table and
+# image sizes); any other declaration is dropped
+STYLE_PROPERTIES = {
+    'background-color', 'border', 'border-collapse', 'border-color', 'border-style',
+    'border-width', 'color', 'float', 'font-family', 'font-size', 'font-style',
+    'font-weight', 'height', 'list-style-type', 'margin', 'margin-bottom',
+    'margin-left', 'margin-right', 'margin-top', 'padding', 'padding-left',
+    'padding-right', 'text-align', 'text-decoration', 'vertical-align', 'width',
+}
+# Keywords, lengths, colours, quoted font names and rgb()/hsl() colours: no
+# other function, so no url(), image-set() or expression()
+STYLE_VALUE_RE = re.compile(r'''^(?:[-#\w\s.,%'"!]|(?:rgba?|hsla?)\([\d\s.,%/]*\))*$''', re.IGNORECASE)
+CSS_ESCAPE_RE = re.compile(r'\\(?:([0-9a-fA-F]{1,6})\s?|(.))', re.DOTALL)
+CSS_COMMENT_RE = re.compile(r'/\*.*?(?:\*/|$)', re.DOTALL)
+ID_PREFIX = 'content-'
+ID_ATTRIBUTES = {'id', 'name'}
+
+SPACE_RE = re.compile(r'\s+')
+BLOCK_SPACE_RE = re.compile(r'\s*(</?(?:%s)\b[^>]*>)\s*' % '|'.join(sorted(BLOCK_TAGS)))
+
+
+def _safe_url(value):
+    # Browsers ignore control characters and whitespace inside the scheme
+    scheme = urlsplit(re.sub(r'[\x00-\x20]', '', value)).scheme.lower()
+    return scheme in URL_SCHEMES
+
+
+def _css_unescape(value):
+    def replace(match):
+        if match.group(1):
+            codepoint = int(match.group(1), 16)
+            return chr(codepoint) if 0 < codepoint <= 0x10FFFF else '\ufffd'
+        return '' if match.group(2) == '\n' else match.group(2)
+    return CSS_ESCAPE_RE.sub(replace, value)
+
+
+def safe_style(value):
+    """The declarations of ``value`` allowed by ``STYLE_PROPERTIES``, decoded and re-serialized."""
+    declarations = []
+    for declaration in _css_unescape(CSS_COMMENT_RE.sub('', value)).split(';'):
+        name, colon, style = declaration.partition(':')
+        name, style = name.strip().lower(), style.strip()
+        if colon and name in STYLE_PROPERTIES and style and STYLE_VALUE_RE.match(style):
+            declarations.append('%s: %s' % (name, style))
+    return '; '.join(declarations)
+
+
+def prefixed_id(value):
+    return value if value.startswith(ID_PREFIX) else ID_PREFIX + value
+
+
+def image_size(src):
+    """``(width, height)`` of an image uploaded to MEDIA_ROOT, or None."""
+    if not src.startswith(settings.MEDIA_URL):
+        return None
+    from PIL import Image
+
+    name = unquote(urlsplit(src).path[len(settings.MEDIA_URL):])
+    try:
+        with default_storage.open(name) as f, Image.open(f) as image:
+            return image.size
+    except (OSError, ValueError, SyntaxError, SuspiciousOperation):
+        # Unreadable, not an image, or a name outside MEDIA_ROOT
+        return None
+
+
+class RichTextRenderer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.output = []
+        self.open_tags = []
+        self.dropping = None
+        self.preformatted = 0
+
+    def _attributes(self, tag, attrs):
+        allowed = ALLOWED_TAGS[tag] | GLOBAL_ATTRIBUTES
+        result = {}
+        for name, value in attrs:
+            value = '' if value is None else value
+            if name not in allowed:
+                continue
+            if name in URL_ATTRIBUTES and not _safe_url(value):
+                continue
+            if name == 'style':
+                value = safe_style(value)
+                if not value:
+                    continue
+            elif name in ID_ATTRIBUTES:
+                value = value.strip()
+                if not value:
+                    continue
+                value = prefixed_id(value)
+            elif name == 'href' and value.strip().startswith('#') and len(value.strip()) > 1:
+                # In-page anchors follow the prefixed ids
+                value = '#' + prefixed_id(value.strip()[1:])
+            result[name] = value.strip() if name != 'alt' else value
+        if tag == 'a' and result.get('target') == '_blank':
+            result['rel'] = 'noopener noreferrer'
+        if tag == 'img':
+            result.setdefault('alt', '')
+            result.setdefault('loading', 'lazy')
+            result.setdefault('decoding', 'async')
+            if 'src' in result and not ('width' in result and 'height' in result):
+                size = image_size(result['src'])
+                if size:
+                    result['width'], result['height'] = map(str, size)
+        if tag == 'iframe':
+            result.setdefault('loading', 'lazy')
+        return result
+
+    def _start(self, tag, attrs):
+        if tag == 'iframe' and urlsplit(dict(attrs).get('src') or '').hostname not in IFRAME_HOSTS:
+            return None
+        attributes = self._attributes(tag, attrs)
+        if tag == 'img' and 'src' not in attributes:
+            return None
+        return '<%s%s>' % (tag, ''.join(
+            ' %s' % name if name == 'allowfullscreen' else ' %s="%s"' % (name, html.escape(value))
+            for name, value in attributes.items()
+        ))
+
+    def handle_starttag(self, tag, attrs):
+        if self.dropping:
+            return
+        if tag in DROPPED_TAGS:
+            self.dropping = tag
+            return
+        if tag not in ALLOWED_TAGS:
+            return
+        markup = self._start(tag, attrs)
+        if markup is None:
+            if tag not in VOID_TAGS:
+                self.dropping = tag
+            return
+        self.output.append(markup)
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+            if tag == 'pre':
+                self.preformatted += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.dropping:
+            if tag == self.dropping:
+                self.dropping = None
+            return
+        if tag not in self.open_tags:
+            return
+        # Close what was left open inside it
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.output.append('</%s>' % open_tag)
+            if open_tag == 'pre':
+                self.preformatted -= 1
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        text = html.escape(data, quote=False)
+        self.output.append(text if self.preformatted else SPACE_RE.sub(' ', text))
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.output.append('</%s>' % self.open_tags.pop())
+        return ''.join(self.output)
+
+
+def render_rich_text(value):
+    """Sanitized, minified HTML of ``value`` with lazy, sized images."""
+    if not value:
+        return ''
+    renderer = RichTextRenderer()
+    renderer.feed(value)
+    markup = renderer.close()
+    if '<pre' in markup:
+        return markup.strip()
+    return BLOCK_SPACE_RE.sub(r'\1', markup).strip()
+
+
+def rich_text_fields(model):
+    return [field.attname for field in model._meta.concrete_fields if field.attname in RICH_TEXT_FIELDS]
+
+
+def rendered_fields(instance):
+    """The ``rendered`` column of ``instance``: its processed rich text by field."""
+    return {name: render_rich_text(getattr(instance, name)) for name in rich_text_fields(type(instance))}
@@ -0,0 +1,199 @@
+"""
+Site search over an SQLite FTS5 table (``new_search``, see migration 0010).
+
+One row per category, service and variant page: the heading, and the
+plain text of the short description, content, meta keywords and content
+blocks. Rows are keyed by ``rowid = pk * 3 + kind``, so updating or
+removing the row of a page is a primary key lookup; saving or deleting a
+page or one of its blocks re-indexes the page in the same transaction
+(see ``new.signals``). ``rebuild_search_index`` indexes everything in bulk.
+
+Results are ranked by BM25 with the heading weighted above the body, and
+come with a highlighted snippet of the body.
+"""
+import html
+import re
+
+from django.db import connection, connections, router, transaction
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import (
+    ServiceCategory, ServiceCategoryContent, Service, ServiceContent,
+    ServiceVariant, ServiceVariantContent, PageSnapshot
+)
+
+SEARCH_TABLE = 'new_search'
+
+# Kind: (rowid offset, page model, content block model, its page field)
+PAGES = {
+    PageSnapshot.SERVICE_CATEGORY: (0, ServiceCategory, ServiceCategoryContent, 'service_category'),
+    PageSnapshot.SERVICE: (1, Service, ServiceContent, 'service'),
+    PageSnapshot.SERVICE_VARIANT: (2, ServiceVariant, ServiceVariantContent, 'service_variant'),
+}
+KINDS = {model: kind for kind, (offset, model, *rest) in PAGES.items()}
+BLOCK_KINDS = {block_model: kind for kind, (offset, model, block_model, field) in PAGES.items()}
+TEXT_FIELDS = ('small_description', 'content', 'meta_keywords')
+
+# bm25() weights of the slug, kind, heading and body columns, stored as
+# the table's rank function so FTS5 returns the matches best first without
+# a separate sort (see migration 0013 and rebuild_index)
+RANK_WEIGHTS = (0.0, 0.0, 10.0, 1.0)
+RANK_FUNCTION = 'bm25(%s)' % ', '.join(str(weight) for weight in RANK_WEIGHTS)
+SNIPPET_TOKENS = 24
+# Private use characters around the matches in a snippet, replaced by
+# <mark> once the snippet is escaped
+MARK_START, MARK_END = '\ue000', '\ue001'
+
+TAG_RE = re.compile(r'<[^>]*>')
+SPACE_RE = re.compile(r'\s+')
+QUERY_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def plain_text(value):
+    """Text of the HTML ``value``, tags dropped and entities decoded."""
+    return SPACE_RE.sub(' ', html.unescape(TAG_RE.sub(' ', value or ''))).strip()
+
+
+def _rowid(kind, pk):
+    return pk * len(PAGES) + PAGES[kind][0]
+
+
+def _rows(kind, pks=None, batch_size=1000):
+    """Yield the search rows of the pages ``pks`` of ``kind`` (all when None)."""
+    offset, model, block_model, field = PAGES[kind]
+    pages = model.objects.only('slug', 'heading', *TEXT_FIELDS).order_by('pk')
+    if pks is not None:
+        pages = pages.filter(pk__in=pks)
+    batch = []
+    for page in pages.iterator(chunk_size=batch_size):
+        batch.append(page)
+        if len(batch) == batch_size:
+            yield from _page_rows(kind, batch)
+            batch = []
+    yield from _page_rows(kind, batch)
+
+
+def _page_rows(kind, pages):
+    if not pages:
+        return
+    offset, model, block_model, field = PAGES[kind]
+    blocks = {}
+    for page_id, content in block_model.objects.filter(
+        **{'%s__in' % field: pages}
+    ).order_by('pk').values_list(field, 'content'):
+        blocks.setdefault(page_id, []).append(content)
+    for page in pages:
+        body = ' '.join(
+            plain_text(text)
+            for text in [*(getattr(page, name) for name in TEXT_FIELDS), *blocks.get(page.pk, [])]
+        )
+        yield _rowid(kind, page.pk), page.slug, kind, page.heading, body
+
+
+def index_pages(kind, pks):
+    """Index (again) the pages ``pks`` of ``kind``; pages that are gone are removed."""
+    pks = set(pks)
+    rows = list(_rows(kind, pks))
+    remove_pages(kind, pks - {row[0] // len(PAGES) for row in rows})
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT OR REPLACE INTO %s (rowid, slug, kind, heading, body) VALUES (%%s, %%s, %%s, %%s, %%s)' % SEARCH_TABLE,
+            rows,
+        )
+
+
+def remove_pages(kind, pks):
+    if not pks:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            'DELETE FROM %s WHERE rowid = %%s' % SEARCH_TABLE,
+            [(_rowid(kind, pk),) for pk in pks],
+        )
+
+
+def rebuild_index(batch_size=1000):
+    """Index every page from scratch. Returns the number of pages per kind."""
+    counts = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % SEARCH_TABLE)
+        for kind in PAGES:
+            counts[kind] = 0
+            rows = _rows(kind, batch_size=batch_size)
+            while True:
+                batch = [row for _, row in zip(range(batch_size), rows)]
+                if not batch:
+                    break
+                cursor.executemany(
+                    'INSERT INTO %s (rowid, slug, kind, heading, body) VALUES (%%s, %%s, %%s, %%s, %%s)' % SEARCH_TABLE,
+                    batch,
+                )
+                counts[kind] += len(batch)
+        cursor.execute(
+            "INSERT INTO %s (%s, rank) VALUES ('rank', %%s)" % (SEARCH_TABLE, SEARCH_TABLE), [RANK_FUNCTION]
+        )
+        # Merge the b-trees written by the batches
+        cursor.execute("INSERT INTO %s (%s) VALUES ('optimize')" % (SEARCH_TABLE, SEARCH_TABLE))
+    return counts
+
+
+def is_indexed(kind, using='default'):
+    """
+    Whether the index holds pages of ``kind``: false before the migrations
+    or ``rebuild_search_index`` filled it, or on a database without FTS5.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if SEARCH_TABLE not in connection.introspection.table_names(cursor):
+            return False
+        cursor.execute('SELECT 1 FROM %s WHERE kind = %%s LIMIT 1' % SEARCH_TABLE, [kind])
+        return cursor.fetchone() is not None
+
+
+def match_expression(query):
+    """
+    FTS5 query of the words in ``query``: all of them, the last one as a
+    prefix (search as you type). Empty when ``query`` has no words.
+    """
+    words = QUERY_WORD_RE.findall(query.lower())
+    if not words:
+        return ''
+    terms = ['"%s"' % word for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _snippet(value):
+    return mark_safe(escape(value).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def search(query, limit=20, offset=0):
+    """
+    Pages matching ``query``, best first, as dicts with ``kind``, ``slug``,
+    ``heading`` and ``snippet`` (safe HTML).
+    """
+    expression = match_expression(query)
+    if not expression:
+        return []
+    # Routed like the page reads (see new/db.py)
+    with connections[router.db_for_read(PageSnapshot)].cursor() as cursor:
+        cursor.execute(
+            'SELECT kind, slug, heading, snippet({table}, 3, %s, %s, %s, %s) FROM {table} '
+            'WHERE {table} MATCH %s ORDER BY rank LIMIT %s OFFSET %s'.format(table=SEARCH_TABLE),
+            [MARK_START, MARK_END, '…', SNIPPET_TOKENS, expression, limit, offset],
+        )
+        return [
+            {'kind': kind, 'slug': slug, 'heading': heading, 'snippet': _snippet(snippet)}
+            for kind, slug, heading, snippet in cursor.fetchall()
+        ]
+
+
+def count(query):
+    """Number of pages matching ``query``."""
+    expression = match_expression(query)
+    if not expression:
+        return 0
+    with connections[router.db_for_read(PageSnapshot)].cursor() as cursor:
+        cursor.execute('SELECT count(*) FROM {table} WHERE {table} MATCH %s'.format(table=SEARCH_TABLE), [expression])
+        return cursor.fetchone()[0]
@@ -0,0 +1,141 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+
+from .cache import NAVIGATION_TAG, NAVIGATION_TREE_TAG, SITE_TAGS, content_tags, bump_tags
+from .images import schedule_renditions
+from .navigation import NAVIGATION_FIELDS, navigation_changed, tree_changed
+from .richtext import rendered_fields, rich_text_fields
+from .related import KINDS, listing_items, schedule_related_update
+from .search import BLOCK_KINDS, PAGES, KINDS as SEARCH_KINDS, index_pages
+from .snapshots import invalidate_snapshots
+from .structured_data import KINDS as PAGE_KINDS, refresh_descendants, stale_descendants, structured_data
+from .uploads import IMAGE_FIELDS, image_names, update_references
+from .video import prepare_video
+from .models import (
+    Home, AlternateHome, About, ServiceCategory, ServiceCategoryContent,
+    Service, ServiceContent, ServiceVariant, ServiceVariantContent
+)
+
+CONTENT_MODELS = (
+    Home, AlternateHome, About, ServiceCategory, ServiceCategoryContent,
+    Service, ServiceContent, ServiceVariant, ServiceVariantContent,
+)
+
+
+def remember_content_tags(sender, instance, **kwargs):
+    # The row as it is in the database, so that moving an object to another
+    # parent also evicts (and re-indexes) the pages of the old parent.
+    stored = None
+    if instance.pk is not None:
+        stored = sender._default_manager.filter(pk=instance.pk).first()
+    instance._stored_row = stored
+    instance._stored_content_tags = content_tags(stored) if stored is not None else set()
+
+
+def render_rich_text(sender, instance, **kwargs):
+    instance.rendered = rendered_fields(instance)
+
+
+def serialize_structured_data(sender, instance, **kwargs):
+    instance.structured_data = structured_data(instance)
+
+
+def refresh_structured_data(sender, instance, **kwargs):
+    # The breadcrumbs, provider and organization of other pages show this one
+    querysets = stale_descendants(instance, getattr(instance, '_stored_row', None))
+    if querysets and refresh_descendants(instance, querysets):
+        if sender is Home:
+            transaction.on_commit(lambda: invalidate_content(SITE_TAGS))
+
+
+def prepare_video_embed(sender, instance, **kwargs):
+    prepare_video(instance)
+
+
+def invalidate_dependent_pages(sender, instance, **kwargs):
+    tags = getattr(instance, '_stored_content_tags', set())
+    if kwargs.get('signal') is post_save:
+        tags = tags | content_tags(instance)
+    # Every page shows the menu: only bumped when the menu changes, the
+    # tree of the processes on any change of it
+    if sender in NAVIGATION_FIELDS:
+        stored = getattr(instance, '_stored_row', None)
+        saved = kwargs.get('signal') is post_save
+        if not saved or tree_changed(instance, stored):
+            tags = tags | {NAVIGATION_TREE_TAG}
+        if sender is not ServiceVariant and (not saved or navigation_changed(instance, stored)):
+            tags = tags | {NAVIGATION_TAG}
+    transaction.on_commit(lambda: invalidate_content(tags))
+
+
+def build_image_renditions(sender, instance, **kwargs):
+    transaction.on_commit(lambda: schedule_renditions(instance))
+
+
+def count_file_references(sender, instance, **kwargs):
+    # The files of the row as it was are released, those of the new one held
+    delta = image_names(instance)
+    if kwargs.get('signal') is post_save:
+        stored = getattr(instance, '_stored_row', None)
+        if stored is not None:
+            delta.subtract(image_names(stored))
+    else:
+        delta = {name: -count for name, count in delta.items()}
+    update_references(delta)
+
+
+def update_search_index(sender, instance, **kwargs):
+    # In the same transaction as the change itself
+    if sender in SEARCH_KINDS:
+        index_pages(SEARCH_KINDS[sender], [instance.pk])
+        return
+    kind = BLOCK_KINDS[sender]
+    field = '%s_id' % PAGES[kind][3]
+    pages = {getattr(instance, field), getattr(getattr(instance, '_stored_row', None), field, None)}
+    index_pages(kind, pages - {None})
+
+
+def remember_listing_items(sender, instance, **kwargs):
+    # The neighbour rows pointing at it are gone with the cascade
+    instance._listing_items = listing_items(instance)
+
+
+def update_related_items(sender, instance, **kwargs):
+    kind, pk = KINDS[sender], instance.pk
+    refresh = getattr(instance, '_listing_items', ())
+    transaction.on_commit(lambda: schedule_related_update(kind, pk, refresh))
+
+
+# Connected per model: receivers without a sender would disable the fast
+# (single query) deletes of every other model, snapshots included.
+for model in CONTENT_MODELS:
+    pre_save.connect(remember_content_tags, sender=model)
+    pre_delete.connect(remember_content_tags, sender=model)
+    post_save.connect(invalidate_dependent_pages, sender=model)
+    post_delete.connect(invalidate_dependent_pages, sender=model)
+    if hasattr(model, 'image_d'):
+        post_save.connect(build_image_renditions, sender=model)
+    if model in IMAGE_FIELDS:
+        post_save.connect(count_file_references, sender=model)
+        post_delete.connect(count_file_references, sender=model)
+    if rich_text_fields(model):
+        pre_save.connect(render_rich_text, sender=model)
+    if hasattr(model, 'youtube_video_embed'):
+        pre_save.connect(prepare_video_embed, sender=model)
+    if model._meta.model_name in PAGE_KINDS:
+        pre_save.connect(serialize_structured_data, sender=model)
+        post_save.connect(refresh_structured_data, sender=model)
+
+for model in [*SEARCH_KINDS, *BLOCK_KINDS]:
+    post_save.connect(update_search_index, sender=model)
+    post_delete.connect(update_search_index, sender=model)
+
+for model in KINDS:
+    pre_delete.connect(remember_listing_items, sender=model)
+    post_save.connect(update_related_items, sender=model)
+    post_delete.connect(update_related_items, sender=model)
+
+
+def invalidate_content(tags):
+    invalidate_snapshots(tags)
+    bump_tags(tags)
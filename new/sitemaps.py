@@ -0,0 +1,233 @@
+"""
+sitemap.xml for the public pages.
+
+The sitemaps are ``django.contrib.sitemaps`` classes, but instead of being
+rendered per request they are streamed (``values()`` + ``iterator()``) into
+files under ``SITEMAP_ROOT``, split into shards of ``Sitemap.limit`` URLs
+with a sitemap index once the site outgrows a single file, and gzipped next
+to the plain files. The files are only written again after a content change
+(the ``CONTENT_TAG`` page-cache version moved), so crawlers get them from
+disk. The URLs are those of ``SITE_URL``, whatever host the sitemap was
+requested from.
+
+``lastmod`` is when the content of the page last changed: the
+``modified_at`` of its render snapshot (the latest ``updated_at`` of the
+rows it shows, kept while rebuilds leave the page identical), or the
+``updated_at`` of the page itself when that is later, as it is for an
+edit the snapshot is not rebuilt for yet. Rebuilds alone, say after
+``rebuild_related_items`` evicted every service page, leave it unchanged.
+"""
+import gzip
+import json
+import os
+from html import escape
+
+from django.conf import settings
+from django.contrib.sitemaps import Sitemap
+from django.db.models import OuterRef, QuerySet, Subquery
+
+from .cache import content_version, get_page_cache
+from .models import Home, About, PageSnapshot, ServiceCategory, Service, ServiceVariant
+from .snapshots import page_path
+
+STATE_FILE = 'sitemap.json'
+LOCK_KEY = 'sitemap-lock'
+
+
+class PageSitemap(Sitemap):
+    kind = None
+    model = None
+    changefreq = 'weekly'
+
+    def items(self):
+        snapshots = PageSnapshot.objects.filter(kind=self.kind, slug=OuterRef('slug'))
+        return self.model.objects.order_by('pk').values('slug', 'updated_at').annotate(
+            modified_at=Subquery(snapshots.values('modified_at')[:1]),
+        )
+
+    def count(self):
+        return self.model.objects.count()
+
+    def location(self, item):
+        return page_path(self.kind, item['slug'])
+
+    def lastmod(self, item):
+        return max((date for date in (item['modified_at'], item['updated_at']) if date is not None), default=None)
+
+
+class StaticPageSitemap(PageSitemap):
+    models = {PageSnapshot.HOME: Home, PageSnapshot.ABOUT: About}
+    priority = 1.0
+
+    def items(self):
+        modified = dict(PageSnapshot.objects.filter(
+            kind__in=self.models, slug='',
+        ).values_list('kind', 'modified_at'))
+        return [
+            {
+                'kind': kind,
+                'modified_at': modified.get(kind),
+                'updated_at': model.objects.order_by('pk').values_list('updated_at', flat=True).first(),
+            }
+            for kind, model in self.models.items()
+        ]
+
+    def count(self):
+        return len(self.models)
+
+    def location(self, item):
+        return page_path(item['kind'])
+
+
+class ServiceCategorySitemap(PageSitemap):
+    kind = PageSnapshot.SERVICE_CATEGORY
+    model = ServiceCategory
+    priority = 0.8
+
+
+class ServiceSitemap(PageSitemap):
+    kind = PageSnapshot.SERVICE
+    model = Service
+    priority = 0.7
+
+
+class ServiceVariantSitemap(PageSitemap):
+    kind = PageSnapshot.SERVICE_VARIANT
+    model = ServiceVariant
+    priority = 0.6
+
+
+SITEMAPS = {
+    'pages': StaticPageSitemap,
+    'categories': ServiceCategorySitemap,
+    'services': ServiceSitemap,
+    'variants': ServiceVariantSitemap,
+}
+
+
+def shard_name(section, page):
+    return 'sitemap-%s-%s.xml' % (section, page)
+
+
+def _write(root, name, chunks):
+    """Write ``chunks`` to ``name`` and ``name.gz`` in one pass, atomically."""
+    filename = os.path.join(root, name)
+    temp = '%s.%s.tmp' % (filename, os.getpid())
+    with open(temp, 'w', encoding='utf-8') as plain, gzip.open(temp + '.gz', 'wt', encoding='utf-8') as packed:
+        for chunk in chunks:
+            plain.write(chunk)
+            packed.write(chunk)
+    os.replace(temp, filename)
+    os.replace(temp + '.gz', filename + '.gz')
+
+
+def _url_entry(sitemap, item, base_url):
+    entry = '<url><loc>%s%s</loc>' % (escape(base_url), escape(sitemap.location(item)))
+    lastmod = sitemap.lastmod(item)
+    if lastmod:
+        entry += '<lastmod>%s</lastmod>' % lastmod.date().isoformat()
+    return entry + '<changefreq>%s</changefreq><priority>%s</priority></url>\n' % (
+        sitemap.changefreq, sitemap.priority,
+    )
+
+
+def _shards(sitemap, base_url):
+    """Yield ``(entries, lastmod)`` per ``sitemap.limit`` URLs of ``sitemap``."""
+    items = sitemap.items()
+    if isinstance(items, QuerySet):
+        items = items.iterator(chunk_size=2000)
+    entries, lastmod = [], None
+    for item in items:
+        entries.append(_url_entry(sitemap, item, base_url))
+        item_lastmod = sitemap.lastmod(item)
+        if item_lastmod and (lastmod is None or item_lastmod > lastmod):
+            lastmod = item_lastmod
+        if len(entries) == sitemap.limit:
+            yield entries, lastmod
+            entries, lastmod = [], None
+    if entries:
+        yield entries, lastmod
+
+
+def _urlset(entries):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    yield from entries
+    yield '</urlset>\n'
+
+
+def write_sitemaps(root, base_url):
+    """
+    Write the sitemap files of the site served from ``base_url`` into
+    ``root``. ``sitemap.xml`` is the only urlset while all URLs fit into
+    one file, otherwise it is an index of per-section shards.
+    """
+    os.makedirs(root, exist_ok=True)
+    sitemaps = {section: sitemap_class() for section, sitemap_class in SITEMAPS.items()}
+    names = {'sitemap.xml', STATE_FILE}
+
+    if sum(sitemap.count() for sitemap in sitemaps.values()) <= Sitemap.limit:
+        _write(root, 'sitemap.xml', _urlset(
+            entry
+            for sitemap in sitemaps.values()
+            for entries, lastmod in _shards(sitemap, base_url)
+            for entry in entries
+        ))
+    else:
+        shards = []
+        for section, sitemap in sitemaps.items():
+            for page, (entries, lastmod) in enumerate(_shards(sitemap, base_url), 1):
+                name = shard_name(section, page)
+                _write(root, name, _urlset(entries))
+                shards.append((name, lastmod))
+                names.add(name)
+
+        def index():
+            yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+            yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+            for name, lastmod in shards:
+                yield '<sitemap><loc>%s/%s</loc>' % (escape(base_url), name)
+                if lastmod:
+                    yield '<lastmod>%s</lastmod>' % lastmod.replace(microsecond=0).isoformat()
+                yield '</sitemap>\n'
+            yield '</sitemapindex>\n'
+        _write(root, 'sitemap.xml', index())
+
+    # Shards of sections that shrank since the last run
+    for name in os.listdir(root):
+        if name.startswith('sitemap') and name.removesuffix('.gz') not in names:
+            os.remove(os.path.join(root, name))
+
+
+def _read_state(root):
+    try:
+        with open(os.path.join(root, STATE_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def ensure_sitemaps():
+    """
+    Regenerate the sitemap files if content changed since they were written
+    (or ``SITE_URL`` did). Returns their directory.
+    """
+    root = str(settings.SITEMAP_ROOT)
+    base_url = settings.SITE_URL.rstrip('/')
+    state = {'version': content_version(), 'base_url': base_url}
+    if _read_state(root) == state:
+        return root
+
+    cache = get_page_cache()
+    # One regeneration at a time; the others keep serving the old files
+    locked = cache.add(LOCK_KEY, True, 300)
+    if not locked and os.path.exists(os.path.join(root, 'sitemap.xml')):
+        return root
+    try:
+        write_sitemaps(root, base_url)
+        with open(os.path.join(root, STATE_FILE), 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+    finally:
+        if locked:
+            cache.delete(LOCK_KEY)
+    return root
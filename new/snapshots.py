@@ -0,0 +1,626 @@
+"""
+Render snapshots: one ``PageSnapshot`` row per published URL holding the
+fully serialized template context of that page.
+
+The public views read a single snapshot row by kind and slug and render it.
+Snapshots are built by the ``build_*`` functions below, which are the only
+place the catalog queries for a page live. Each snapshot records the content
+tags it was built from (the same tags the page cache uses, see
+``new.cache.content_tags``); saving content marks the dependent snapshots as
+stale and they are rebuilt on their next read or by ``rebuild_snapshots``.
+The builders yield their independent querysets in batches, which the async
+views evaluate concurrently (``aget_snapshot``).
+
+Every snapshot also keeps a digest of its context, and the time that digest
+last changed, as the page version behind ETag and Last-Modified. The
+``updated_at`` of every row a page shows is collected while building it
+(and then dropped from the context), so editing a content block or a
+related service moves the Last-Modified of the page.
+
+Every image card also gets a ``card`` key, ``<model>:<id>:<digest of what
+it shows>``: the templates cache the rendered card under it (see
+``templates/partials/card.html``), so a card is rendered once however many
+pages show it, and an edit changes the key instead of invalidating it.
+"""
+import asyncio
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import F
+from django.db.models.fields.files import FieldFile
+from django.http import Http404
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import PAGE_KIND_TAGS
+from .models import (
+    Home, AlternateHome, About, ServiceCategory, ServiceCategoryContent,
+    Service, ServiceContent, ServiceVariant, ServiceVariantContent,
+    ServiceNeighbour, ServiceVariantNeighbour, PageSnapshot, PageSnapshotDependency, ImageRendition
+)
+
+# Fields shown by the image cards (grids, "related" and "other" blocks)
+CARD_FIELDS = ('heading', 'small_description', 'image_m', 'image_t', 'image_d', 'alt', 'slug', 'updated_at')
+CONTENT_BLOCK_FIELDS = (
+    'image_m', 'image_t', 'image_d', 'rendered', 'youtube_video_embed', 'youtube_video_id', 'youtube_poster',
+    'updated_at',
+)
+PAGE_FIELDS = (
+    'heading', 'small_description', 'rendered', 'image_m', 'image_t', 'image_d', 'alt',
+    'title', 'meta_description', 'meta_keywords', 'og_title', 'og_type', 'og_url',
+    'og_description', 'og_image', 'og_site_name', 'slug', 'structured_data', 'updated_at',
+)
+# Parents shown in breadcrumbs and card captions
+PARENT_FIELDS = ('heading', 'slug', 'updated_at')
+# Neighbour rows joined with the card (and parent caption) they show
+NEIGHBOUR_FIELDS = (
+    'same_parent', 'neighbour', *('neighbour__%s' % name for name in CARD_FIELDS),
+    'neighbour__service_category', 'neighbour__service_category__heading',
+    'neighbour__service_category__updated_at',
+)
+
+
+def dump(obj, fields):
+    """Serialize ``fields`` of ``obj`` to JSON-compatible values.
+
+    Files become ``{'url': ..., 'name': ...}`` (or ``None`` when empty) so
+    templates can keep using ``obj.image_d.url``.
+    """
+    if obj is None:
+        return None
+    data = {}
+    for name in fields:
+        value = getattr(obj, name)
+        if isinstance(value, FieldFile):
+            value = {'url': value.url, 'name': value.name} if value else None
+        data[name] = value
+    return data
+
+
+def dump_card(obj, **extra):
+    """``CARD_FIELDS`` of ``obj`` and ``extra``, keyed by ``_version_cards``."""
+    return dict(dump(obj, CARD_FIELDS), card='%s:%s' % (obj._meta.model_name, obj.pk), **extra)
+
+
+def _version_cards(context):
+    """Complete the ``card`` key of each card with a digest of its content, renditions included."""
+    for value in context.values():
+        if isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict) and 'card' in item:
+                    payload = json.dumps(item, sort_keys=True, separators=(',', ':'))
+                    item['card'] += ':' + hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def _all_fields(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def _image_dicts(value):
+    if isinstance(value, dict):
+        if 'url' in value and 'name' in value:
+            yield value
+        else:
+            for key, item in value.items():
+                # Hand-written JSON-LD may contain {"url": ..., "name": ...}
+                if key != 'schema':
+                    yield from _image_dicts(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _image_dicts(item)
+
+
+def _pop_updated_at(value):
+    """Remove every ``updated_at`` from ``value`` and return the latest."""
+    latest = None
+    if isinstance(value, dict):
+        updated_at = value.pop('updated_at', None)
+        if updated_at is not None:
+            latest = updated_at
+        items = (item for key, item in value.items() if key != 'schema')
+    elif isinstance(value, list):
+        items = value
+    else:
+        return None
+    for item in items:
+        found = _pop_updated_at(item)
+        if found is not None and (latest is None or found > latest):
+            latest = found
+    return latest
+
+
+def snapshot_digest(context, tags):
+    payload = json.dumps([context, sorted(tags)], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def modified_at(digest, updated_at, previous=None):
+    """
+    Return when a page with ``digest`` last changed. ``updated_at`` is the
+    latest edit of the rows it shows; when nothing it shows was edited
+    since ``previous`` (``(digest, modified_at)``) but the page still
+    changed, a row was deleted or reordered just now.
+    """
+    if previous is not None and previous[1] is not None:
+        previous_digest, previous_modified = previous
+        if digest == previous_digest:
+            return previous_modified
+        if updated_at is None or updated_at <= previous_modified:
+            return timezone.now()
+    return updated_at or timezone.now()
+
+
+def _attach_renditions(images, renditions):
+    """
+    Add ``renditions`` (ordered by source, format and width, the order of
+    their unique index) to the image dicts ``images``, as
+    ``{'renditions': {format: [[url, width], ...]}, 'width': ...,
+    'height': ...}`` (size of the largest rendition).
+    """
+    by_source = {}
+    for rendition in renditions:
+        by_source.setdefault(rendition.source, []).append(rendition)
+    for image in images:
+        image['renditions'] = {}
+        for rendition in by_source.get(image['name'], []):
+            image['renditions'].setdefault(rendition.format, []).append([rendition.file.url, rendition.width])
+            if rendition.width >= image.get('width', 0):
+                image['width'], image['height'] = rendition.width, rendition.height
+
+
+def _first(rows, model):
+    if not rows:
+        raise Http404('No %s matches the given query.' % model._meta.object_name)
+    return rows[0]
+
+
+# The builders below are generators: each ``yield`` hands a batch of
+# independent querysets to the driver (``run_queries`` or
+# ``arun_queries``) and receives their rows as ``{name: [obj, ...]}``, so
+# the same code serves the sync views and the async ones, which evaluate
+# a batch concurrently.
+
+def run_queries(steps):
+    """Evaluate the query batches of ``steps`` one queryset at a time."""
+    results = None
+    while True:
+        try:
+            querysets = steps.send(results)
+        except StopIteration as stop:
+            return stop.value
+        results = {name: list(queryset) for name, queryset in querysets.items()}
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def arun_queries(steps):
+    """Evaluate the query batches of ``steps`` with the async ORM, each batch concurrently."""
+    results = None
+    while True:
+        try:
+            querysets = steps.send(results)
+        except StopIteration as stop:
+            return stop.value
+        rows = await asyncio.gather(*(_alist(queryset) for queryset in querysets.values()))
+        results = dict(zip(querysets, rows))
+
+
+def page_steps(kind, slug=''):
+    """
+    Build the template context and content tags of a page, and the latest
+    ``updated_at`` of the rows in it; the responsive renditions of every
+    image are fetched with a single query.
+    """
+    context, tags = yield from BUILDERS[kind](slug)
+    updated_at = _pop_updated_at(context)
+    images = list(_image_dicts(context))
+    if images:
+        results = yield {
+            'renditions': ImageRendition.objects.filter(
+                source__in={image['name'] for image in images}
+            ).order_by('source', 'format', 'width'),
+        }
+        _attach_renditions(images, results['renditions'])
+    _version_cards(context)
+    return context, tags, updated_at
+
+
+def build_page(kind, slug=''):
+    return run_queries(page_steps(kind, slug))
+
+
+async def abuild_page(kind, slug=''):
+    return await arun_queries(page_steps(kind, slug))
+
+
+def build_home(slug=''):
+    results = yield {
+        'home': Home.objects.order_by('pk')[:1],
+        # Get services to display on homepage (limit to 3 for grid layout)
+        'services': ServiceCategory.objects.only(*CARD_FIELDS)[:3],
+    }
+    home = results['home'][0] if results['home'] else None
+    alternate_home = (yield {
+        'alternate_home': AlternateHome.objects.filter(home=home).only('href_lang', 'link', 'updated_at'),
+    })['alternate_home']
+    context = {
+        'home': dump(home, _all_fields(Home)),
+        'alternate_home': [dump(alt, ('href_lang', 'link', 'updated_at')) for alt in alternate_home],
+        'services': [dump_card(service) for service in results['services']],
+    }
+    return context, ['home', 'categories', 'services']
+
+
+def build_about(slug=''):
+    about = (yield {'about': About.objects.order_by('pk')[:1]})['about']
+    return {'about': dump(about[0] if about else None, _all_fields(About))}, ['about']
+
+
+def build_service_category(slug):
+    service_category = _first((yield {
+        'service_category': ServiceCategory.objects.only(*PAGE_FIELDS).filter(slug=slug)[:1],
+    })['service_category'], ServiceCategory)
+
+    results = yield {
+        # Services belonging to this category (ordered by order field)
+        'services': Service.objects.filter(
+            service_category=service_category
+        ).only(*CARD_FIELDS, 'order').order_by('order', 'heading'),
+        # Variants of the services in this category; they come from
+        # several services, so no index has them in display order and they
+        # are sorted below instead of in a temporary b-tree
+        'service_variants': ServiceVariant.objects.filter(
+            service_category__service_category=service_category
+        ).select_related('service_category').only(
+            *CARD_FIELDS, 'order', *('service_category__%s' % name for name in PARENT_FIELDS)
+        ).order_by(),
+        'service_category_contents': ServiceCategoryContent.objects.filter(
+            service_category=service_category
+        ).only(*CONTENT_BLOCK_FIELDS),
+        # Related service categories (excluding current one)
+        'related_categories': ServiceCategory.objects.exclude(
+            id=service_category.id
+        ).only(*CARD_FIELDS)[:3],
+    }
+
+    context = {
+        'service_category': dump(service_category, PAGE_FIELDS),
+        'services': [dump_card(service) for service in results['services']],
+        'service_variants': [
+            dump_card(variant, service_category=dump(variant.service_category, PARENT_FIELDS))
+            for variant in sorted(results['service_variants'], key=lambda variant: (variant.order, variant.heading))
+        ],
+        'service_category_contents': [
+            dump(block, CONTENT_BLOCK_FIELDS) for block in results['service_category_contents']
+        ],
+        'related_categories': [dump_card(category) for category in results['related_categories']],
+    }
+    # Services and variants of this category bump its tag when saved
+    tags = [
+        'category:%s' % service_category.id,
+        PAGE_KIND_TAGS[PageSnapshot.SERVICE_CATEGORY],
+        *('category:%s' % category.id for category in results['related_categories']),
+    ]
+    if len(results['related_categories']) < 3:
+        # A new category would join the list
+        tags.append('categories')
+    return context, tags
+
+
+def build_service(slug):
+    service = _first((yield {
+        'service': Service.objects.select_related('service_category').only(
+            *PAGE_FIELDS, *('service_category__%s' % name for name in PARENT_FIELDS)
+        ).filter(slug=slug)[:1],
+    })['service'], Service)
+
+    results = yield {
+        'service_contents': ServiceContent.objects.filter(
+            service=service
+        ).only(*CONTENT_BLOCK_FIELDS),
+        'service_variants': ServiceVariant.objects.filter(
+            service_category=service
+        ).only(*CARD_FIELDS, 'order').order_by('order', 'heading'),
+        # Related services from the same category and other services from
+        # different categories, precomputed by new/related.py
+        'neighbours': ServiceNeighbour.objects.filter(
+            service=service
+        ).select_related('neighbour__service_category').only(*NEIGHBOUR_FIELDS).order_by('rank'),
+    }
+
+    context = {
+        'service': dict(
+            dump(service, PAGE_FIELDS),
+            service_category=dump(service.service_category, PARENT_FIELDS),
+        ),
+        'service_contents': [dump(block, CONTENT_BLOCK_FIELDS) for block in results['service_contents']],
+        'service_variants': [dump_card(variant) for variant in results['service_variants']],
+        'related_services': [
+            dump_card(row.neighbour) for row in results['neighbours'] if row.same_parent
+        ],
+        'other_services': [
+            dump_card(row.neighbour, service_category=dump(row.neighbour.service_category, ('heading', 'updated_at')))
+            for row in results['neighbours'] if not row.same_parent
+        ],
+    }
+    # The neighbours and the categories captioning them; new/related.py
+    # bumps the tag of a service whose list changes
+    tags = [
+        'service:%s' % service.id,
+        'category:%s' % service.service_category_id,
+        PAGE_KIND_TAGS[PageSnapshot.SERVICE],
+        *('service:%s' % row.neighbour_id for row in results['neighbours']),
+        *('category:%s' % row.neighbour.service_category_id for row in results['neighbours'] if not row.same_parent),
+    ]
+    return context, list(dict.fromkeys(tags))
+
+
+def build_service_variant(slug):
+    service_variant = _first((yield {
+        'service_variant': ServiceVariant.objects.select_related('service_category__service_category').only(
+            *PAGE_FIELDS, 'canonical_url',
+            *('service_category__%s' % name for name in PARENT_FIELDS),
+            *('service_category__service_category__%s' % name for name in PARENT_FIELDS)
+        ).filter(slug=slug)[:1],
+    })['service_variant'], ServiceVariant)
+    service = service_variant.service_category
+
+    results = yield {
+        'service_variant_contents': ServiceVariantContent.objects.filter(
+            service_variant=service_variant
+        ).only(*CONTENT_BLOCK_FIELDS),
+        # Related variants from the same service and other variants from
+        # different services, precomputed by new/related.py
+        'neighbours': ServiceVariantNeighbour.objects.filter(
+            service_variant=service_variant
+        ).select_related('neighbour__service_category').only(*NEIGHBOUR_FIELDS).order_by('rank'),
+    }
+
+    context = {
+        'service_variant': dict(
+            dump(service_variant, PAGE_FIELDS + ('canonical_url',)),
+            service_category=dict(
+                dump(service, PARENT_FIELDS),
+                service_category=dump(service.service_category, PARENT_FIELDS),
+            ),
+        ),
+        'service_variant_contents': [
+            dump(block, CONTENT_BLOCK_FIELDS) for block in results['service_variant_contents']
+        ],
+        'related_variants': [
+            dump_card(row.neighbour) for row in results['neighbours'] if row.same_parent
+        ],
+        'other_variants': [
+            dump_card(row.neighbour, service_category=dump(row.neighbour.service_category, ('heading', 'updated_at')))
+            for row in results['neighbours'] if not row.same_parent
+        ],
+    }
+    # The neighbours and the services captioning them; new/related.py
+    # bumps the tag of a variant whose list changes
+    tags = [
+        'variant:%s' % service_variant.id,
+        'service:%s' % service.id,
+        'category:%s' % service.service_category_id,
+        PAGE_KIND_TAGS[PageSnapshot.SERVICE_VARIANT],
+        *('variant:%s' % row.neighbour_id for row in results['neighbours']),
+        *('service:%s' % row.neighbour.service_category_id for row in results['neighbours'] if not row.same_parent),
+    ]
+    return context, list(dict.fromkeys(tags))
+
+
+BUILDERS = {
+    PageSnapshot.HOME: build_home,
+    PageSnapshot.ABOUT: build_about,
+    PageSnapshot.SERVICE_CATEGORY: build_service_category,
+    PageSnapshot.SERVICE: build_service,
+    PageSnapshot.SERVICE_VARIANT: build_service_variant,
+}
+
+URL_NAMES = {
+    PageSnapshot.HOME: 'home',
+    PageSnapshot.ABOUT: 'about',
+    PageSnapshot.SERVICE_CATEGORY: 'service_category_detail',
+    PageSnapshot.SERVICE: 'service_detail',
+    PageSnapshot.SERVICE_VARIANT: 'service_variant_detail',
+}
+
+
+PAGE_TEMPLATES = {
+    PageSnapshot.HOME: 'index.html',
+    PageSnapshot.ABOUT: 'about.html',
+    PageSnapshot.SERVICE_CATEGORY: 'service_category_detail.html',
+    PageSnapshot.SERVICE: 'service_detail.html',
+    PageSnapshot.SERVICE_VARIANT: 'service_variant_detail.html',
+}
+
+
+def page_path(kind, slug=''):
+    if slug:
+        return reverse(URL_NAMES[kind], args=[slug])
+    return reverse(URL_NAMES[kind])
+
+
+def published_pages():
+    """Yield ``(kind, slug)`` for every public URL of the site."""
+    yield PageSnapshot.HOME, ''
+    yield PageSnapshot.ABOUT, ''
+    for kind, model in (
+        (PageSnapshot.SERVICE_CATEGORY, ServiceCategory),
+        (PageSnapshot.SERVICE, Service),
+        (PageSnapshot.SERVICE_VARIANT, ServiceVariant),
+    ):
+        for slug in model.objects.order_by('pk').values_list('slug', flat=True).iterator():
+            yield kind, slug
+
+
+def _placeholder(kind, slug):
+    # The first build of a page stores a stale row without a digest first:
+    # its generation tells whether content was saved during the build. A
+    # row inserted meanwhile is kept; assuming generation 0 for it at worst
+    # leaves the page stale for the next request.
+    placeholder = PageSnapshot(kind=kind, slug=slug, path=page_path(kind, slug), context={}, stale=True, digest='')
+    PageSnapshot.objects.bulk_create(
+        [placeholder], update_conflicts=True, unique_fields=['kind', 'slug'], update_fields=['path'],
+    )
+    return placeholder
+
+
+def build_snapshot(kind, slug='', previous=None):
+    """
+    Build the snapshot of one page and store it.
+
+    ``previous`` is only overwritten if nobody invalidated it while the page
+    was being built; otherwise it stays stale. Without ``previous`` a stale
+    placeholder row is stored first and plays its part.
+    """
+    if previous is None:
+        previous = _placeholder(kind, slug)
+    try:
+        page = build_page(kind, slug)
+    except Http404:
+        PageSnapshot.objects.filter(kind=kind, slug=slug).delete()
+        raise
+    return save_snapshot(kind, slug, page, previous)
+
+
+def save_snapshot(kind, slug, page, previous=None):
+    """Store ``page`` (as returned by ``build_page``), see ``build_snapshot``."""
+    context, tags, updated_at = page
+    digest = snapshot_digest(context, tags)
+
+    with transaction.atomic():
+        if previous is None:
+            snapshot = PageSnapshot(
+                kind=kind, slug=slug, path=page_path(kind, slug),
+                context=context, tags=tags, stale=False, digest=digest,
+                modified_at=modified_at(digest, updated_at),
+            )
+            # Upsert: another request may have built it in the meantime
+            PageSnapshot.objects.bulk_create(
+                [snapshot],
+                update_conflicts=True,
+                unique_fields=['kind', 'slug'],
+                update_fields=['path', 'context', 'tags', 'stale', 'built_at', 'digest', 'modified_at'],
+            )
+        else:
+            snapshot = previous
+            # A placeholder has no dependencies yet
+            placeholder = not previous.digest
+            changes = {
+                'context': context,
+                'tags': tags,
+                'digest': digest,
+                'modified_at': modified_at(digest, updated_at, (previous.digest, previous.modified_at)),
+            }
+            updated = PageSnapshot.objects.filter(
+                pk=previous.pk, generation=previous.generation
+            ).update(stale=False, built_at=timezone.now(), **changes)
+            for name, value in changes.items():
+                setattr(snapshot, name, value)
+            if not updated:
+                return snapshot
+            snapshot.stale = False
+            if not placeholder:
+                snapshot.dependencies.all().delete()
+        PageSnapshotDependency.objects.bulk_create(
+            PageSnapshotDependency(snapshot=snapshot, tag=tag) for tag in tags
+        )
+    return snapshot
+
+
+async def abuild_snapshot(kind, slug='', previous=None):
+    """``build_snapshot`` with the page queries run by ``arun_queries``."""
+    if previous is None:
+        previous = await sync_to_async(_placeholder)(kind, slug)
+    try:
+        page = await abuild_page(kind, slug)
+    except Http404:
+        await PageSnapshot.objects.filter(kind=kind, slug=slug).adelete()
+        raise
+    # The write needs a transaction, which the async ORM cannot open
+    return await sync_to_async(save_snapshot)(kind, slug, page, previous)
+
+
+def _snapshots(kind, slug):
+    return PageSnapshot.objects.filter(kind=kind, slug=slug).only(
+        'context', 'tags', 'stale', 'generation', 'digest', 'modified_at'
+    )
+
+
+def get_snapshot(kind, slug=''):
+    """Return the snapshot of a page, building it if missing or stale."""
+    snapshot = _snapshots(kind, slug).first()
+    if snapshot is None or snapshot.stale:
+        snapshot = build_snapshot(kind, slug, previous=snapshot)
+    return snapshot
+
+
+async def aget_snapshot(kind, slug=''):
+    snapshot = await _snapshots(kind, slug).afirst()
+    if snapshot is None or snapshot.stale:
+        snapshot = await abuild_snapshot(kind, slug, previous=snapshot)
+    return snapshot
+
+
+def invalidate_snapshots(tags):
+    """
+    Mark every snapshot built from one of ``tags`` as stale, and the
+    placeholders of first builds, whose tags are not known yet.
+    """
+    PageSnapshot.objects.filter(
+        dependencies__tag__in=list(tags)
+    ).update(stale=True, generation=F('generation') + 1)
+    PageSnapshot.objects.filter(digest='').update(generation=F('generation') + 1)
+
+
+def store_snapshots(pages):
+    """
+    Build and upsert the snapshots of ``pages`` (``(kind, slug)`` pairs) in
+    one bulk write. Returns the number of snapshots stored.
+    """
+    built = {}
+    for kind, slug in pages:
+        try:
+            built[kind, slug] = build_page(kind, slug)
+        except Http404:
+            PageSnapshot.objects.filter(kind=kind, slug=slug).delete()
+    if not built:
+        return 0
+
+    def existing(*fields):
+        rows = {}
+        for kind in {kind for kind, _ in built}:
+            for slug, *values in PageSnapshot.objects.filter(
+                kind=kind, slug__in=[slug for k, slug in built if k == kind]
+            ).values_list('slug', *fields):
+                rows[kind, slug] = values[0] if len(values) == 1 else tuple(values)
+        return rows
+
+    with transaction.atomic():
+        previous = existing('digest', 'modified_at')
+        snapshots = []
+        for (kind, slug), (context, tags, updated_at) in built.items():
+            digest = snapshot_digest(context, tags)
+            snapshots.append(PageSnapshot(
+                kind=kind, slug=slug, path=page_path(kind, slug),
+                context=context, tags=tags, stale=False, digest=digest,
+                modified_at=modified_at(digest, updated_at, previous.get((kind, slug))),
+            ))
+        PageSnapshot.objects.bulk_create(
+            snapshots,
+            update_conflicts=True,
+            unique_fields=['kind', 'slug'],
+            update_fields=['path', 'context', 'tags', 'stale', 'built_at', 'digest', 'modified_at'],
+        )
+        snapshot_ids = existing('pk')
+        PageSnapshotDependency.objects.filter(snapshot_id__in=snapshot_ids.values()).delete()
+        PageSnapshotDependency.objects.bulk_create(
+            PageSnapshotDependency(snapshot_id=snapshot_ids[page], tag=tag)
+            for page, (context, tags, updated_at) in built.items()
+            for tag in tags
+        )
+    return len(built)
@@ -0,0 +1,119 @@
+"""
+Storage of the collected static files and of the uploaded images.
+
+``collectstatic`` stores every file under a content-hashed name
+(``tinymce/tinymce.4f2c....min.js``) next to the original, rewrites the
+references between CSS and JS files to the hashed names, and then writes
+the ``.gz``/``.br`` siblings of every text file in ``STATIC_COMPRESS_WORKERS``
+processes (see ``new.compression``). ``{% static %}`` links the hashed
+names, which nginx can serve with ``expires max;`` and
+``gzip_static``/``brotli_static``. Files loaded by unhashed relative URLs,
+such as the TinyMCE plugins, keep working through the originals.
+Outside DEBUG a name missing from the manifest raises (``manifest_strict``)
+rather than linking an original that would be cached forever. Each process
+keeps the manifest it loaded, so a missing name first reloads the manifest
+if ``collectstatic`` rewrote it since: ``build_css`` collects its new
+stylesheet before publishing it, and the running workers pick it up
+without a restart.
+
+The image fields of the content models store their uploads with
+``ContentAddressedStorage``: under the SHA-256 of their bytes, so an image
+uploaded twice (or as both the desktop and the mobile image) is stored
+once. The files are shared; ``new.uploads`` counts their references and
+``collect_media_garbage`` removes the ones nothing references any more.
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, storages
+from django.utils.crypto import get_random_string
+
+from .compression import compress_job, get_pool, is_compressible
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def load_manifest(self):
+        # Read before the content: a rewrite in between reloads it again
+        self.manifest_mtime = self._manifest_mtime()
+        return super().load_manifest()
+
+    def _manifest_mtime(self):
+        try:
+            return self.manifest_storage.get_modified_time(self.manifest_name)
+        except (OSError, NotImplementedError):
+            return None
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            if self._manifest_mtime() == self.manifest_mtime:
+                raise
+            self.hashed_files, self.manifest_hash = self.load_manifest()
+            return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if isinstance(processed, Exception):
+                return
+            names.add(name)
+            if hashed_name:
+                names.add(hashed_name)
+        if dry_run:
+            return
+
+        filenames = sorted(self.path(name) for name in names if is_compressible(name))
+        with get_pool(settings.STATIC_COMPRESS_WORKERS) as pool:
+            for filename, encodings, error in pool.map(compress_job, filenames, chunksize=16):
+                if error:
+                    yield filename, None, OSError('Cannot compress %s: %s' % (filename, error))
+                    return
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Names every saved file by its content, in sharded directories:
+    ``uploads/3f/a2/3fa2...c9.webp``. Saving bytes that are stored already
+    returns the existing name. Names never get a random suffix, and the
+    bytes behind a name never change (see new/media.py).
+    """
+    prefix = 'uploads'
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return '%s/%s/%s/%s%s' % (self.prefix, digest[:2], digest[2:4], digest, extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        try:
+            # Fresh again for the grace period of the garbage collector,
+            # which may be about to remove it as unreferenced
+            os.utime(self.path(name))
+            return name
+        except FileNotFoundError:
+            return super().save(name, content, max_length)
+
+    def _save(self, name, content):
+        # Written aside and renamed: a concurrent save of the same bytes
+        # replaces the file with identical content instead of failing
+        temp = super()._save('%s.%s.tmp' % (name, get_random_string(8)), content)
+        os.replace(self.path(temp), self.path(name))
+        return name
+
+
+def upload_storage():
+    """Storage of the image fields (the ``uploads`` alias of ``STORAGES``)."""
+    return storages['uploads']
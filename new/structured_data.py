@@ -0,0 +1,259 @@
+"""
+Save-time JSON-LD of the public pages.
+
+Every page stores its structured data in its ``structured_data`` column,
+serialized once when the page is saved (see ``new.signals``), which the
+templates print as is:
+
+* the home and about pages describe the ``Organization``;
+* category, service and variant pages describe the ``Service`` it
+  provides, and the ``BreadcrumbList`` of the category → service → variant
+  hierarchy.
+
+The hand-written ``schema`` of a page is merged over the generated nodes:
+a manual node overrides the keys of the generated node sharing one of its
+``@type``s, and other manual nodes are added to the ``@graph``.
+
+The breadcrumbs and the provider show the headings and slugs of the
+ancestors of a page, and the about page the full Organization of the
+home, so saving a home, category or service that changes them serializes
+the pages showing them again (``stale_descendants``).
+"""
+import json
+from functools import lru_cache
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.utils.html import strip_tags
+
+from .models import Home, About, ServiceCategory, Service, ServiceVariant, PageSnapshot
+from .snapshots import page_path
+
+KINDS = {
+    'home': PageSnapshot.HOME,
+    'about': PageSnapshot.ABOUT,
+    'servicecategory': PageSnapshot.SERVICE_CATEGORY,
+    'service': PageSnapshot.SERVICE,
+    'servicevariant': PageSnapshot.SERVICE_VARIANT,
+}
+# Fields of a page shown by the structured data of every page below it
+ANCESTOR_FIELDS = {
+    # The provider name, organization()
+    'home': ('title', 'og_site_name'),
+    'servicecategory': ('heading', 'slug', 'home_id'),
+    'service': ('heading', 'slug', 'service_category_id'),
+}
+# Fields of the home shown by the full Organization of the about page,
+# organization(full=True)
+ORGANIZATION_FIELDS = ANCESTOR_FIELDS['home'] + ('meta_description', 'og_image')
+# Relations followed to the ancestors of a page, fetched with it in bulk
+ANCESTORS = {
+    'servicecategory': 'home',
+    'service': 'service_category__home',
+    'servicevariant': 'service_category__service_category__home',
+}
+BATCH_SIZE = 500
+
+# As in json_script: the JSON cannot close the <script> element
+JSON_ESCAPES = {ord('<'): '\\u003C', ord('>'): '\\u003E', ord('&'): '\\u0026'}
+
+
+def absolute_url(url):
+    if url.startswith('/') and not url.startswith('//'):
+        return settings.SITE_URL.rstrip('/') + url
+    return urljoin(settings.SITE_URL.rstrip('/') + '/', url)
+
+
+@lru_cache(maxsize=4096)
+def _page_path(kind, slug):
+    # The ancestors recur in every page below them
+    return page_path(kind, slug)
+
+
+def page_url(page):
+    return getattr(page, 'canonical_url', None) or absolute_url(_page_path(KINDS[page._meta.model_name], page.slug))
+
+
+def trail(page):
+    """The category, service and variant pages down to ``page``."""
+    kind = page._meta.model_name
+    if kind == 'servicevariant':
+        return [page.service_category.service_category, page.service_category, page]
+    if kind == 'service':
+        return [page.service_category, page]
+    if kind == 'servicecategory':
+        return [page]
+    return []
+
+
+def site_home(page):
+    kind = page._meta.model_name
+    if kind == 'home':
+        return page
+    pages = trail(page)
+    if pages:
+        return pages[0].home
+    return Home.objects.order_by('pk').first()
+
+
+def organization(home, full=False):
+    node = {
+        '@type': 'Organization',
+        '@id': absolute_url('/#organization'),
+        'name': (home.og_site_name or home.title) if home is not None else '',
+        'url': absolute_url('/'),
+    }
+    if full and home is not None:
+        node['description'] = home.meta_description
+        if home.og_image:
+            node['image'] = absolute_url(home.og_image)
+    return node
+
+
+def breadcrumbs(pages):
+    items = [('Home', absolute_url('/'))] + [(page.heading, page_url(page)) for page in pages]
+    return {
+        '@type': 'BreadcrumbList',
+        'itemListElement': [
+            {'@type': 'ListItem', 'position': position, 'name': name, 'item': url}
+            for position, (name, url) in enumerate(items, 1)
+        ],
+    }
+
+
+def service_node(page, pages, home):
+    url = page_url(page)
+    node = {
+        '@type': 'Service',
+        '@id': url + '#service',
+        'name': page.heading,
+        'description': page.meta_description or strip_tags(page.small_description).strip(),
+        'url': url,
+        'provider': organization(home),
+    }
+    if len(pages) > 1:
+        # The service a variant belongs to, the category of a service
+        node['serviceType'] = pages[-2].heading
+    if page.image_d:
+        node['image'] = absolute_url(page.image_d.url)
+    elif page.og_image:
+        node['image'] = absolute_url(page.og_image)
+    return node
+
+
+def _types(node):
+    types = node.get('@type', [])
+    return {types} if isinstance(types, str) else set(types)
+
+
+def _manual_nodes(schema):
+    if isinstance(schema, str):
+        try:
+            schema = json.loads(schema)
+        except ValueError:
+            return []
+    if isinstance(schema, dict):
+        schema = schema['@graph'] if isinstance(schema.get('@graph'), list) else [schema]
+    if not isinstance(schema, list):
+        return []
+    return [
+        {key: value for key, value in node.items() if key != '@context'}
+        for node in schema if isinstance(node, dict) and node
+    ]
+
+
+def _override(node, manual):
+    for key, value in manual.items():
+        if isinstance(value, dict) and isinstance(node.get(key), dict):
+            _override(node[key], value)
+        else:
+            node[key] = value
+
+
+def merge(graph, schema):
+    """Merge the hand-written JSON-LD ``schema`` over the nodes of ``graph``."""
+    for manual in _manual_nodes(schema):
+        node = next((node for node in graph if _types(node) & _types(manual)), None)
+        if node is None:
+            graph.append(manual)
+        else:
+            _override(node, manual)
+    return graph
+
+
+def structured_data(page):
+    """The JSON-LD of ``page``, serialized for a ``<script type="application/ld+json">``."""
+    home = site_home(page)
+    pages = trail(page)
+    if pages:
+        graph = [service_node(page, pages, home), breadcrumbs(pages)]
+    else:
+        graph = [organization(home, full=True)]
+    graph = merge(graph, page.schema)
+    data = {'@context': 'https://schema.org', '@graph': graph}
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).translate(JSON_ESCAPES)
+
+
+def _changed(page, stored, fields):
+    return stored is not None and any(getattr(page, field) != getattr(stored, field) for field in fields)
+
+
+def ancestors_changed(page, stored):
+    """Whether saving ``page`` over ``stored`` changes what the pages below it show."""
+    return _changed(page, stored, ANCESTOR_FIELDS.get(page._meta.model_name, ()))
+
+
+def refresh(queryset):
+    """Serialize the structured data of the pages of ``queryset`` again; returns the rows changed."""
+    related = ANCESTORS.get(queryset.model._meta.model_name)
+    if related:
+        queryset = queryset.select_related(related)
+    rows = []
+    for page in queryset.iterator(chunk_size=BATCH_SIZE):
+        data = structured_data(page)
+        if data != page.structured_data:
+            page.structured_data = data
+            rows.append(page)
+    # bulk_update sends no signals and keeps updated_at
+    queryset.model._default_manager.bulk_update(rows, ['structured_data'], batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def descendants(page):
+    """Querysets of the pages whose structured data shows ``page``."""
+    kind = page._meta.model_name
+    if kind == 'home':
+        return [
+            About.objects.all(),
+            ServiceCategory.objects.filter(home=page),
+            Service.objects.filter(service_category__home=page),
+            ServiceVariant.objects.filter(service_category__service_category__home=page),
+        ]
+    if kind == 'servicecategory':
+        return [
+            Service.objects.filter(service_category=page),
+            ServiceVariant.objects.filter(service_category__service_category=page),
+        ]
+    if kind == 'service':
+        return [ServiceVariant.objects.filter(service_category=page)]
+    return []
+
+
+def stale_descendants(page, stored):
+    """Querysets of the pages whose structured data saving ``page`` over ``stored`` changes."""
+    if ancestors_changed(page, stored):
+        return descendants(page)
+    if page._meta.model_name == 'home' and _changed(page, stored, ORGANIZATION_FIELDS):
+        return [About.objects.all()]
+    return []
+
+
+def refresh_descendants(page, querysets=None):
+    """Serialize the pages below ``page`` (or ``querysets``) again; returns the rows changed."""
+    if querysets is None:
+        querysets = descendants(page)
+    return sum(refresh(queryset) for queryset in querysets)
+
+
+def refresh_all():
+    return sum(refresh(model.objects.all()) for model in (Home, About, ServiceCategory, Service, ServiceVariant))
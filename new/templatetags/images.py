@@ -0,0 +1,82 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from new.imaging import MIME_TYPES
+
+register = template.Library()
+
+# Art-directed roles of the three image fields, smallest first
+MEDIA_QUERIES = (
+    ('image_m', '(max-width: 640px)'),
+    ('image_t', '(max-width: 1024px)'),
+    ('image_d', None),
+)
+
+# ``sizes`` of the two layouts the templates use
+SIZES = {
+    'full': '100vw',
+    'card': '(max-width: 768px) 100vw, (max-width: 1024px) 50vw, 33vw',
+}
+
+
+def _get(obj, name):
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def _url(image):
+    return image['url'] if isinstance(image, dict) else image.url
+
+
+@register.simple_tag
+def picture(obj, alt='', img_class='', sizes='full', loading='lazy'):
+    """
+    Render the ``<picture>`` of an object with ``image_m``/``image_t``/
+    ``image_d``: one ``srcset`` source per rendition format and role, then
+    the uploaded files as fallback. ``obj`` is a snapshot dict or a model.
+
+    Usage::
+
+        {% picture service alt=service.alt img_class="w-full h-full object-cover" sizes="card" %}
+    """
+    master = _get(obj, 'image_d')
+    if not master:
+        return ''
+    sizes = SIZES.get(sizes, sizes)
+
+    sources = []
+    for image_format, mime_type in MIME_TYPES.items():
+        for role, media in MEDIA_QUERIES:
+            # Without its own crop a role is covered by the master source
+            image = _get(obj, role)
+            if not image:
+                continue
+            renditions = image.get('renditions', {}).get(image_format) if isinstance(image, dict) else None
+            if renditions:
+                sources.append((
+                    mime_type,
+                    format_html(' media="{}"', media) if media else '',
+                    ', '.join('%s %sw' % (url, width) for url, width in renditions),
+                    sizes,
+                ))
+    html = format_html_join(
+        '', '<source type="{}"{} srcset="{}" sizes="{}">', sources
+    )
+    # The files as uploaded, for images without renditions yet
+    html += format_html_join(
+        '', '<source media="{}" srcset="{}">',
+        ((media, _url(_get(obj, role))) for role, media in MEDIA_QUERIES[:2] if _get(obj, role)),
+    )
+
+    attrs = ''
+    if isinstance(master, dict) and master.get('width'):
+        attrs = format_html(' width="{}" height="{}"', master['width'], master['height'])
+    if loading == 'eager':
+        attrs += mark_safe(' fetchpriority="high"')
+    html += format_html(
+        '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async"{}>',
+        _url(master), alt, img_class, loading, attrs,
+    )
+    return format_html('<picture>{}</picture>', html)
@@ -0,0 +1,30 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from new.css import get_build
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def tailwind_css(context):
+    """
+    Inline the critical CSS of the page template and load the compiled
+    stylesheet without blocking rendering. Falls back to the Tailwind CDN
+    until ``manage.py build_css`` has run.
+    """
+    build = get_build()
+    if build is None:
+        return mark_safe('<script src="https://cdn.tailwindcss.com"></script>')
+    href = static(build['stylesheet'])
+    critical = build['critical'].get(context.template.origin.template_name)
+    if critical is None:
+        return format_html('<link rel="stylesheet" href="{}">', href)
+    return format_html(
+        '<style>{}</style>'
+        '<link rel="preload" href="{}" as="style" onload="this.onload=null;this.rel=\'stylesheet\'">'
+        '<noscript><link rel="stylesheet" href="{}"></noscript>',
+        mark_safe(critical), href, href,
+    )
@@ -0,0 +1,71 @@
+"""Small sites for the behaviour tests, saved through the ORM so the signals run."""
+from django.conf import settings
+from django.test import override_settings
+
+from ..catalog import page_fields
+from ..models import Home, About, ServiceCategory, Service, ServiceVariant
+
+# The static files are not collected: {% static %} links the originals
+STORAGES = {**settings.STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}}
+
+# Per-process caches and synchronous background work: the tests never
+# touch the file cache of the site, nor leave worker processes behind
+isolated = override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'},
+        'template_fragments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-fragments'},
+    },
+    IMAGE_RENDITIONS_ASYNC=False,
+    RELATED_ITEMS_ASYNC=False,
+    STORAGES=STORAGES,
+)
+
+
+def create_home(**fields):
+    values = dict(
+        title='Home', meta_description='Meta', meta_keywords='seo', heading='Welcome',
+        small_description='<p>Welcome</p>', schema={}, project_completed=100,
+        client_retention=95, no_of_clients=50, years_of_experience=10,
+        og_title='Home', og_type='website', og_url='https://example.com/',
+        og_image='https://example.com/og.jpg', og_description='Home', og_site_name='The One Solution',
+        slug='home',
+    )
+    values.update(fields)
+    return Home.objects.create(**values)
+
+
+def create_about(**fields):
+    values = page_fields('About', 1, 'test', {})
+    values.pop('rendered')
+    values.update(vision='<p>Vision</p>', mission='<p>Mission</p>', **fields)
+    return About.objects.create(**values)
+
+
+def _page(model, name, index, **fields):
+    values = page_fields(name, index, 'test', {})
+    values.pop('rendered')
+    values.update(fields)
+    return model.objects.create(**values)
+
+
+def create_category(home, index=1, **fields):
+    return _page(ServiceCategory, 'Category', index, home=home, **fields)
+
+
+def create_service(category, index=1, **fields):
+    return _page(Service, 'Service', index, service_category=category, **fields)
+
+
+def create_variant(service, index=1, **fields):
+    return _page(ServiceVariant, 'Variant', index, service_category=service, **fields)
+
+
+def create_site():
+    """A home, an about page and a category with a service and a variant."""
+    home = create_home()
+    create_about()
+    category = create_category(home)
+    service = create_service(category)
+    variant = create_variant(service)
+    return home, category, service, variant
+
@@ -0,0 +1,440 @@
+"""
+Benchmarks and query budgets of the public views and the admin changelists.
+
+The suite seeds a catalog of 50 categories, 2,000 services and 20,000
+variants (each with two content blocks, see ``new.catalog``), then requests every view in three
+states:
+
+* ``cold``: no snapshot and no cached page, the page is built from the
+  catalog queries;
+* ``snapshot``: the snapshot exists, the page is rendered from it;
+* ``cached``: served by the page cache.
+
+Each state asserts a query budget, so an N+1 (say on
+``service.service_category``) fails the suite. Latency percentiles, query
+counts and template render times are written as JSON to
+``BENCHMARK_OUTPUT`` (default ``benchmarks/``), one file per run.
+
+``test_async_throughput`` compares the sync and the async public views
+(``ASYNC_PUBLIC_VIEWS``) served through the ASGI handler: requests per
+second with ``BENCHMARK_CONCURRENCY`` requests in flight, rendering from
+snapshots and from the page cache.
+
+``BENCHMARK_SCALE`` shrinks or grows the catalog (``0.1`` for a quick
+run) and ``BENCHMARK_REQUESTS`` sets the samples per view. Seeding the
+catalog takes minutes, so the suite only runs when ``BENCHMARK=1`` or
+``BENCHMARK_SCALE`` is set; it is tagged ``benchmark``, so
+``BENCHMARK=1 manage.py test --tag benchmark`` runs it alone.
+
+``QueryPlanTests`` runs ``EXPLAIN QUERY PLAN`` on every query the public
+views send (building a page, reading its snapshot, rebuilding a stale one)
+against a small catalog, and fails when one reads a whole table or sorts
+in a temporary b-tree: the catalog queries must stay on their indexes.
+
+Both keep the site menu (``new.navigation``) built while they clear the
+page cache: its three whole-table queries run once per menu change, not
+per page.
+"""
+import asyncio
+import json
+import os
+import re
+import statistics
+import time
+import types
+from unittest import skipUnless
+
+from asgiref.sync import async_to_sync
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ..cache import NAVIGATION_TAG, NAVIGATION_TREE_TAG, _tag_key, get_page_cache
+from ..catalog import RICH_TEXT, generate_catalog, page_fields
+from ..models import Home, AlternateHome, About, ServiceCategory, Service, ServiceVariant, PageSnapshot
+from ..navigation import get_navigation
+from ..related import INDEXES, rebuild_related
+from ..snapshots import PAGE_TEMPLATES, get_snapshot, page_path
+from ..urls import public_urlpatterns
+from .pages import STORAGES
+
+RUN_BENCHMARKS = os.environ.get('BENCHMARK') == '1' or 'BENCHMARK_SCALE' in os.environ
+SCALE = float(os.environ.get('BENCHMARK_SCALE', 1))
+CATEGORIES = max(2, int(50 * SCALE))
+SERVICES = max(4, int(2000 * SCALE))
+VARIANTS = max(8, int(20000 * SCALE))
+REQUESTS = int(os.environ.get('BENCHMARK_REQUESTS', 20))
+ADMIN_REQUESTS = max(2, REQUESTS // 4)
+CONCURRENCY = int(os.environ.get('BENCHMARK_CONCURRENCY', 8))
+
+# Queries per request of each view and state. ``cold`` counts the snapshot
+# write, including the savepoint statements of the test transaction.
+QUERY_BUDGETS = {
+    PageSnapshot.HOME: {'cold': 10, 'snapshot': 1, 'cached': 0},
+    PageSnapshot.ABOUT: {'cold': 8, 'snapshot': 1, 'cached': 0},
+    PageSnapshot.SERVICE_CATEGORY: {'cold': 12, 'snapshot': 1, 'cached': 0},
+    PageSnapshot.SERVICE: {'cold': 11, 'snapshot': 1, 'cached': 0},
+    PageSnapshot.SERVICE_VARIANT: {'cold': 10, 'snapshot': 1, 'cached': 0},
+}
+
+# Queries per changelist request, including session and user lookups
+ADMIN_QUERY_BUDGETS = {
+    'home': 5,
+    'about': 5,
+    'servicecategory': 5,
+    'service': 6,
+    'servicevariant': 6,
+}
+# Queries per change form request: the object, its content blocks, the
+# parent shown by the autocomplete and, on the first request, the content
+# type of the model
+ADMIN_CHANGE_FORM_BUDGETS = {
+    'service': 6,
+    'servicevariant': 6,
+}
+
+IMAGES = {field: ['%s/benchmark.jpg' % field] for field in ('image_m', 'image_t', 'image_d')}
+
+
+def seed_catalog(categories=CATEGORIES, services=SERVICES, variants=VARIANTS):
+    home = Home.objects.create(
+        title='Home', meta_description='Meta', meta_keywords='seo', heading='Welcome',
+        small_description='<p>Welcome</p>', schema={}, project_completed=100,
+        client_retention=95, no_of_clients=50, years_of_experience=10,
+        og_title='Home', og_type='website', og_url='https://example.com/',
+        og_image='https://example.com/og.jpg', og_description='Home', og_site_name='The One Solution',
+        slug='home',
+    )
+    AlternateHome.objects.bulk_create(
+        AlternateHome(home=home, href_lang=lang, link='https://example.com/%s/' % lang)
+        for lang in ('en', 'hi')
+    )
+    about = page_fields('About', 1, 'benchmark', IMAGES)
+    about.update(vision=RICH_TEXT, mission=RICH_TEXT)
+    About.objects.create(**about)
+    generate_catalog(
+        home, categories, services // categories, variants // services,
+        blocks_per_page=2, images=IMAGES, prefix='benchmark',
+    )
+    for kind in INDEXES:
+        rebuild_related(kind)
+
+
+def clear_page_cache():
+    """
+    Clear the page cache but keep the version of the site menu: a running
+    site rebuilds the menu once per change, not per cold page.
+    """
+    get_navigation()
+    cache = get_page_cache()
+    versions = cache.get_many([_tag_key(NAVIGATION_TAG), _tag_key(NAVIGATION_TREE_TAG)])
+    cache.clear()
+    cache.set_many(versions, None)
+
+
+def _sample(values, count):
+    """``count`` values spread evenly over ``values``."""
+    step = max(1, len(values) // count)
+    return values[::step][:count]
+
+
+def _summary(samples):
+    """Latency percentiles of ``samples`` (seconds) in milliseconds."""
+    samples = sorted(samples)
+    percentiles = statistics.quantiles(samples, n=100, method='inclusive') if len(samples) > 1 else samples * 99
+    return {
+        'count': len(samples),
+        'mean': round(statistics.fmean(samples) * 1000, 3),
+        'p50': round(percentiles[49] * 1000, 3),
+        'p90': round(percentiles[89] * 1000, 3),
+        'p99': round(percentiles[98] * 1000, 3),
+        'max': round(samples[-1] * 1000, 3),
+    }
+
+
+def public_urlconf(asynchronous):
+    urlconf = types.ModuleType('public_urls')
+    urlconf.urlpatterns = public_urlpatterns(asynchronous)
+    return urlconf
+
+
+@tag('benchmark')
+@skipUnless(RUN_BENCHMARKS, 'set BENCHMARK=1 or BENCHMARK_SCALE to run the benchmarks')
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'},
+        'template_fragments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-fragments'},
+    },
+    IMAGE_RENDITIONS_ASYNC=False,
+    RELATED_ITEMS_ASYNC=False,
+    STORAGES=STORAGES,
+)
+class PublicViewBenchmark(TestCase):
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        started = time.perf_counter()
+        seed_catalog()
+        cls.seed_seconds = time.perf_counter() - started
+        cls.admin = User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if not cls.results:
+            return
+        directory = os.environ.get('BENCHMARK_OUTPUT', os.path.join(settings.BASE_DIR, 'benchmarks'))
+        os.makedirs(directory, exist_ok=True)
+        run = timezone.now()
+        filename = os.path.join(directory, 'benchmark-%s.json' % run.strftime('%Y%m%dT%H%M%S'))
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump({
+                'run': run.isoformat(),
+                'catalog': {'categories': CATEGORIES, 'services': SERVICES, 'variants': VARIANTS},
+                'seed_seconds': round(cls.seed_seconds, 3),
+                'database': connection.vendor,
+                'views': dict(sorted(cls.results.items())),
+            }, f, indent=2)
+
+    def _pages(self, kind):
+        if kind in (PageSnapshot.HOME, PageSnapshot.ABOUT):
+            return [''] * REQUESTS
+        model = {
+            PageSnapshot.SERVICE_CATEGORY: ServiceCategory,
+            PageSnapshot.SERVICE: Service,
+            PageSnapshot.SERVICE_VARIANT: ServiceVariant,
+        }[kind]
+        return _sample(list(model.objects.order_by('pk').values_list('slug', flat=True)), REQUESTS)
+
+    def _request(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.get(path)
+            elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, 200, path)
+        return elapsed, len(queries)
+
+    def _benchmark_view(self, kind):
+        slugs = self._pages(kind)
+        timings = {'cold': [], 'snapshot': [], 'cached': []}
+        queries = {'cold': 0, 'snapshot': 0, 'cached': 0}
+        render = []
+        request = RequestFactory().get('/')
+
+        for slug in slugs:
+            path = page_path(kind, slug)
+            PageSnapshot.objects.filter(kind=kind, slug=slug).delete()
+            clear_page_cache()
+            for state in ('cold', 'snapshot', 'cached'):
+                if state == 'snapshot':
+                    clear_page_cache()
+                elapsed, count = self._request(path)
+                timings[state].append(elapsed)
+                queries[state] = max(queries[state], count)
+
+            context = get_snapshot(kind, slug).context
+            started = time.perf_counter()
+            render_to_string(PAGE_TEMPLATES[kind], context, request=request)
+            render.append(time.perf_counter() - started)
+
+        self.results[kind] = {
+            state: dict(_summary(timings[state]), queries=queries[state])
+            for state in timings
+        }
+        self.results[kind]['render'] = _summary(render)
+        for state, budget in QUERY_BUDGETS[kind].items():
+            self.assertLessEqual(
+                queries[state], budget,
+                '%s (%s) ran %s queries, budget is %s' % (kind, state, queries[state], budget),
+            )
+
+    def test_home(self):
+        self._benchmark_view(PageSnapshot.HOME)
+
+    def test_about(self):
+        self._benchmark_view(PageSnapshot.ABOUT)
+
+    def test_service_category_detail(self):
+        self._benchmark_view(PageSnapshot.SERVICE_CATEGORY)
+
+    def test_service_detail(self):
+        self._benchmark_view(PageSnapshot.SERVICE)
+
+    def test_service_variant_detail(self):
+        self._benchmark_view(PageSnapshot.SERVICE_VARIANT)
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.admin)
+        for model_name, budget in ADMIN_QUERY_BUDGETS.items():
+            path = reverse('admin:new_%s_changelist' % model_name)
+            timings, most = [], 0
+            for _ in range(ADMIN_REQUESTS):
+                elapsed, count = self._request(path)
+                timings.append(elapsed)
+                most = max(most, count)
+            self.results['admin:%s' % model_name] = dict(_summary(timings), queries=most)
+            self.assertLessEqual(
+                most, budget,
+                '%s changelist ran %s queries, budget is %s' % (model_name, most, budget),
+            )
+
+    def test_admin_change_forms(self):
+        self.client.force_login(self.admin)
+        models = {'service': Service, 'servicevariant': ServiceVariant}
+        for model_name, budget in ADMIN_CHANGE_FORM_BUDGETS.items():
+            pks = _sample(list(models[model_name].objects.order_by('pk').values_list('pk', flat=True)), ADMIN_REQUESTS)
+            timings, most = [], 0
+            for pk in pks:
+                elapsed, count = self._request(reverse('admin:new_%s_change' % model_name, args=[pk]))
+                timings.append(elapsed)
+                most = max(most, count)
+            self.results['admin:%s:change' % model_name] = dict(_summary(timings), queries=most)
+            self.assertLessEqual(
+                most, budget,
+                '%s change form ran %s queries, budget is %s' % (model_name, most, budget),
+            )
+
+    async def _throughput(self, paths):
+        """Requests per second of ``paths``, ``CONCURRENCY`` at a time."""
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+
+        async def fetch(path):
+            async with semaphore:
+                return path, (await client.get(path)).status_code
+
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(fetch(path) for path in paths))
+        elapsed = time.perf_counter() - started
+        for path, status in statuses:
+            self.assertEqual(status, 200, path)
+        return round(len(paths) / elapsed, 1)
+
+    def test_async_throughput(self):
+        # Home and about once: concurrent cold builds of a page race each other
+        pages = [(kind, slug) for kind in PAGE_TEMPLATES for slug in set(self._pages(kind))]
+        paths = [page_path(kind, slug) for kind, slug in pages]
+        throughput = {'cold': {}, 'snapshot': {}, 'cached': {}}
+        # Best of three rounds, alternating the modes
+        for _ in range(3):
+            for mode, asynchronous in (('sync', False), ('async', True)):
+                with override_settings(ROOT_URLCONF=public_urlconf(asynchronous)):
+                    PageSnapshot.objects.all().delete()
+                    clear_page_cache()
+                    for state in ('cold', 'snapshot', 'cached'):
+                        if state == 'snapshot':
+                            clear_page_cache()
+                        rate = async_to_sync(self._throughput)(paths)
+                        throughput[state][mode] = max(throughput[state].get(mode, 0), rate)
+        self.results['throughput'] = dict(throughput, concurrency=CONCURRENCY, requests=len(paths))
+
+
+# Statements whose plan is not checked
+UNPLANNED_RE = re.compile(r'^(SAVEPOINT|RELEASE|ROLLBACK|BEGIN|COMMIT)\b')
+# A scan that stops after LIMIT rows (say the first row of a one-row
+# table) reads no more than a lookup would
+LIMIT_RE = re.compile(r'\bLIMIT \d+(?: OFFSET \d+)?$')
+# Scans of the VALUES of an INSERT and of the full-text index
+CONSTANT_SCAN_RE = re.compile(r'CONSTANT ROWS?$|VIRTUAL TABLE')
+
+
+def plan_problems(sql):
+    """Steps of the query plan of ``sql`` that read a whole table or sort."""
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN %s' % sql)
+        details = [row[3] for row in cursor.fetchall()]
+    problems = [detail for detail in details if detail.startswith('USE TEMP B-TREE')]
+    if not LIMIT_RE.search(sql):
+        problems += [
+            detail for detail in details
+            if detail.startswith('SCAN ') and not CONSTANT_SCAN_RE.search(detail)
+        ]
+    return problems
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'query-plans'},
+        'template_fragments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'query-plans-fragments'},
+    },
+    IMAGE_RENDITIONS_ASYNC=False,
+    RELATED_ITEMS_ASYNC=False,
+    STORAGES=STORAGES,
+)
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(categories=3, services=12, variants=48)
+
+    def _assert_plans(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, path)
+        for query in queries.captured_queries:
+            if UNPLANNED_RE.match(query['sql']):
+                continue
+            problems = plan_problems(query['sql'])
+            self.assertFalse(problems, '%s: %s\n%s' % (path, ', '.join(problems), query['sql']))
+
+    def _assert_view_plans(self, kind):
+        model = {
+            PageSnapshot.SERVICE_CATEGORY: ServiceCategory,
+            PageSnapshot.SERVICE: Service,
+            PageSnapshot.SERVICE_VARIANT: ServiceVariant,
+        }.get(kind)
+        slug = model.objects.order_by('pk').values_list('slug', flat=True)[1] if model else ''
+        path = page_path(kind, slug)
+        PageSnapshot.objects.filter(kind=kind, slug=slug).delete()
+        clear_page_cache()
+        # Built from the catalog, read from the snapshot, rebuilt when stale
+        self._assert_plans(path)
+        clear_page_cache()
+        self._assert_plans(path)
+        PageSnapshot.objects.filter(kind=kind, slug=slug).update(stale=True)
+        clear_page_cache()
+        self._assert_plans(path)
+
+    def test_home(self):
+        self._assert_view_plans(PageSnapshot.HOME)
+
+    def test_about(self):
+        self._assert_view_plans(PageSnapshot.ABOUT)
+
+    def test_service_category_detail(self):
+        self._assert_view_plans(PageSnapshot.SERVICE_CATEGORY)
+
+    def test_service_detail(self):
+        self._assert_view_plans(PageSnapshot.SERVICE)
+
+    def test_service_variant_detail(self):
+        self._assert_view_plans(PageSnapshot.SERVICE_VARIANT)
+
+    def test_search(self):
+        self._assert_plans('%s?q=benchmark' % reverse('search'))
+
+    def test_admin_changelists(self):
+        # The rows of a page come from the listing index, without a sort
+        self.client.force_login(User.objects.create_superuser('plans', 'plans@example.com', 'plans'))
+        for model in ('service', 'servicevariant'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('admin:new_%s_changelist' % model))
+            self.assertEqual(response.status_code, 200)
+            # The filters list every parent and order by design, and a
+            # single page of rows is read without a LIMIT: only the sort of
+            # the rows is checked
+            rows = [
+                query['sql'] for query in queries.captured_queries
+                if 'FROM "new_%s"' % model in query['sql']
+                and 'ORDER BY' in query['sql'] and not query['sql'].startswith('SELECT DISTINCT')
+            ]
+            self.assertTrue(rows, model)
+            for sql in rows:
+                sorts = [problem for problem in plan_problems(sql) if problem.startswith('USE TEMP B-TREE')]
+                self.assertFalse(sorts, '%s: %s' % (model, sql))
@@ -0,0 +1,64 @@
+from django.test import TestCase, override_settings
+
+from ..cache import get_page_cache
+from ..models import About, PageSnapshot
+from ..snapshots import page_path
+from .pages import create_site, isolated
+
+
+@isolated
+class PageCacheTests(TestCase):
+    def setUp(self):
+        get_page_cache().clear()
+        self.home, self.category, self.service, self.variant = create_site()
+        self.path = page_path(PageSnapshot.SERVICE, self.service.slug)
+
+    def cached_pages(self):
+        return [key for key in get_page_cache()._cache if ':page:' in key]
+
+    def save(self, page, **fields):
+        for name, value in fields.items():
+            setattr(page, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            page.save()
+
+    def test_pages_are_served_from_the_cache(self):
+        self.assertContains(self.client.get(self.path), self.service.heading)
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(self.path), self.service.heading)
+
+    def test_query_strings_share_the_page(self):
+        self.client.get(self.path)
+        with self.assertNumQueries(0):
+            for query in ('utm_source=mail', 'x=1&y=2', 'page=2'):
+                self.assertEqual(self.client.get('%s?%s' % (self.path, query)).status_code, 200)
+        self.assertEqual(len(self.cached_pages()), 1)
+
+    def test_query_strings_stay_out_of_the_page(self):
+        self.client.get(self.path, {'utm_source': 'evil', 'x': '"hello'})
+        response = self.client.get(self.path)
+        self.assertContains(response, '<meta property="og:url" content="http://testserver%s">' % self.path)
+        self.assertNotContains(response, 'evil')
+
+    @override_settings(PAGE_CACHE_QUERY_PARAMS=('page',))
+    def test_allowed_parameters_are_part_of_the_key(self):
+        self.client.get(self.path)
+        self.client.get(self.path, {'page': 2, 'utm_source': 'mail'})
+        self.client.get(self.path, {'utm_source': 'mail', 'page': 2})
+        self.assertEqual(len(self.cached_pages()), 2)
+
+    def test_saves_invalidate_the_pages_showing_them(self):
+        self.client.get(self.path)
+        self.save(self.service, heading='Edited heading')
+        self.assertContains(self.client.get(self.path), 'Edited heading')
+
+    def test_parent_saves_invalidate_the_pages_below(self):
+        self.client.get(self.path)
+        self.save(self.category, heading='Edited category')
+        self.assertContains(self.client.get(self.path), 'Edited category')
+
+    def test_unrelated_saves_keep_the_pages(self):
+        self.client.get(self.path)
+        self.save(About.objects.get(), heading='Edited')
+        with self.assertNumQueries(0):
+            self.client.get(self.path)
@@ -0,0 +1,139 @@
+import json
+import os
+import re
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from ..css import BUILD_MANIFEST, above_the_fold, critical_css, get_build, html_classes, split_rules
+from ..models import PageSnapshot
+from ..snapshots import PAGE_TEMPLATES, page_path
+from ..storage import CompressedManifestStaticFilesStorage
+from .pages import create_site, isolated
+
+CSS = '*,:after{box-sizing:border-box}body{margin:0}.flex{display:flex}.hidden{display:none}%s'
+
+
+def tailwind_cli(css):
+    """``subprocess.run`` of the Tailwind CLI, writing ``css`` as its output."""
+    def run(command, **kwargs):
+        with open(command[command.index('--output') + 1], 'w', encoding='utf-8') as f:
+            f.write(css)
+    return mock.patch('new.management.commands.build_css.subprocess.run', run)
+
+
+class CriticalCssTests(SimpleTestCase):
+    def test_html_classes(self):
+        html = '<div class="flex  md:p-4"><p CLASS=\'w-1/2\'>Text</p><span class=""></span></div>'
+        self.assertEqual(html_classes(html), {'flex', 'md:p-4', 'w-1/2'})
+
+    def test_above_the_fold(self):
+        base = '<nav class="flex"></nav>{% block content %}{% endblock %}<footer></footer>'
+        page = '{% block content %}<section class="hero"></section><section class="below"></section>{% endblock %}'
+        self.assertEqual(above_the_fold(page, base), '<nav class="flex"></nav><section class="hero"></section>')
+        self.assertEqual(above_the_fold('{% block content %}{% endblock %}', base), '<nav class="flex"></nav>')
+
+    def test_split_rules(self):
+        css = '@charset "UTF-8";/* a { } */.a{content:"}"}@media (min-width:768px){.md\\:b{x:y}}'
+        self.assertEqual(split_rules(css), [
+            ('@charset "UTF-8"', None),
+            ('.a', 'content:"}"'),
+            ('@media (min-width:768px)', '.md\\:b{x:y}'),
+        ])
+
+    def test_critical_css(self):
+        css = (
+            '*,:after{box-sizing:border-box}.a,.b{x:1}.a.c{x:2}.w-1\\/2{x:3}'
+            '@media (min-width:768px){.md\\:a{x:4}.b{x:5}}@keyframes spin{to{x:6}}'
+        )
+        self.assertEqual(
+            critical_css(css, {'a', 'w-1/2', 'md:a'}),
+            '*,:after{box-sizing:border-box}.a{x:1}.w-1\\/2{x:3}'
+            '@media (min-width:768px){.md\\:a{x:4}}@keyframes spin{to{x:6}}',
+        )
+
+
+@isolated
+class BuildCssTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.build_dir = os.path.join(directory.name, 'static', 'css')
+        self.static_root = os.path.join(directory.name, 'root')
+        os.makedirs(self.build_dir)
+        overrides = override_settings(
+            STATICFILES_DIRS=[os.path.join(directory.name, 'static')],
+            STATIC_ROOT=self.static_root,
+            STATIC_URL='/static/',
+            STATIC_COMPRESS_WORKERS=1,
+            TAILWIND_BUILD_DIR=self.build_dir,
+            STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': 'new.storage.CompressedManifestStaticFilesStorage'}},
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.home, self.category, self.service, self.variant = create_site()
+
+    def build(self, css=CSS % '', *args):
+        with tailwind_cli(css):
+            call_command('build_css', *args, stdout=StringIO())
+
+    def stylesheet_link(self, path):
+        content = self.client.get(path).content.decode()
+        return re.search(r'href="(/static/css/tailwind\.[^"]+\.css)"', content).group(1)
+
+    def test_pages_link_the_collected_stylesheet(self):
+        path = page_path(PageSnapshot.SERVICE, self.service.slug)
+        self.build()
+        first = self.stylesheet_link(path)
+        self.assertTrue(os.path.exists(os.path.join(self.static_root, first.removeprefix('/static/'))))
+
+        # A worker that loaded the manifest before the next build
+        worker = CompressedManifestStaticFilesStorage()
+        self.build(CSS % '.grid{display:grid}')
+        second = self.stylesheet_link(path)
+        self.assertNotEqual(second, first)
+        self.assertEqual(worker.url(get_build()['stylesheet']), second)
+
+    def manifest(self):
+        with open(os.path.join(self.build_dir, BUILD_MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_build(self):
+        self.service.content = '<p class="grid">Rich text</p>'
+        self.service.save()
+        self.build(CSS % '.grid{display:grid}.unused{display:block}')
+        manifest = self.manifest()
+        stylesheet = manifest['stylesheet']
+        self.assertRegex(stylesheet, r'^css/tailwind\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.build_dir, os.path.basename(stylesheet)), encoding='utf-8') as f:
+            self.assertIn('.unused{display:block}', f.read())
+        self.assertEqual(set(manifest['critical']), set(PAGE_TEMPLATES.values()))
+        for template_name, critical in manifest['critical'].items():
+            with self.subTest(template_name):
+                # Preflight, the navbar and the stored rich text
+                self.assertIn('body{margin:0}', critical)
+                self.assertIn('.flex{display:flex}', critical)
+                self.assertIn('.grid{display:grid}', critical)
+                self.assertNotIn('.unused', critical)
+        self.assertEqual(get_build(), manifest)
+
+    def test_earlier_stylesheets_are_removed(self):
+        self.build()
+        self.build(CSS % '.grid{display:grid}')
+        self.assertEqual(
+            sorted(os.listdir(self.build_dir)),
+            sorted([BUILD_MANIFEST, os.path.basename(self.manifest()['stylesheet'])]),
+        )
+
+    def test_get_build_reloads_changed_manifests(self):
+        self.assertIsNone(get_build())
+        filename = os.path.join(self.build_dir, BUILD_MANIFEST)
+        for version, stylesheet in enumerate(('css/first.css', 'css/second.css')):
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump({'stylesheet': stylesheet, 'critical': {}}, f)
+            os.utime(filename, (version, version))
+            self.assertEqual(get_build()['stylesheet'], stylesheet)
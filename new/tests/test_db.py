@@ -0,0 +1,54 @@
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from ..db import REPLICA, ReplicaRouter, read_from_replica, replica_reads
+from ..models import PageSnapshot, Service
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads(self):
+        self.assertIsNone(self.router.db_for_read(Service))
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Service), REPLICA)
+            # Transactions of default read their own writes
+            with mock.patch.object(connections['default'], 'in_atomic_block', True):
+                self.assertIsNone(self.router.db_for_read(Service))
+        self.assertIsNone(self.router.db_for_read(Service))
+
+    def test_writes(self):
+        self.assertEqual(self.router.db_for_write(Service), 'default')
+        with replica_reads():
+            self.assertEqual(self.router.db_for_write(Service), 'default')
+
+    def test_relations_and_migrations(self):
+        self.assertTrue(self.router.allow_relation(Service(), PageSnapshot()))
+        self.assertTrue(self.router.allow_migrate('default', 'new'))
+        self.assertFalse(self.router.allow_migrate(REPLICA, 'new'))
+
+    def test_reads_after_a_write_stay_on_default(self):
+        aliases = []
+
+        @read_from_replica
+        def view(request):
+            aliases.append(self.router.db_for_read(Service))
+            self.router.db_for_write(PageSnapshot)
+            aliases.append(self.router.db_for_read(Service))
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        view(request)
+        view(request)
+        self.assertEqual(aliases, [REPLICA, None, REPLICA, None])
+
+    async def test_writes_of_worker_threads(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Service), REPLICA)
+            await sync_to_async(self.router.db_for_write)(PageSnapshot)
+            self.assertIsNone(self.router.db_for_read(Service))
@@ -0,0 +1,99 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..export import read_manifest
+from ..models import PageSnapshot
+from ..snapshots import page_path
+from .pages import create_site, isolated
+
+BASE_URL = 'https://www.example.com'
+
+
+class InlinePool:
+    """``get_pool()`` rendering in this process: spawned workers would read the real database."""
+    def __init__(self, max_workers, base_url):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def map(self, fn, jobs, chunksize=1):
+        return map(fn, jobs)
+
+
+@isolated
+@override_settings(ALLOWED_HOSTS=['www.example.com'])
+@mock.patch('new.management.commands.export_static_site.get_pool', InlinePool)
+class ExportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.home, self.category, self.service, self.variant = create_site()
+        self.paths = [
+            page_path(PageSnapshot.HOME),
+            page_path(PageSnapshot.ABOUT),
+            page_path(PageSnapshot.SERVICE_CATEGORY, self.category.slug),
+            page_path(PageSnapshot.SERVICE, self.service.slug),
+            page_path(PageSnapshot.SERVICE_VARIANT, self.variant.slug),
+        ]
+
+    def export(self, *args):
+        stdout = StringIO()
+        call_command('export_static_site', '--output', self.root, '--base-url', BASE_URL + '/', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def page(self, path):
+        with open(os.path.join(self.root, path.strip('/'), 'index.html'), encoding='utf-8') as f:
+            return f.read()
+
+    def save(self, page, **fields):
+        for name, value in fields.items():
+            setattr(page, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            page.save()
+
+    def test_every_page_is_written(self):
+        self.assertIn('5 rendered, 0 unchanged', self.export())
+        for path in self.paths:
+            with self.subTest(path):
+                self.assertIn('<html', self.page(path))
+                self.assertTrue(os.path.exists(os.path.join(self.root, path.strip('/'), 'index.html.gz')))
+        manifest = read_manifest(self.root)
+        self.assertEqual(manifest['base_url'], BASE_URL)
+        self.assertEqual(sorted(manifest['pages']), sorted(self.paths))
+
+    def test_pages_link_the_base_url(self):
+        self.export()
+        path = page_path(PageSnapshot.SERVICE, self.service.slug)
+        content = self.page(path)
+        self.assertIn('<meta property="og:url" content="%s%s">' % (BASE_URL, path), content)
+        self.assertNotIn('testserver', content)
+
+    def test_only_changed_pages_are_rendered_again(self):
+        self.export()
+        self.assertIn('0 rendered, 5 unchanged', self.export())
+
+        self.save(self.variant, heading='Edited variant')
+        output = self.export()
+        self.assertNotIn(' 0 rendered', output)
+        self.assertIn('Edited variant', self.page(page_path(PageSnapshot.SERVICE_VARIANT, self.variant.slug)))
+
+        self.assertIn('5 rendered, 0 unchanged', self.export('--full'))
+
+    def test_deleted_pages_are_removed(self):
+        self.export()
+        path = page_path(PageSnapshot.SERVICE_VARIANT, self.variant.slug)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variant.delete()
+        self.assertIn('1 removed', self.export())
+        self.assertFalse(os.path.exists(os.path.join(self.root, path.strip('/'))))
+        self.assertNotIn(path, read_manifest(self.root)['pages'])
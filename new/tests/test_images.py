@@ -0,0 +1,75 @@
+import tempfile
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from ..images import missing_rendition_jobs, record_renditions
+from ..imaging import encode_renditions
+from ..models import ImageRendition, Service
+
+FORMATS = ['webp']
+WIDTHS = {'image_m': (320, 640), 'image_t': (768,), 'image_d': (1280,)}
+
+
+@override_settings(IMAGE_RENDITION_WIDTHS=WIDTHS)
+class RenditionJobTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(MEDIA_ROOT=directory.name, MEDIA_URL='/media/')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def image(self, width, height=100):
+        data = BytesIO()
+        Image.new('RGB', (width, height), (10, 120, 110)).save(data, 'PNG')
+        return default_storage.save('uploads/image.png', ContentFile(data.getvalue()))
+
+    def jobs(self, instance):
+        return missing_rendition_jobs(instance, FORMATS)
+
+    def encode(self, source, widths, formats=FORMATS, **kwargs):
+        record_renditions(encode_renditions(source, widths, formats), **kwargs)
+
+    def test_new_images_need_every_width(self):
+        source = self.image(2000)
+        self.assertEqual(self.jobs(Service(image_d=source)), [(source, [320, 640, 768, 1280], FORMATS)])
+
+    def test_only_the_missing_widths_are_encoded(self):
+        source = self.image(2000)
+        self.encode(source, [1280])
+        self.assertEqual(self.jobs(Service(image_d=source)), [(source, [320, 640, 768], FORMATS)])
+        self.encode(source, [320, 640, 768])
+        self.assertEqual(self.jobs(Service(image_d=source)), [])
+
+    def test_widths_above_the_original(self):
+        source = self.image(700)
+        self.encode(source, [320, 640, 768, 1280])
+        # 768 and 1280 were encoded at 700
+        self.assertEqual(
+            sorted(ImageRendition.objects.values_list('width', flat=True)), [320, 640, 700],
+        )
+        self.assertEqual(self.jobs(Service(image_d=source)), [])
+
+    def test_missing_formats(self):
+        source = self.image(2000)
+        self.encode(source, [320, 640, 768, 1280])
+        self.assertEqual(
+            missing_rendition_jobs(Service(image_d=source), ['jpeg', 'webp']),
+            [(source, [320, 640, 768, 1280], ['jpeg', 'webp'])],
+        )
+
+    def test_shared_sources_keep_their_other_widths(self):
+        # Stored once for a page needing the desktop widths only...
+        source = self.image(2000)
+        self.encode(source, [1280])
+        # ...then used by one needing the mobile ones too
+        self.encode(source, [320, 640, 768])
+        self.assertEqual(
+            sorted(ImageRendition.objects.values_list('width', flat=True)), [320, 640, 768, 1280],
+        )
+        self.encode(source, [1280], replace=True)
+        self.assertEqual(list(ImageRendition.objects.values_list('width', flat=True)), [1280])
@@ -0,0 +1,107 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from ..media import byte_range
+
+HASHED = 'uploads/ab/cd/%s.mp4' % ('abcd' * 16)
+DATA = bytes(range(100))
+
+
+class ByteRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(byte_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(byte_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(byte_range('bytes=90-200', 100), (90, 99))
+        self.assertEqual(byte_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(byte_range('bytes=-500', 100), (0, 99))
+
+    def test_whole_file(self):
+        for header in ('bytes=-', 'items=0-1', 'bytes=0-1,5-6', 'bytes=9-1'):
+            with self.subTest(header=header):
+                self.assertIsNone(byte_range(header, 100))
+
+    def test_unsatisfiable(self):
+        for header in ('bytes=100-', 'bytes=100-120', 'bytes=-0'):
+            with self.subTest(header=header):
+                with self.assertRaises(ValueError):
+                    byte_range(header, 100)
+
+    def test_empty_files(self):
+        for header in ('bytes=-5', 'bytes=0-', 'bytes=0-10'):
+            with self.subTest(header=header):
+                self.assertIsNone(byte_range(header, 0))
+
+
+class MediaViewTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(MEDIA_ROOT=directory.name, MEDIA_ACCEL=None)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        for name, data in ((HASHED, DATA), ('posters/a.jpg', DATA), ('empty.txt', b'')):
+            path = os.path.join(directory.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+
+    def get(self, name, **headers):
+        return self.client.get(reverse('media', args=[name]), headers=headers)
+
+    def test_whole_file(self):
+        response = self.get(HASHED)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), DATA)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(self.get('posters/a.jpg')['Cache-Control'], 'public, max-age=3600')
+
+    def test_range(self):
+        response = self.get(HASHED, range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(b''.join(response.streaming_content), DATA[10:20])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HASHED, range='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_empty_file(self):
+        response = self.get('empty.txt', range='bytes=-5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+    def test_if_range(self):
+        etag = self.get(HASHED)['ETag']
+        self.assertEqual(self.get(HASHED, range='bytes=0-9', if_range=etag).status_code, 206)
+        self.assertEqual(self.get(HASHED, range='bytes=0-9', if_range='"other"').status_code, 200)
+
+    def test_not_modified(self):
+        etag = self.get(HASHED)['ETag']
+        self.assertEqual(self.get(HASHED, if_none_match=etag).status_code, 304)
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.get('missing.jpg').status_code, 404)
+        self.assertEqual(self.get('posters').status_code, 404)
+        self.assertEqual(self.get('../settings.py').status_code, 400)
+
+    @override_settings(MEDIA_ACCEL='nginx', MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_x_accel_redirect(self):
+        response = self.get(HASHED, range='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + HASHED)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    @override_settings(MEDIA_ACCEL='sendfile')
+    def test_x_sendfile(self):
+        filename = self.get(HASHED)['X-Sendfile']
+        self.assertTrue(os.path.isabs(filename))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), DATA)
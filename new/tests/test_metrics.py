@@ -0,0 +1,46 @@
+import threading
+from contextvars import copy_context
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from ..metrics import RequestTimings, _current, _record_query
+from .pages import create_site, isolated
+
+
+@isolated
+@override_settings(SERVER_TIMING=False)
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        create_site()
+
+    def test_public_responses_have_no_header(self):
+        self.assertNotIn('Server-Timing', self.client.get('/'))
+
+    def test_staff_responses(self):
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        self.assertIn('total;dur=', self.client.get('/')['Server-Timing'])
+
+    @override_settings(SERVER_TIMING=True)
+    def test_every_response_with_the_setting(self):
+        self.assertIn('total;dur=', self.client.get('/')['Server-Timing'])
+
+
+class RequestTimingsTests(SimpleTestCase):
+    def test_queries_of_concurrent_threads(self):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            # The threads of sync_to_async run in a copy of the request's context
+            threads = [threading.Thread(target=copy_context().run, args=(self.run_queries,)) for _ in range(8)]
+        finally:
+            _current.reset(token)
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(timings.queries, 8 * 1000)
+
+    def run_queries(self):
+        for _ in range(1000):
+            _record_query(lambda *args: None, 'SELECT 1', (), False, {})
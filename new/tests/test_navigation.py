@@ -0,0 +1,82 @@
+from django.test import TestCase
+
+from ..cache import NAVIGATION_TAG, get_page_cache, tag_version
+from ..navigation import MENU_SERVICES, get_navigation
+from .pages import create_service, create_site, isolated
+
+
+@isolated
+class NavigationTests(TestCase):
+    def setUp(self):
+        # A new menu version: the tree kept in the process is of another test
+        get_page_cache().clear()
+        self.home, self.category, self.service, self.variant = create_site()
+        self.services = [self.service] + [
+            create_service(self.category, index, order=index) for index in range(2, MENU_SERVICES + 2)
+        ]
+
+    def save(self, page, **fields):
+        """Saves ``page`` with ``fields``; returns whether the menu version moved."""
+        version = tag_version(NAVIGATION_TAG)
+        for name, value in fields.items():
+            setattr(page, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            page.save()
+        return tag_version(NAVIGATION_TAG) != version
+
+    def test_tree(self):
+        category, = get_navigation().categories
+        self.assertEqual(category.heading, self.category.heading)
+        self.assertEqual(category.url, '/services/%s/' % self.category.slug)
+        self.assertEqual([service.heading for service in category.children], [page.heading for page in self.services])
+        variant, = category.children[0].children
+        self.assertEqual((variant.heading, variant.url), (self.variant.heading, '/service-variant/%s/' % self.variant.slug))
+
+    def test_breadcrumbs(self):
+        navigation = get_navigation()
+        category = navigation.categories[0]
+        service = category.children[0]
+        self.assertEqual(navigation.breadcrumbs(service.children[0].url), (category, service, service.children[0]))
+        self.assertEqual(navigation.breadcrumbs(category.url), (category,))
+        self.assertEqual(navigation.breadcrumbs('/about/'), ())
+
+    def test_context_processor(self):
+        path = get_navigation().categories[0].children[0].url
+        response = self.client.get(path)
+        self.assertEqual(
+            [item.url for item in response.context['breadcrumbs']], ['/services/%s/' % self.category.slug, path],
+        )
+
+    def test_variants_rebuild_the_tree_but_keep_the_pages(self):
+        navigation = get_navigation()
+        self.assertFalse(self.save(self.variant, heading='Renamed'))
+        rebuilt = get_navigation()
+        self.assertEqual(rebuilt.categories[0].children[0].children[0].heading, 'Renamed')
+        self.assertEqual(rebuilt.digest, navigation.digest)
+        self.assertFalse(self.save(self.variant, meta_description='Other'))
+        self.assertIs(get_navigation(), rebuilt)
+
+    def test_shown_services(self):
+        navigation = get_navigation()
+        self.assertTrue(self.save(self.service, heading='Renamed'))
+        self.assertNotEqual(get_navigation().digest, navigation.digest)
+
+    def test_hidden_services(self):
+        last = self.services[-1]
+        navigation = get_navigation()
+        self.assertFalse(self.save(last, heading='Renamed'))
+        self.assertFalse(self.save(last, order=100))
+        self.assertEqual(get_navigation().digest, navigation.digest)
+        # Moved into the first services
+        self.assertTrue(self.save(last, order=0))
+        self.assertEqual(get_navigation().categories[0].children[0].heading, 'Renamed')
+
+    def test_new_services_change_the_count(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            version = tag_version(NAVIGATION_TAG)
+            create_service(self.category, 20, order=100)
+        self.assertNotEqual(tag_version(NAVIGATION_TAG), version)
+
+    def test_categories(self):
+        self.assertTrue(self.save(self.category, heading='Renamed'))
+        self.assertFalse(self.save(self.category, meta_description='Other'))
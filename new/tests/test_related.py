@@ -0,0 +1,65 @@
+from django.test import TestCase
+
+from .. import related
+from ..models import PageSnapshot, ServiceNeighbour
+from .pages import create_category, create_home, create_service, isolated
+
+KIND = PageSnapshot.SERVICE
+
+
+def neighbour_lists():
+    return sorted(ServiceNeighbour.objects.values_list('service', 'neighbour', 'same_parent', 'rank'))
+
+
+@isolated
+class RelatedTests(TestCase):
+    def setUp(self):
+        related._indexes.clear()
+        home = create_home()
+        self.categories = [create_category(home, index) for index in (1, 2)]
+        words = ('cloud hosting', 'cloud backup', 'seo audit', 'seo content', 'logo design')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.services = [
+                create_service(self.categories[index % 2], index, heading=heading, meta_keywords=heading)
+                for index, heading in enumerate(words, 1)
+            ]
+
+    def save(self, page):
+        with self.captureOnCommitCallbacks(execute=True):
+            page.save()
+
+    def test_frequencies_are_maintained(self):
+        self.services[4].heading = 'Cloud logo design'
+        self.save(self.services[4])
+        self.services[0].service_category = self.categories[1]
+        self.save(self.services[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.services[2].delete()
+        index = related._indexes[KIND][1]
+        fresh = related.load_index(KIND)
+        self.assertEqual(index.vectors, fresh.vectors)
+        self.assertEqual(+index.frequencies, fresh.frequencies)
+        self.assertEqual(index.parents, fresh.parents)
+
+    def test_saved_items_get_their_neighbours(self):
+        logo = self.services[4]
+        logo.heading = 'Cloud logo design'
+        self.save(logo)
+        self.assertEqual(
+            [row for row in neighbour_lists() if row[0] == logo.pk],
+            sorted((logo.pk, other, same_parent, rank) for other, same_parent, rank, _ in related.load_index(KIND).neighbours(logo.pk, 3)),
+        )
+
+    def test_index_is_kept_between_saves(self):
+        self.save(self.services[0])
+        state, index = related._indexes[KIND]
+        self.save(self.services[1])
+        self.assertIs(related._indexes[KIND][1], index)
+        self.assertNotEqual(related._indexes[KIND][0], state)
+
+    def test_index_is_loaded_again_after_other_writes(self):
+        self.save(self.services[0])
+        index = related._indexes[KIND][1]
+        related.rebuild_related(KIND)
+        self.save(self.services[1])
+        self.assertIsNot(related._indexes[KIND][1], index)
@@ -0,0 +1,95 @@
+import tempfile
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+from ..richtext import render_rich_text, safe_style
+
+
+class SanitizerTests(SimpleTestCase):
+    def test_dropped_tags(self):
+        self.assertEqual(render_rich_text('<p>a<script>alert(1)</script>b</p>'), '<p>ab</p>')
+        self.assertEqual(render_rich_text('<style>p{color:red}</style><p>a</p>'), '<p>a</p>')
+        self.assertEqual(render_rich_text('<form action="/x"><input name="q"></form><p>a</p>'), '<p>a</p>')
+        # Unknown tags are unwrapped, their text kept
+        self.assertEqual(render_rich_text('<p><blink>a</blink></p>'), '<p>a</p>')
+
+    def test_unsafe_urls(self):
+        for href in ('javascript:alert(1)', 'JaVaScRiPt:alert(1)', ' java\tscript:alert(1)', 'data:text/html,<script>x</script>', 'vbscript:x'):
+            with self.subTest(href=href):
+                self.assertEqual(render_rich_text('<a href="%s">x</a>' % href), '<a>x</a>')
+        self.assertEqual(
+            render_rich_text('<a href="https://example.com/">x</a>'),
+            '<a href="https://example.com/">x</a>',
+        )
+        self.assertEqual(render_rich_text('<img src="data:image/svg+xml,x">'), '')
+
+    def test_event_handlers(self):
+        self.assertEqual(render_rich_text('<p onclick="alert(1)" onmouseover="x">a</p>'), '<p>a</p>')
+        self.assertEqual(
+            render_rich_text('<img src="/static/a.png" onerror="alert(1)">'),
+            '<img src="/static/a.png" alt="" loading="lazy" decoding="async">',
+        )
+
+    def test_iframes_must_embed_youtube(self):
+        self.assertEqual(render_rich_text('<iframe src="https://evil.example/"></iframe><p>a</p>'), '<p>a</p>')
+        self.assertIn('src="https://www.youtube.com/embed/x"', render_rich_text('<iframe src="https://www.youtube.com/embed/x"></iframe>'))
+
+    def test_style_allowlist(self):
+        self.assertEqual(
+            render_rich_text('<p style="text-align:center; COLOR: rgb(1, 2, 3); position: fixed">a</p>'),
+            '<p style="text-align: center; color: rgb(1, 2, 3)">a</p>',
+        )
+        for style in (
+            'background: url(https://evil.example/x)',
+            'background-color: url(https://evil.example/x)',
+            'width: expression(alert(1))',
+            'color: red; background-image: image-set("https://evil.example/x" 1x)',
+            '@import "https://evil.example/x.css"',
+        ):
+            with self.subTest(style=style):
+                self.assertNotIn('evil', render_rich_text('<p style=\'%s\'>a</p>' % style))
+                self.assertNotIn('expression', safe_style(style))
+
+    def test_style_escapes(self):
+        # \72 is "r": url() spelled with a CSS escape
+        self.assertEqual(render_rich_text(r'<p style="background:u\72l(https://evil/x)">a</p>'), '<p>a</p>')
+        self.assertEqual(safe_style(r'background-color: u\000072l(https://evil/x)'), '')
+        self.assertEqual(safe_style(r'color: u\rl(x)'), '')
+        self.assertEqual(safe_style('color: u/**/rl(x)'), '')
+        # Escapes are decoded, not passed through
+        self.assertEqual(safe_style(r'color: re\64'), 'color: red')
+
+    def test_ids_are_prefixed(self):
+        self.assertEqual(
+            render_rich_text('<h2 id="services">x</h2><a href="#services">y</a><a name="top">z</a>'),
+            '<h2 id="content-services">x</h2><a href="#content-services">y</a><a name="content-top">z</a>',
+        )
+        # Rendering again keeps a single prefix
+        self.assertEqual(render_rich_text('<h2 id="content-a">x</h2>'), '<h2 id="content-a">x</h2>')
+
+
+class ImageSizeTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(MEDIA_ROOT=directory.name, MEDIA_URL='/media/')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_uploads_get_their_size(self):
+        data = BytesIO()
+        Image.new('RGB', (40, 30)).save(data, 'PNG')
+        name = default_storage.save('editor/a.png', ContentFile(data.getvalue()))
+        self.assertEqual(
+            render_rich_text('<img src="/media/%s">' % name),
+            '<img src="/media/%s" alt="" loading="lazy" decoding="async" width="40" height="30">' % name,
+        )
+
+    def test_missing_and_traversal_names(self):
+        for src in ('/media/missing.png', '/media/../../etc/passwd', '/media/%2e%2e/%2e%2e/etc/passwd'):
+            with self.subTest(src=src):
+                self.assertNotIn('width', render_rich_text('<img src="%s">' % src))
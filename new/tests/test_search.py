@@ -0,0 +1,106 @@
+import importlib
+import types
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from ..models import PageSnapshot, ServiceContent
+from ..search import SEARCH_TABLE, count, is_indexed, match_expression, search
+from ..snapshots import page_path
+from .pages import create_category, create_home, create_service, create_site, isolated
+
+
+def clear_index():
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % SEARCH_TABLE)
+
+
+@isolated
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.home, self.category, self.service, self.variant = create_site()
+
+    def test_match_expression(self):
+        self.assertEqual(match_expression('Web  desi'), '"web" "desi"*')
+        self.assertEqual(match_expression(' "*) '), '')
+
+    def test_saved_pages_are_found(self):
+        self.service.heading = 'Brand strategy workshop'
+        self.service.save()
+        results = search('strategy work')
+        self.assertEqual([(result['kind'], result['slug']) for result in results], [(PageSnapshot.SERVICE, self.service.slug)])
+        self.assertEqual(results[0]['heading'], 'Brand strategy workshop')
+
+    def test_content_blocks_are_indexed(self):
+        ServiceContent.objects.create(service=self.service, content='<p>Quarterly <b>penguin</b> audits</p>')
+        results = search('penguin')
+        self.assertEqual([result['slug'] for result in results], [self.service.slug])
+        self.assertIn('<mark>penguin</mark>', results[0]['snippet'])
+
+    def test_deleted_pages_are_removed(self):
+        self.variant.delete()
+        self.assertEqual(search('Variant'), [])
+
+    def test_headings_rank_first(self):
+        create_service(self.category, 2, heading='Logos', small_description='<p>Zebra zebra zebra</p>')
+        create_service(self.category, 3, heading='Zebra printing')
+        self.assertEqual(search('zebra')[0]['heading'], 'Zebra printing')
+
+    def test_search_view(self):
+        response = self.client.get(reverse('search'), {'q': 'Category'})
+        self.assertContains(response, 'href="%s"' % page_path(PageSnapshot.SERVICE_CATEGORY, self.category.slug))
+
+    @mock.patch('new.views.SEARCH_RESULTS_PER_PAGE', 1)
+    def test_pages_past_the_end(self):
+        for index in (2, 3):
+            create_service(self.category, index)
+        self.assertEqual(count('Service'), 3)
+        for page in ('4', '99999999999999999999'):
+            with self.subTest(page=page):
+                response = self.client.get(reverse('search'), {'q': 'Service', 'page': page})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['page'], 3)
+                self.assertEqual(len(response.context['results']), 1)
+
+
+@isolated
+class BackfillTests(TestCase):
+    def setUp(self):
+        self.home, self.category, self.service, self.variant = create_site()
+
+    def test_backfill_migration(self):
+        clear_index()
+        self.assertFalse(is_indexed(PageSnapshot.SERVICE))
+        migration = importlib.import_module('new.migrations.0017_search_backfill')
+        migration.index_pages(apps, types.SimpleNamespace(connection=connection))
+        self.assertTrue(is_indexed(PageSnapshot.SERVICE))
+        self.assertEqual([result['slug'] for result in search('Variant')], [self.variant.slug])
+
+
+@isolated
+class AdminSearchTests(TestCase):
+    def setUp(self):
+        home = create_home()
+        category = create_category(home)
+        self.web = create_service(category, 1, heading='Web design')
+        self.seo = create_service(category, 2, heading='Local SEO')
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+
+    def _search(self, term):
+        response = self.client.get(reverse('admin:new_service_changelist'), {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['cl'].result_list)
+
+    def test_full_text(self):
+        self.assertEqual(self._search('desi'), [self.web])
+        self.assertEqual(self._search(self.seo.slug), [self.seo])
+
+    def test_falls_back_to_the_orm_before_indexing(self):
+        clear_index()
+        # icontains on the heading and slug, mid-word matches included
+        self.assertEqual(self._search('eb desig'), [self.web])
+        self.assertEqual(self._search('service-2'), [self.seo])
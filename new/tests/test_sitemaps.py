@@ -0,0 +1,128 @@
+import gzip
+import os
+import re
+import tempfile
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.contrib.sitemaps import Sitemap
+from django.test import TestCase, override_settings
+
+from ..cache import get_page_cache
+from ..models import About, Home, PageSnapshot, Service, ServiceCategory, ServiceVariant
+from ..sitemaps import ensure_sitemaps, write_sitemaps
+from ..snapshots import get_snapshot, invalidate_snapshots, page_path
+from .pages import create_service, create_site, isolated
+
+BASE_URL = 'https://example.com'
+
+
+@isolated
+class SitemapTests(TestCase):
+    def setUp(self):
+        get_page_cache().clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        settings = override_settings(SITEMAP_ROOT=self.root, SITE_URL=BASE_URL + '/')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.home, self.category, self.service, self.variant = create_site()
+
+    def read(self, name):
+        with open(os.path.join(self.root, name), encoding='utf-8') as f:
+            return f.read()
+
+    def files(self):
+        return sorted(name for name in os.listdir(self.root) if name.startswith('sitemap-') and name.endswith('.xml'))
+
+    def test_single_file(self):
+        write_sitemaps(self.root, BASE_URL)
+        content = self.read('sitemap.xml')
+        self.assertIn('<urlset', content)
+        for kind, slug in (
+            (PageSnapshot.HOME, ''), (PageSnapshot.ABOUT, ''), (PageSnapshot.SERVICE_CATEGORY, self.category.slug),
+            (PageSnapshot.SERVICE, self.service.slug), (PageSnapshot.SERVICE_VARIANT, self.variant.slug),
+        ):
+            self.assertIn('<loc>%s%s</loc>' % (BASE_URL, page_path(kind, slug)), content)
+        with gzip.open(os.path.join(self.root, 'sitemap.xml.gz'), 'rt', encoding='utf-8') as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(self.files(), [])
+
+    def lastmod(self, kind, slug):
+        write_sitemaps(self.root, BASE_URL)
+        match = re.search(
+            r'<loc>%s%s</loc><lastmod>([0-9-]+)</lastmod>' % (BASE_URL, page_path(kind, slug)), self.read('sitemap.xml'),
+        )
+        return match.group(1)
+
+    def backdate(self):
+        for model in (Home, About, ServiceCategory, Service, ServiceVariant):
+            model.objects.update(updated_at=datetime(2020, 5, 17, tzinfo=timezone.utc))
+
+    def test_lastmod_is_the_content_change(self):
+        self.backdate()
+        self.assertEqual(self.lastmod(PageSnapshot.SERVICE, self.service.slug), '2020-05-17')
+        # Built since, from the same content
+        get_snapshot(PageSnapshot.SERVICE, self.service.slug)
+        self.assertEqual(self.lastmod(PageSnapshot.SERVICE, self.service.slug), '2020-05-17')
+        self.service.heading = 'Edited'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.save()
+        self.assertEqual(self.lastmod(PageSnapshot.SERVICE, self.service.slug), datetime.now(timezone.utc).date().isoformat())
+
+    def test_rebuilds_keep_the_lastmod(self):
+        self.backdate()
+        get_snapshot(PageSnapshot.SERVICE, self.service.slug)
+        invalidate_snapshots({'services'})
+        self.assertEqual(self.lastmod(PageSnapshot.SERVICE, self.service.slug), '2020-05-17')
+        get_snapshot(PageSnapshot.SERVICE, self.service.slug)
+        self.assertEqual(self.lastmod(PageSnapshot.SERVICE, self.service.slug), '2020-05-17')
+
+    @mock.patch.object(Sitemap, 'limit', 2)
+    def test_shards(self):
+        services = [create_service(self.category, index) for index in range(2, 5)]
+        write_sitemaps(self.root, BASE_URL)
+        self.assertEqual(self.files(), [
+            'sitemap-categories-1.xml', 'sitemap-pages-1.xml', 'sitemap-services-1.xml',
+            'sitemap-services-2.xml', 'sitemap-variants-1.xml',
+        ])
+        index = self.read('sitemap.xml')
+        self.assertIn('<sitemapindex', index)
+        self.assertIn('<loc>%s/sitemap-services-2.xml</loc>' % BASE_URL, index)
+        self.assertEqual(self.read('sitemap-services-2.xml').count('<url>'), 2)
+
+        # Shrunk sections lose their last shards
+        for service in services[1:]:
+            service.delete()
+        write_sitemaps(self.root, BASE_URL)
+        self.assertNotIn('sitemap-services-2.xml', self.files())
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'sitemap-services-2.xml.gz')))
+
+    def test_files_are_written_again_after_changes(self):
+        ensure_sitemaps()
+        with mock.patch('new.sitemaps.write_sitemaps') as write:
+            ensure_sitemaps()
+            write.assert_not_called()
+            self.service.heading = 'Edited'
+            with self.captureOnCommitCallbacks(execute=True):
+                self.service.save()
+            ensure_sitemaps()
+            write.assert_called_once()
+
+    def test_view(self):
+        response = self.client.get('/sitemap.xml', headers={'accept-encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(
+            b'<loc>%s%s</loc>' % (BASE_URL.encode(), page_path(PageSnapshot.SERVICE, self.service.slug).encode()),
+            gzip.decompress(b''.join(response.streaming_content)),
+        )
+        self.assertEqual(self.client.get('/sitemap-services-1.xml').status_code, 404)
+
+    @override_settings(ALLOWED_HOSTS=['example.com', 'www.example.com'])
+    def test_every_host_gets_the_site_urls(self):
+        with mock.patch('new.sitemaps.write_sitemaps', wraps=write_sitemaps) as write:
+            for host, secure in (('example.com', False), ('www.example.com', True), ('example.com', True)):
+                response = self.client.get('/sitemap.xml', headers={'host': host}, secure=secure)
+                self.assertIn(b'<loc>%s/</loc>' % BASE_URL.encode(), b''.join(response.streaming_content))
+            self.assertEqual(write.call_count, 1)
@@ -0,0 +1,101 @@
+from unittest import mock
+
+from django.http import Http404
+from django.test import TestCase
+
+from .. import snapshots
+from ..models import About, PageSnapshot, Service, ServiceNeighbour
+from ..snapshots import get_snapshot
+from .pages import create_category, create_service, create_site, isolated
+
+
+@isolated
+class SnapshotTests(TestCase):
+    def setUp(self):
+        self.home, self.category, self.service, self.variant = create_site()
+
+    def snapshot(self):
+        return PageSnapshot.objects.get(kind=PageSnapshot.SERVICE, slug=self.service.slug)
+
+    def edit_service(self, heading):
+        self.service.heading = heading
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.save()
+
+    def save(self, page, **fields):
+        for name, value in fields.items():
+            setattr(page, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            page.save()
+
+    def build_racing_an_edit(self):
+        """``build_page`` that reads the page, then sees it edited before storing it."""
+        build_page = snapshots.build_page
+
+        def build(kind, slug=''):
+            page = build_page(kind, slug)
+            self.edit_service('Edited')
+            return page
+        return mock.patch.object(snapshots, 'build_page', build)
+
+    def test_snapshots_are_built_once(self):
+        snapshot = get_snapshot(PageSnapshot.SERVICE, self.service.slug)
+        self.assertFalse(snapshot.stale)
+        self.assertEqual(snapshot.context['service']['heading'], self.service.heading)
+        with self.assertNumQueries(1):
+            get_snapshot(PageSnapshot.SERVICE, self.service.slug)
+
+    def test_saves_mark_the_snapshots_stale(self):
+        get_snapshot(PageSnapshot.SERVICE, self.service.slug)
+        self.edit_service('Edited')
+        self.assertTrue(self.snapshot().stale)
+        snapshot = get_snapshot(PageSnapshot.SERVICE, self.service.slug)
+        self.assertEqual(snapshot.context['service']['heading'], 'Edited')
+        self.assertFalse(self.snapshot().stale)
+
+    def test_unrelated_saves_keep_the_snapshots(self):
+        get_snapshot(PageSnapshot.SERVICE, self.service.slug)
+        get_snapshot(PageSnapshot.ABOUT)
+        about = About.objects.get()
+        about.heading = 'Edited'
+        with self.captureOnCommitCallbacks(execute=True):
+            about.save()
+        self.assertTrue(PageSnapshot.objects.get(kind=PageSnapshot.ABOUT).stale)
+        self.assertFalse(self.snapshot().stale)
+
+    def test_first_build_racing_an_edit_stays_stale(self):
+        with self.build_racing_an_edit():
+            snapshot = get_snapshot(PageSnapshot.SERVICE, self.service.slug)
+        # The request is answered with what it read, the next one rebuilds
+        self.assertNotEqual(snapshot.context['service']['heading'], 'Edited')
+        self.assertTrue(self.snapshot().stale)
+        self.assertEqual(get_snapshot(PageSnapshot.SERVICE, self.service.slug).context['service']['heading'], 'Edited')
+
+    def test_rebuild_racing_an_edit_stays_stale(self):
+        get_snapshot(PageSnapshot.SERVICE, self.service.slug)
+        self.edit_service('First')
+        with self.build_racing_an_edit():
+            get_snapshot(PageSnapshot.SERVICE, self.service.slug)
+        self.assertTrue(self.snapshot().stale)
+
+    def test_pages_depend_on_the_neighbours_they_show(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            # One per category: only the categories of the shown ones caption them
+            others = [create_service(create_category(self.home, index), index) for index in range(2, 6)]
+            self.service.save()
+        shown = set(ServiceNeighbour.objects.filter(service=self.service).values_list('neighbour', flat=True))
+        hidden = [other for other in others if other.pk not in shown]
+        self.assertEqual(len(hidden), 1)
+        tags = get_snapshot(PageSnapshot.SERVICE, self.service.slug).tags
+        self.assertTrue({'service:%s' % pk for pk in shown} <= set(tags))
+        self.assertNotIn('services', tags)
+
+        self.save(hidden[0], meta_description='Edited')
+        self.assertFalse(self.snapshot().stale)
+        self.save(Service.objects.get(pk=min(shown)), meta_description='Edited')
+        self.assertTrue(self.snapshot().stale)
+
+    def test_missing_pages_leave_no_row(self):
+        with self.assertRaises(Http404):
+            get_snapshot(PageSnapshot.SERVICE, 'missing')
+        self.assertFalse(PageSnapshot.objects.filter(slug='missing').exists())
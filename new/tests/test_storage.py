@@ -0,0 +1,141 @@
+import hashlib
+import os
+import tempfile
+import time
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+
+from ..models import ImageRendition, StoredFile
+from ..storage import CompressedManifestStaticFilesStorage, ContentAddressedStorage, upload_storage
+from ..uploads import collect_garbage
+from .pages import create_site, isolated
+
+
+def image_file(color=(10, 120, 110)):
+    data = BytesIO()
+    Image.new('RGB', (400, 200), color).save(data, 'PNG')
+    return ContentFile(data.getvalue())
+
+
+def make_old(name, storage):
+    # Older than the grace period of the collector
+    past = time.time() - 3600
+    os.utime(storage.path(name), (past, past))
+
+
+class ManifestTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = CompressedManifestStaticFilesStorage(location=directory.name, base_url='/static/')
+
+    def test_missing_entries_fail(self):
+        with self.assertRaises(ValueError):
+            self.storage.url('css/new.css')
+
+    @override_settings(DEBUG=True)
+    def test_missing_entries_link_the_original_in_development(self):
+        self.assertEqual(self.storage.url('css/new.css'), '/static/css/new.css')
+
+    def test_manifests_rewritten_by_another_process_are_reloaded(self):
+        collected = CompressedManifestStaticFilesStorage(location=self.storage.location, base_url='/static/')
+        collected.hashed_files = {'css/new.css': 'css/new.0123456789ab.css'}
+        collected.save_manifest()
+        self.assertEqual(self.storage.url('css/new.css'), '/static/css/new.0123456789ab.css')
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = ContentAddressedStorage(location=directory.name)
+
+    def test_names_are_the_content(self):
+        digest = hashlib.sha256(b'photo').hexdigest()
+        self.assertEqual(
+            self.storage.save('image_d/Photo.PNG', ContentFile(b'photo')),
+            'uploads/%s/%s/%s.png' % (digest[:2], digest[2:4], digest),
+        )
+
+    def test_same_bytes_are_stored_once(self):
+        first = self.storage.save('image_d/a.png', ContentFile(b'photo'))
+        second = self.storage.save('image_m/b.png', ContentFile(b'photo'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(self.storage.save('image_d/a.png', ContentFile(b'other')), first)
+        _, files = self.storage.listdir(os.path.dirname(first))
+        self.assertEqual(files, [os.path.basename(first)])
+
+    def test_saving_stored_bytes_refreshes_the_file(self):
+        name = self.storage.save('a.png', ContentFile(b'photo'))
+        make_old(name, self.storage)
+        self.storage.save('b.png', ContentFile(b'photo'))
+        self.assertGreater(os.path.getmtime(self.storage.path(name)), time.time() - 60)
+
+
+@isolated
+@override_settings(IMAGE_RENDITION_WIDTHS={'image_m': (), 'image_t': (), 'image_d': (200,)})
+class GarbageCollectionTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(MEDIA_ROOT=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.home, self.category, self.service, self.variant = create_site()
+        self.storage = upload_storage()
+        self.image = self.storage.save('image_d/a.png', image_file())
+
+    def save(self, page, **fields):
+        for name, value in fields.items():
+            setattr(page, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            page.save()
+
+    def references(self, name):
+        return StoredFile.objects.get(name=name).references
+
+    def test_references_are_counted(self):
+        self.save(self.service, image_d=self.image)
+        self.assertEqual(self.references(self.image), 1)
+        self.save(self.variant, image_d=self.image, image_m=self.image)
+        self.assertEqual(self.references(self.image), 3)
+        self.save(self.variant, image_m='')
+        self.assertEqual(self.references(self.image), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variant.delete()
+        self.assertEqual(self.references(self.image), 1)
+
+    def test_referenced_files_are_kept(self):
+        self.save(self.service, image_d=self.image)
+        make_old(self.image, self.storage)
+        self.assertEqual(collect_garbage(grace=60)['removed'], 0)
+        self.assertTrue(self.storage.exists(self.image))
+
+    def test_unreferenced_files_are_removed_with_their_renditions(self):
+        self.save(self.service, image_d=self.image)
+        renditions = list(ImageRendition.objects.filter(source=self.image).values_list('file', flat=True))
+        self.assertTrue(renditions)
+        self.save(self.service, image_d='')
+        for name in (self.image, *renditions):
+            make_old(name, self.storage)
+        stats = collect_garbage(grace=60)
+        self.assertEqual(stats['removed'], 1 + len(renditions))
+        for name in (self.image, *renditions):
+            self.assertFalse(self.storage.exists(name))
+        self.assertFalse(ImageRendition.objects.exists())
+        self.assertFalse(StoredFile.objects.filter(name=self.image).exists())
+
+    def test_recent_files_are_kept(self):
+        stats = collect_garbage(grace=60)
+        self.assertEqual((stats['removed'], stats['kept']), (0, 1))
+        self.assertTrue(self.storage.exists(self.image))
+
+    def test_dry_run(self):
+        make_old(self.image, self.storage)
+        stats = collect_garbage(grace=60, dry_run=True)
+        self.assertEqual(stats['removed'], 1)
+        self.assertGreater(stats['bytes'], 0)
+        self.assertTrue(self.storage.exists(self.image))
@@ -0,0 +1,81 @@
+import json
+
+from django.test import SimpleTestCase, TestCase
+
+from ..models import About, ServiceVariant
+from ..structured_data import merge
+from .pages import create_site, isolated
+
+
+def graph(page):
+    return json.loads(type(page).objects.get(pk=page.pk).structured_data)['@graph']
+
+
+@isolated
+class StructuredDataTests(TestCase):
+    def setUp(self):
+        self.home, self.category, self.service, self.variant = create_site()
+
+    def test_variant_breadcrumbs(self):
+        service, crumbs = graph(self.variant)
+        self.assertEqual(service['@type'], 'Service')
+        self.assertEqual(service['serviceType'], self.service.heading)
+        self.assertEqual(service['provider']['name'], 'The One Solution')
+        self.assertEqual(
+            [item['name'] for item in crumbs['itemListElement']],
+            ['Home', self.category.heading, self.service.heading, self.variant.heading],
+        )
+
+    def test_script_cannot_be_closed(self):
+        self.variant.meta_description = '</script><b>&'
+        self.variant.save()
+        data = ServiceVariant.objects.get(pk=self.variant.pk).structured_data
+        self.assertNotIn('<', data)
+        self.assertEqual(json.loads(data)['@graph'][0]['description'], '</script><b>&')
+
+    def test_renaming_an_ancestor_refreshes_the_pages_below(self):
+        self.service.heading = 'Renamed'
+        self.service.save()
+        crumbs = graph(self.variant)[1]['itemListElement']
+        self.assertEqual(crumbs[2]['name'], 'Renamed')
+        self.assertEqual(graph(self.variant)[0]['serviceType'], 'Renamed')
+
+    def test_home_organization_refreshes_the_about_page(self):
+        about = About.objects.get()
+        self.home.meta_description = 'New description'
+        self.home.og_image = 'https://example.com/new.jpg'
+        self.home.save()
+        organization = graph(about)[0]
+        self.assertEqual(organization['description'], 'New description')
+        self.assertEqual(organization['image'], 'https://example.com/new.jpg')
+
+    def test_home_site_name_refreshes_the_providers(self):
+        self.home.og_site_name = 'Renamed'
+        self.home.save()
+        self.assertEqual(graph(self.variant)[0]['provider']['name'], 'Renamed')
+        self.assertEqual(graph(About.objects.get())[0]['name'], 'Renamed')
+
+    def test_manual_schema_is_merged(self):
+        self.service.schema = [
+            {'@context': 'https://schema.org', '@type': 'Service', 'areaServed': 'IN'},
+            {'@type': 'FAQPage', 'mainEntity': []},
+        ]
+        self.service.save()
+        nodes = graph(self.service)
+        self.assertEqual(nodes[0]['areaServed'], 'IN')
+        self.assertEqual(nodes[0]['name'], self.service.heading)
+        self.assertEqual(nodes[-1], {'@type': 'FAQPage', 'mainEntity': []})
+
+
+class MergeTests(SimpleTestCase):
+    def test_nested_keys_are_overridden(self):
+        generated = [{'@type': 'Service', 'provider': {'name': 'A', 'url': '/'}}]
+        self.assertEqual(
+            merge(generated, {'@type': ['Service', 'Product'], 'provider': {'name': 'B'}}),
+            [{'@type': ['Service', 'Product'], 'provider': {'name': 'B', 'url': '/'}}],
+        )
+
+    def test_invalid_schema_is_ignored(self):
+        for schema in ('not json', 3, [None, 'x'], {}):
+            with self.subTest(schema=schema):
+                self.assertEqual(merge([{'@type': 'Service'}], schema), [{'@type': 'Service'}])
@@ -0,0 +1,101 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+
+from ..models import Home, Service, ServiceContent
+from ..search import search
+from ..transfer import (
+    CatalogImporter, MediaCopier, export_file, export_records, import_file, read_csv, read_jsonl,
+    write_csv, write_jsonl,
+)
+from .pages import create_site, isolated
+
+
+def dump(write=write_jsonl):
+    f = StringIO()
+    write(f, export_records())
+    return f.getvalue()
+
+
+@isolated
+class CatalogTransferTests(TestCase):
+    def setUp(self):
+        self.home, self.category, self.service, self.variant = create_site()
+        ServiceContent.objects.create(service=self.service, content='<p>Quarterly <b>penguin</b> audits</p>')
+
+    def load(self, text, read=read_jsonl):
+        importer = CatalogImporter(batch_size=2)
+        importer.load(read(StringIO(text)))
+        importer.finish()
+        return importer
+
+    def test_pages_are_upserted_and_blocks_replaced(self):
+        exported = dump()
+        Service.objects.filter(pk=self.service.pk).update(heading='Edited')
+        ServiceContent.objects.create(service=self.service, content='<p>Added after the export</p>')
+        importer = self.load(exported)
+        self.assertEqual(Service.objects.get().heading, self.service.heading)
+        self.assertEqual(list(ServiceContent.objects.values_list('content', flat=True)), ['<p>Quarterly <b>penguin</b> audits</p>'])
+        self.assertEqual(importer.counts['service'], [1, 0])
+        self.assertEqual(importer.counts['service_content'], [1, 1])
+        self.assertEqual(dump(), exported)
+
+    def test_empty_database(self):
+        exported = dump()
+        Home.objects.all().delete()
+        importer = self.load(exported)
+        self.assertEqual(importer.counts['service_variant'], [1, 1])
+        self.assertEqual(dump(), exported)
+        # Derived on import
+        self.assertTrue(ServiceContent.objects.get().rendered)
+        self.assertEqual([result['slug'] for result in search('penguin')], [self.service.slug])
+
+    def test_csv(self):
+        exported, csv = dump(), dump(write_csv)
+        Home.objects.all().delete()
+        self.load(csv, read=read_csv)
+        self.assertEqual(dump(), exported)
+
+    def test_missing_parents(self):
+        text = '{"model":"service","parent":"missing","fields":{"slug":"orphan"}}\n'
+        with self.assertRaisesMessage(ValueError, "line 1: no service category 'missing'"):
+            CatalogImporter().load(read_jsonl(StringIO(text)))
+
+    def test_malformed_records(self):
+        for text, message in (('{"model":"service"}\n', 'line 1: not a catalog record'), ('{"model":"page","fields":{}}\n', "line 1: unknown model 'page'")):
+            with self.subTest(text=text):
+                with self.assertRaisesMessage(ValueError, message):
+                    CatalogImporter().load(read_jsonl(StringIO(text)))
+
+
+class MediaCopyTests(TestCase):
+    def setUp(self):
+        directories = [tempfile.TemporaryDirectory() for _ in range(2)]
+        for directory in directories:
+            self.addCleanup(directory.cleanup)
+        self.media, self.target = (directory.name for directory in directories)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_round_trip(self):
+        name = default_storage.save('uploads/ab/cd/abcd.png', ContentFile(b'image'))
+        copier = MediaCopier(export_file, self.target, 2)
+        copier.add([name, name, 'uploads/missing.png'])
+        self.assertEqual(copier.finish(), {'copied': [name], 'missing': ['uploads/missing.png']})
+        with open(os.path.join(self.target, name), 'rb') as f:
+            self.assertEqual(f.read(), b'image')
+
+        self.assertEqual(import_file(self.target, name), 'unchanged')
+        default_storage.delete(name)
+        self.assertEqual(import_file(self.target, name), 'copied')
+        self.assertEqual(default_storage.open(name).read(), b'image')
+
+    def test_names_outside_the_root(self):
+        with self.assertRaises(SuspiciousFileOperation):
+            import_file(self.target, '../outside.png')
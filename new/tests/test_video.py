@@ -0,0 +1,81 @@
+import tempfile
+
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, override_settings
+
+from ..models import ServiceContent
+from ..video import EMBED_URL, GENERATED_POSTER, prepare_video, validate_youtube_url, youtube_id
+
+VIDEO_ID = 'dQw4w9WgXcQ'
+
+
+class YoutubeIdTests(SimpleTestCase):
+    def test_links(self):
+        for url in (
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            'https://m.youtube.com/watch?feature=share&v=dQw4w9WgXcQ&t=42',
+            'https://youtu.be/dQw4w9WgXcQ?si=abc',
+            'https://www.youtube.com/shorts/dQw4w9WgXcQ',
+            'https://www.youtube.com/live/dQw4w9WgXcQ',
+            'https://www.youtube.com/embed/dQw4w9WgXcQ?rel=0',
+            'https://www.youtube-nocookie.com/embed/dQw4w9WgXcQ',
+            '  HTTPS://WWW.YOUTUBE.COM/watch?v=dQw4w9WgXcQ  ',
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(youtube_id(url), VIDEO_ID)
+
+    def test_other_links(self):
+        for url in (
+            'https://vimeo.com/123456789',
+            'https://www.youtube.com/watch?v=short',
+            'https://www.youtube.com/watch',
+            'https://www.youtube.com/channel/UC1234567890',
+            'https://youtube.com.example.com/watch?v=dQw4w9WgXcQ',
+            'https://youtu.be/',
+            'not a url',
+        ):
+            with self.subTest(url=url):
+                self.assertIsNone(youtube_id(url))
+
+    def test_validation(self):
+        validate_youtube_url('')
+        validate_youtube_url('https://youtu.be/dQw4w9WgXcQ')
+        with self.assertRaises(ValidationError):
+            validate_youtube_url('https://vimeo.com/123456789')
+
+
+class PrepareVideoTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(MEDIA_ROOT=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_links_are_stored_as_embed_urls(self):
+        block = ServiceContent(youtube_video_embed='https://youtu.be/dQw4w9WgXcQ')
+        prepare_video(block)
+        self.assertEqual(block.youtube_video_id, VIDEO_ID)
+        self.assertEqual(block.youtube_video_embed, EMBED_URL % VIDEO_ID)
+
+    def test_generated_posters(self):
+        block = ServiceContent(youtube_video_embed='https://youtu.be/dQw4w9WgXcQ')
+        prepare_video(block)
+        self.assertEqual(block.youtube_poster.name, GENERATED_POSTER % VIDEO_ID)
+        self.assertTrue(default_storage.exists(block.youtube_poster.name))
+        # Removed with the video
+        block.youtube_video_embed = ''
+        prepare_video(block)
+        self.assertEqual((block.youtube_video_id, block.youtube_poster.name), ('', ''))
+
+    def test_uploaded_posters_are_kept(self):
+        block = ServiceContent(youtube_video_embed='https://youtu.be/dQw4w9WgXcQ', youtube_poster='uploads/ab/cd/poster.jpg')
+        prepare_video(block)
+        self.assertEqual(block.youtube_poster.name, 'uploads/ab/cd/poster.jpg')
+
+    def test_other_embeds_are_left_alone(self):
+        url = 'https://player.vimeo.com/video/123456789'
+        block = ServiceContent(youtube_video_embed=url)
+        prepare_video(block)
+        self.assertEqual((block.youtube_video_embed, block.youtube_video_id), (url, ''))
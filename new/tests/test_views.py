@@ -0,0 +1,119 @@
+import types
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.test import TestCase, override_settings
+
+from ..cache import get_page_cache
+from ..models import PageSnapshot
+from ..snapshots import page_path
+from ..urls import public_urlpatterns
+from .pages import create_site, isolated
+
+async_urls = types.ModuleType('async_urls')
+async_urls.urlpatterns = public_urlpatterns(True)
+
+
+@isolated
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        get_page_cache().clear()
+        self.home, self.category, self.service, self.variant = create_site()
+        self.path = page_path(PageSnapshot.SERVICE, self.service.slug)
+        response = self.client.get(self.path)
+        self.etag, self.last_modified = response['ETag'], response['Last-Modified']
+
+    def save(self, page, **fields):
+        for name, value in fields.items():
+            setattr(page, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            page.save()
+
+    def validators(self):
+        return {'If-None-Match': self.etag}, {'If-Modified-Since': self.last_modified}
+
+    def test_cached_pages(self):
+        for headers in self.validators():
+            with self.subTest(headers), self.assertNumQueries(0):
+                response = self.client.get(self.path, headers=headers)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], self.etag)
+
+    def test_snapshots(self):
+        for headers in self.validators():
+            get_page_cache().clear()
+            with self.subTest(headers):
+                response = self.client.get(self.path, headers=headers)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], self.etag)
+                self.assertEqual(response['Last-Modified'], self.last_modified)
+
+    def test_head(self):
+        for cached in (True, False):
+            if not cached:
+                get_page_cache().clear()
+            with self.subTest(cached=cached):
+                response = self.client.head(self.path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['ETag'], self.etag)
+                self.assertEqual(response.content, b'')
+        # ConditionalGetMiddleware only answers GETs from the page cache
+        get_page_cache().clear()
+        self.assertEqual(self.client.head(self.path, headers={'If-None-Match': self.etag}).status_code, 304)
+
+    def test_edits_change_the_etag(self):
+        self.save(self.service, heading='Edited heading')
+        response = self.client.get(self.path, headers={'If-None-Match': self.etag})
+        self.assertContains(response, 'Edited heading')
+        self.assertNotEqual(response['ETag'], self.etag)
+        self.assertEqual(self.client.get(self.path, headers={'If-None-Match': response['ETag']}).status_code, 304)
+
+
+@isolated
+@override_settings(ROOT_URLCONF=async_urls)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        get_page_cache().clear()
+        self.home, self.category, self.service, self.variant = create_site()
+        self.pages = {
+            page_path(PageSnapshot.HOME): self.home.heading,
+            page_path(PageSnapshot.ABOUT): 'About',
+            page_path(PageSnapshot.SERVICE_CATEGORY, self.category.slug): self.category.heading,
+            page_path(PageSnapshot.SERVICE, self.service.slug): self.service.heading,
+            page_path(PageSnapshot.SERVICE_VARIANT, self.variant.slug): self.variant.heading,
+        }
+
+    def save(self, page, **fields):
+        for name, value in fields.items():
+            setattr(page, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            page.save()
+
+    async def test_pages(self):
+        for path, heading in self.pages.items():
+            with self.subTest(path):
+                response = await self.async_client.get(path)
+                self.assertTrue(iscoroutinefunction(response.resolver_match.func))
+                self.assertContains(response, heading)
+                # The same page and version as the sync views
+                await sync_to_async(get_page_cache().clear)()
+                with self.settings(ROOT_URLCONF='tos.urls'):
+                    self.assertEqual((await sync_to_async(self.client.get)(path))['ETag'], response['ETag'])
+
+    async def test_missing_pages(self):
+        response = await self.async_client.get(page_path(PageSnapshot.SERVICE, 'missing'))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_stale_snapshots_are_rebuilt(self):
+        path = page_path(PageSnapshot.SERVICE, self.service.slug)
+        etag = (await self.async_client.get(path))['ETag']
+        await sync_to_async(self.save)(self.service, heading='Edited heading')
+        response = await self.async_client.get(path, headers={'If-None-Match': etag})
+        self.assertContains(response, 'Edited heading')
+
+    async def test_conditional_get(self):
+        path = page_path(PageSnapshot.SERVICE, self.service.slug)
+        etag = (await self.async_client.get(path))['ETag']
+        await sync_to_async(get_page_cache().clear)()
+        response = await self.async_client.get(path, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
@@ -0,0 +1,353 @@
+"""
+Catalog transfer between environments (the ``export_catalog`` and
+``import_catalog`` commands).
+
+The catalog is written as one record per row, parents first: the home page
+and its alternate links, then the categories, services and variants, each
+followed by the content blocks of its kind. A record names its parent by
+slug and its uploaded files by their storage name, so a dump loads into a
+database with other primary keys. Only the editable fields travel: what is
+derived on save (the rendered rich text, video ids, ``updated_at``) is
+derived again on import.
+
+JSONL keeps a record per line (``{"model", "parent", "fields"}``); CSV has
+a ``model`` and a ``parent`` column plus one column per field of any model,
+with JSON fields as JSON text.
+
+The export streams the tables with ``iterator()``. The import reads the
+records in batches: pages are upserted by slug, and the content blocks of
+an imported page replace the ones it had. Bulk writes send no signals, so
+``CatalogImporter.finish`` rebuilds the search and relatedness indexes, the
+file reference counts and the structured data, and invalidates every page
+afterwards. The rich text of a batch is rendered in a process pool, and
+media files are copied in a thread pool while the rows are written.
+"""
+import csv
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.utils._os import safe_join
+
+from .cache import SITE_TAGS
+from .imaging import setup_worker
+from .models import (
+    Home, AlternateHome, ServiceCategory, ServiceCategoryContent,
+    Service, ServiceContent, ServiceVariant, ServiceVariantContent
+)
+from .related import INDEXES, rebuild_related
+from .richtext import render_rich_text, rendered_fields, rich_text_fields
+from .search import rebuild_index
+from .structured_data import refresh_all
+from .uploads import recount_references
+from .video import prepare_video
+
+# Record name: (model, field holding the parent), parents first
+MODELS = {
+    'home': (Home, None),
+    'alternate_home': (AlternateHome, 'home'),
+    'service_category': (ServiceCategory, 'home'),
+    'service_category_content': (ServiceCategoryContent, 'service_category'),
+    'service': (Service, 'service_category'),
+    'service_content': (ServiceContent, 'service'),
+    'service_variant': (ServiceVariant, 'service_category'),
+    'service_variant_content': (ServiceVariantContent, 'service_variant'),
+}
+NAMES = {model: name for name, (model, parent) in MODELS.items()}
+
+
+def is_page(model):
+    return any(field.name == 'slug' for field in model._meta.fields)
+
+
+def transfer_fields(model):
+    """The fields of ``model`` a record carries."""
+    parent = MODELS[NAMES[model]][1]
+    return [
+        field for field in model._meta.concrete_fields
+        if field.editable and not field.primary_key and field.name != parent
+    ]
+
+
+def _children(model):
+    """``(block model, parent field)`` of the content blocks of the page ``model``."""
+    return [
+        (child, parent) for child, parent in MODELS.values()
+        if parent and not is_page(child) and child._meta.get_field(parent).related_model is model
+    ]
+
+
+CSV_FIELDS = list(dict.fromkeys(
+    field.attname for model, parent in MODELS.values() for field in transfer_fields(model)
+))
+
+
+def export_records(batch_size=1000):
+    """Yield ``(name, parent slug, fields)`` for every row of the catalog."""
+    for name, (model, parent) in MODELS.items():
+        fields = [field.attname for field in transfer_fields(model)]
+        rows = model.objects.order_by('pk')
+        if parent:
+            rows = rows.values(*fields, parent_slug=models.F('%s__slug' % parent))
+        else:
+            rows = rows.values(*fields)
+        for row in rows.iterator(chunk_size=batch_size):
+            yield name, row.pop('parent_slug', None), row
+
+
+def media_names(model, fields):
+    """Storage names of the files referenced by the ``fields`` of a ``model`` record."""
+    return [
+        fields[field.attname] for field in transfer_fields(model)
+        if isinstance(field, models.FileField) and fields.get(field.attname)
+    ]
+
+
+def write_jsonl(f, records):
+    for name, parent, fields in records:
+        f.write(json.dumps(
+            {'model': name, 'parent': parent, 'fields': fields},
+            cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'),
+        ))
+        f.write('\n')
+
+
+def write_csv(f, records):
+    writer = csv.writer(f)
+    writer.writerow(['model', 'parent', *CSV_FIELDS])
+    for name, parent, fields in records:
+        writer.writerow([name, '' if parent is None else parent, *(_csv_value(fields, column) for column in CSV_FIELDS)])
+
+
+def _csv_value(fields, column):
+    value = fields.get(column)
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+    return value
+
+
+def read_jsonl(f):
+    """Yield ``(line, name, parent slug, fields)`` from a JSONL dump."""
+    for line, text in enumerate(f, 1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+            yield line, record['model'], record.get('parent'), record['fields']
+        except (ValueError, KeyError, TypeError) as exc:
+            raise ValueError('line %s: not a catalog record (%s)' % (line, exc))
+
+
+def read_csv(f):
+    """Yield ``(line, name, parent slug, fields)`` from a CSV dump."""
+    reader = csv.DictReader(f)
+    for row in reader:
+        line, name = reader.line_num, row.get('model')
+        if name not in MODELS:
+            raise ValueError('line %s: unknown model %r' % (line, name))
+        fields = {}
+        for field in transfer_fields(MODELS[name][0]):
+            value = row.get(field.attname)
+            if value is None:
+                continue
+            if value == '' and field.null:
+                value = None
+            elif isinstance(field, models.JSONField):
+                value = json.loads(value) if value else field.get_default()
+            elif not isinstance(field, models.FileField):
+                value = field.to_python(value)
+            fields[field.attname] = value
+        # The home page has an empty slug: a parent column is never null
+        yield line, name, row.get('parent', '') if MODELS[name][1] else None, fields
+
+
+def import_file(source_root, name):
+    """Copy ``name`` from the directory ``source_root`` to the media storage."""
+    source = safe_join(source_root, name)
+    if not os.path.exists(source):
+        return 'missing'
+    if default_storage.exists(name):
+        if default_storage.size(name) == os.path.getsize(source):
+            return 'unchanged'
+        default_storage.delete(name)
+    with open(source, 'rb') as f:
+        default_storage.save(name, File(f))
+    return 'copied'
+
+
+def export_file(target_root, name):
+    """Copy ``name`` from the media storage to the directory ``target_root``."""
+    if not default_storage.exists(name):
+        return 'missing'
+    target = safe_join(target_root, name)
+    if os.path.exists(target) and os.path.getsize(target) == default_storage.size(name):
+        return 'unchanged'
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with default_storage.open(name) as source, open(target, 'wb') as f:
+        for chunk in source.chunks():
+            f.write(chunk)
+    return 'copied'
+
+
+class MediaCopier:
+    """Copies every referenced file once, ``workers`` at a time."""
+    def __init__(self, copy_file, root, workers):
+        self.copy_file = copy_file
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = {}
+
+    def add(self, names):
+        for name in names:
+            if name not in self.futures:
+                self.futures[name] = self.executor.submit(self.copy_file, self.root, name)
+
+    def finish(self):
+        """Wait for the copies; returns the files per outcome, failures included."""
+        self.executor.shutdown()
+        results = {}
+        for name, future in self.futures.items():
+            try:
+                outcome = future.result()
+            except Exception as exc:
+                outcome = 'failed: %s' % exc
+            results.setdefault(outcome, []).append(name)
+        return results
+
+
+def get_pool(max_workers):
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=setup_worker,
+    )
+
+
+class CatalogImporter:
+    """
+    Writes the records of a dump in batches of ``batch_size`` rows of one
+    model, each batch in its own transaction. With a ``pool`` (see
+    ``get_pool``) the rich text of a batch is rendered in parallel.
+    """
+    def __init__(self, batch_size=500, media=None, pool=None):
+        self.batch_size = batch_size
+        self.media = media
+        self.pool = pool
+        # Record name: [rows, created]
+        self.counts = {name: [0, 0] for name in MODELS}
+        # Pages whose content blocks were replaced, by block model
+        self.replaced = {model: set() for model, parent in MODELS.values() if not is_page(model)}
+
+    def load(self, records):
+        """Import ``records`` as read by ``read_jsonl`` or ``read_csv``."""
+        batch = []
+        for record in records:
+            if batch and (record[1] != batch[0][1] or len(batch) >= self.batch_size):
+                self._write(batch)
+                batch = []
+            if record[1] not in MODELS:
+                raise ValueError('line %s: unknown model %r' % (record[0], record[1]))
+            batch.append(record)
+        if batch:
+            self._write(batch)
+
+    def _parents(self, model, parent, batch):
+        parent_model = model._meta.get_field(parent).related_model
+        slugs = {slug for line, name, slug, fields in batch}
+        pks = dict(parent_model.objects.filter(slug__in=slugs).values_list('slug', 'pk'))
+        for line, name, slug, fields in batch:
+            if slug not in pks:
+                raise ValueError('line %s: no %s %r' % (line, parent_model._meta.verbose_name, slug))
+        return pks
+
+    def _write(self, batch):
+        name = batch[0][1]
+        model, parent = MODELS[name]
+        pks = self._parents(model, parent, batch) if parent else {}
+        objects = []
+        for line, name, slug, fields in batch:
+            obj = model(**fields)
+            if parent:
+                setattr(obj, '%s_id' % parent, pks[slug])
+            if hasattr(obj, 'youtube_video_embed'):
+                prepare_video(obj)
+            objects.append(obj)
+            if self.media is not None:
+                self.media.add(media_names(model, fields))
+        if rich_text_fields(model):
+            self._render(model, objects)
+
+        with transaction.atomic():
+            if is_page(model):
+                self._upsert(name, model, parent, objects)
+            else:
+                self._replace(name, model, parent, objects)
+
+    def _render(self, model, objects):
+        if self.pool is None:
+            for obj in objects:
+                obj.rendered = rendered_fields(obj)
+            return
+        names = rich_text_fields(model)
+        rendered = iter(self.pool.map(
+            render_rich_text,
+            [getattr(obj, name) for obj in objects for name in names],
+            chunksize=32,
+        ))
+        for obj in objects:
+            obj.rendered = {name: next(rendered) for name in names}
+
+    def _upsert(self, name, model, parent, objects):
+        slugs = [obj.slug for obj in objects]
+        existing = model.objects.filter(slug__in=slugs).count()
+        update_fields = [field.name for field in transfer_fields(model) if field.name != 'slug']
+        if parent:
+            update_fields.append(parent)
+        if rich_text_fields(model):
+            update_fields.append('rendered')
+        model.objects.bulk_create(
+            objects,
+            update_conflicts=True,
+            unique_fields=['slug'],
+            update_fields=[*update_fields, 'updated_at'],
+        )
+        # The blocks of an imported page are the ones in the dump, if any
+        page_pks = list(model.objects.filter(slug__in=slugs).values_list('pk', flat=True))
+        for child, child_parent in _children(model):
+            self._delete_blocks(child, child_parent, page_pks)
+        self.counts[name][0] += len(objects)
+        self.counts[name][1] += len(objects) - existing
+
+    def _replace(self, name, model, parent, objects):
+        attname = '%s_id' % parent
+        self._delete_blocks(model, parent, {getattr(obj, attname) for obj in objects})
+        model.objects.bulk_create(objects)
+        self.counts[name][0] += len(objects)
+        self.counts[name][1] += len(objects)
+
+    def _delete_blocks(self, model, parent, page_pks):
+        pending = set(page_pks) - self.replaced[model]
+        if pending:
+            # No signals: the indexes and pages are refreshed by finish()
+            blocks = model.objects.filter(**{'%s__in' % parent: pending})
+            blocks._raw_delete(blocks.db)
+            self.replaced[model].update(pending)
+
+    def finish(self):
+        """Rebuild what the signals would have updated, and evict every page."""
+        from .signals import invalidate_content
+
+        rebuild_index()
+        for kind in INDEXES:
+            rebuild_related(kind)
+        recount_references()
+        refresh_all()
+        invalidate_content(SITE_TAGS)
+
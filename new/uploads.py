@@ -0,0 +1,193 @@
+"""
+Reference counts and garbage collection of the uploaded images.
+
+The image fields of the content models store their files with
+``ContentAddressedStorage`` (see new/storage.py): one file per content,
+shared by every field that names it. Replacing or clearing an image, or
+deleting its object, never deletes the file. Instead ``StoredFile`` counts
+the fields naming each file, kept up to date by the signals as objects are
+saved and deleted.
+
+``collect_media_garbage`` recounts the references (bulk writes, such as the
+catalog import, send no signals) and removes from the upload directories
+every file that nothing references, with its renditions. The directories
+are scanned and the files removed in a thread pool. A file modified within
+the grace period is kept: it may be an upload whose object is not saved
+yet, and saving bytes that are stored already touches their file.
+"""
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.db import models
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import (
+    Home, AlternateHome, About, ServiceCategory, ServiceCategoryContent,
+    Service, ServiceContent, ServiceVariant, ServiceVariantContent,
+    ImageRendition, StoredFile,
+)
+from .storage import upload_storage
+
+# Image fields of each content model that has some
+IMAGE_FIELDS = {
+    model: [field.name for field in model._meta.fields if isinstance(field, models.ImageField)]
+    for model in (
+        Home, AlternateHome, About, ServiceCategory, ServiceCategoryContent,
+        Service, ServiceContent, ServiceVariant, ServiceVariantContent,
+    )
+}
+IMAGE_FIELDS = {model: fields for model, fields in IMAGE_FIELDS.items() if fields}
+RENDITIONS_DIR = 'renditions'
+BATCH_SIZE = 500
+
+
+def image_names(instance):
+    """``Counter`` of the files named by the image fields of ``instance``."""
+    return Counter(
+        name for name in (getattr(instance, field).name for field in IMAGE_FIELDS[type(instance)]) if name
+    )
+
+
+def update_references(delta):
+    """Add ``delta`` (file name: change, negative to release) to the reference counts."""
+    delta = {name: change for name, change in delta.items() if change}
+    if not delta:
+        return
+    StoredFile.objects.bulk_create([StoredFile(name=name) for name in delta], ignore_conflicts=True)
+    for name, change in delta.items():
+        StoredFile.objects.filter(name=name).update(references=Greatest(F('references') + change, 0))
+
+
+def count_references():
+    """``Counter`` of every file named by an image field."""
+    references = Counter()
+    for model, fields in IMAGE_FIELDS.items():
+        for names in model.objects.values_list(*fields).iterator(chunk_size=2000):
+            references.update(name for name in names if name)
+    return references
+
+
+def recount_references():
+    """Reset ``StoredFile`` to the references counted in the tables; returns them."""
+    references = count_references()
+    changed = []
+    for stored in StoredFile.objects.only('name', 'references').iterator(chunk_size=2000):
+        count = references.get(stored.name, 0)
+        if stored.references != count:
+            stored.references = count
+            changed.append(stored)
+    StoredFile.objects.bulk_update(changed, ['references'], batch_size=BATCH_SIZE)
+    StoredFile.objects.bulk_create(
+        [StoredFile(name=name, references=count) for name, count in references.items()],
+        ignore_conflicts=True, batch_size=BATCH_SIZE,
+    )
+    return references
+
+
+def upload_dirs():
+    """The directories the image fields upload to, relative to ``MEDIA_ROOT``."""
+    dirs = {upload_storage().prefix}
+    for model, fields in IMAGE_FIELDS.items():
+        dirs.update(model._meta.get_field(field).upload_to.strip('/') for field in fields)
+    return sorted(dirs)
+
+
+def _scan(root, directory, recursive):
+    """``(name, mtime, size)`` of the files in ``directory``, named relative to ``root``."""
+    found = []
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return found
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            if recursive:
+                found.extend(_scan(root, entry.path, True))
+        elif entry.is_file(follow_symlinks=False):
+            stat = entry.stat(follow_symlinks=False)
+            found.append((os.path.relpath(entry.path, root).replace(os.sep, '/'), stat.st_mtime, stat.st_size))
+    return found
+
+
+def scan_files(executor, dirs):
+    """Every file under ``dirs``: a scan job per directory and per subdirectory."""
+    root = upload_storage().location
+    jobs = []
+    for directory in dirs:
+        path = os.path.join(root, directory)
+        jobs.append((path, False))
+        if os.path.isdir(path):
+            jobs.extend((entry.path, True) for entry in os.scandir(path) if entry.is_dir(follow_symlinks=False))
+    return [
+        found
+        for files in executor.map(lambda job: _scan(root, *job), jobs)
+        for found in files
+    ]
+
+
+def _remove(name, cutoff):
+    """
+    Remove the file ``name`` unless it changed since ``cutoff``; returns the
+    bytes freed, or None when the file is kept or gone already.
+    """
+    path = upload_storage().path(name)
+    try:
+        stat = os.stat(path)
+        if stat.st_mtime >= cutoff:
+            return None
+        os.remove(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size
+
+
+def _batches(items):
+    items = iter(items)
+    while batch := list(islice(items, BATCH_SIZE)):
+        yield batch
+
+
+def collect_garbage(grace=24 * 3600, workers=8, dry_run=False):
+    """
+    Remove the uploads and renditions that nothing references and that
+    have not changed for ``grace`` seconds. Returns the counts of files
+    ``scanned``, ``removed`` and ``kept`` (unreferenced but recent), and the
+    ``bytes`` freed.
+    """
+    cutoff = time.time() - grace
+    references = recount_references()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        uploads = scan_files(executor, upload_dirs())
+        garbage = [(name, size) for name, mtime, size in uploads if not references.get(name) and mtime < cutoff]
+        recent = {name for name, mtime, size in uploads if not references.get(name) and mtime >= cutoff}
+
+        # Renditions of the sources that stay
+        sources = references.keys() | recent
+        stale, live = [], set()
+        for pk, source, name in ImageRendition.objects.values_list('pk', 'source', 'file').iterator(chunk_size=2000):
+            if source in sources:
+                live.add(name)
+            else:
+                stale.append(pk)
+        renditions = scan_files(executor, [RENDITIONS_DIR])
+        garbage.extend((name, size) for name, mtime, size in renditions if name not in live and mtime < cutoff)
+        recent.update(name for name, mtime, size in renditions if name not in live and mtime >= cutoff)
+
+        stats = {'scanned': len(uploads) + len(renditions), 'removed': len(garbage), 'kept': len(recent)}
+        if dry_run:
+            stats['bytes'] = sum(size for name, size in garbage)
+            return stats
+        for batch in _batches(stale):
+            ImageRendition.objects.filter(pk__in=batch).delete()
+        freed = list(executor.map(lambda item: _remove(item[0], cutoff), garbage))
+    stats['removed'] = sum(1 for size in freed if size is not None)
+    stats['bytes'] = sum(size for size in freed if size is not None)
+    # Counts of files that are gone; the recent ones keep theirs
+    unreferenced = StoredFile.objects.filter(references=0).values_list('name', flat=True)
+    for batch in _batches([name for name in unreferenced.iterator() if name not in recent]):
+        StoredFile.objects.filter(name__in=batch, references=0).delete()
+    return stats
@@ -1,12 +1,21 @@
+from django.conf import settings
 from django.urls import path
 from .views import *
 
-urlpatterns = [
-    
-    path('', home, name='home'),
-    
-    path('about/', about, name='about'),
-    path('services/<slug:slug>/', service_category_detail, name='service_category_detail'),
-    path('service/<slug:slug>/', service_detail, name='service_detail'),
-    path('service-variant/<slug:slug>/', service_variant_detail, name='service_variant_detail'),
-]
\ No newline at end of file
+
+def public_urlpatterns(asynchronous):
+    """The public pages, served by the async views when ``asynchronous``."""
+    view = lambda name: PUBLIC_VIEWS[name][asynchronous]
+    return [
+
+        path('', view('home'), name='home'),
+
+        path('about/', view('about'), name='about'),
+        path('services/<slug:slug>/', view('service_category_detail'), name='service_category_detail'),
+        path('service/<slug:slug>/', view('service_detail'), name='service_detail'),
+        path('service-variant/<slug:slug>/', view('service_variant_detail'), name='service_variant_detail'),
+        path('search/', search, name='search'),
+    ]
+
+
+urlpatterns = public_urlpatterns(settings.ASYNC_PUBLIC_VIEWS)
@@ -0,0 +1,72 @@
+"""
+YouTube facades of the content blocks.
+
+Instead of an ``<iframe>`` per video, the pages show a poster image with a
+play button and load the player only when it is clicked (see
+``templates/partials/youtube_facade.html``). Everything the facade needs is
+prepared when the block is saved (see ``new.signals``): the URL an editor
+pasted (watch, share, shorts or embed link) is reduced to the video id and
+stored as the canonical privacy-enhanced embed URL, and a block without an
+uploaded poster gets one drawn locally. Nothing is fetched from YouTube.
+"""
+import re
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.exceptions import ValidationError
+
+from .imaging import video_poster
+
+EMBED_URL = 'https://www.youtube-nocookie.com/embed/%s'
+WATCH_URL = 'https://www.youtube.com/watch?v=%s'
+# Generated posters are shared by every block showing the same video
+GENERATED_POSTER = 'youtube_posters/generated/%s.jpg'
+
+VIDEO_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+YOUTUBE_HOSTS = {
+    'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com',
+    'youtube-nocookie.com', 'www.youtube-nocookie.com',
+}
+PATH_PREFIXES = ('embed', 'shorts', 'live', 'v')
+
+
+def youtube_id(url):
+    """The video id of a YouTube ``url``, or None."""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    segments = [segment for segment in parts.path.split('/') if segment]
+    candidate = None
+    if host == 'youtu.be' and segments:
+        candidate = segments[0]
+    elif host in YOUTUBE_HOSTS:
+        if segments[:1] == ['watch']:
+            candidate = parse_qs(parts.query).get('v', [None])[0]
+        elif len(segments) >= 2 and segments[0] in PATH_PREFIXES:
+            candidate = segments[1]
+    if candidate and VIDEO_ID_RE.match(candidate):
+        return candidate
+    return None
+
+
+def validate_youtube_url(value):
+    if value and youtube_id(value) is None:
+        raise ValidationError('Enter a YouTube video link (watch, share, shorts or embed URL).')
+
+
+def prepare_video(instance):
+    """
+    Normalize ``youtube_video_embed`` of a content block and set its video
+    id and, unless one was uploaded, its generated poster. Other embed URLs
+    (saved before the field was validated) are left alone and rendered as
+    a lazy iframe.
+    """
+    video_id = youtube_id(instance.youtube_video_embed or '') or ''
+    instance.youtube_video_id = video_id
+    if video_id:
+        instance.youtube_video_embed = EMBED_URL % video_id
+    poster = instance.youtube_poster.name or ''
+    generated = poster.startswith(GENERATED_POSTER.split('%s')[0])
+    if not video_id:
+        if generated:
+            instance.youtube_poster = ''
+    elif not poster or generated:
+        instance.youtube_poster = video_poster(GENERATED_POSTER % video_id)
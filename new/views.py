@@ -1,170 +1,206 @@
-from django.shortcuts import render, get_object_or_404
-from .models import Home, AlternateHome, About, ServiceCategory, Service, ServiceVariant, ServiceContent, ServiceCategoryContent, ServiceVariantContent
+import hashlib
+import os
+from functools import cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.shortcuts import render
+from django.utils.cache import add_never_cache_headers, get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from .cache import NAVIGATION_TAG, cache_public_page, tag_page
+from .css import get_build
+from .db import read_from_replica
+from .export import templates_digest
+from .media import accel_response, file_response, media_path
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, expose as expose_metrics
+from .models import PageSnapshot
+from .navigation import request_navigation
+from .search import count as count_matches, search as search_pages
+from .sitemaps import ensure_sitemaps
+from .snapshots import PAGE_TEMPLATES, aget_snapshot, get_snapshot, page_path
+
+
+@cache
+def _deployed_templates_digest():
+    # Templates only change with a deploy, which restarts the process
+    return templates_digest()
+
+
+def _page_etag(snapshot, navigation):
+    templates = templates_digest() if settings.DEBUG else _deployed_templates_digest()
+    build = get_build()
+    version = '%s:%s:%s:%s' % (snapshot.digest, templates, build['stylesheet'] if build else '', navigation.digest)
+    return '"%s"' % hashlib.sha1(version.encode()).hexdigest()
+
+
+def _conditional_response(request, snapshot, navigation):
+    etag = _page_etag(snapshot, navigation)
+    last_modified = int(snapshot.modified_at.timestamp())
+    return get_conditional_response(request, etag=etag, last_modified=last_modified), etag, last_modified
+
+
+def _page_response(response, snapshot, etag, last_modified):
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    # Cacheable, but revalidated on every use
+    patch_cache_control(response, no_cache=True)
+    # Every page shows the site menu (see new/navigation.py)
+    return tag_page(response, *snapshot.tags, NAVIGATION_TAG)
+
 
 # Create your views here.
+# Every public page is a single snapshot lookup, see new/snapshots.py for the
+# queries behind each page. Unchanged pages get a 304 before any rendering.
+# The pages read from the replica connection (see new/db.py).
+def _render_snapshot(request, kind, slug=''):
+    snapshot = get_snapshot(kind, slug)
+    response, etag, last_modified = _conditional_response(request, snapshot, request_navigation(request))
+    if response is None:
+        response = render(request, PAGE_TEMPLATES[kind], snapshot.context)
+    return _page_response(response, snapshot, etag, last_modified)
+
+
+# Async variants, used under ASGI (ASYNC_PUBLIC_VIEWS). A stale snapshot is
+# rebuilt with the independent queries of the page running concurrently,
+# and the template renders in a worker thread: the context is plain data,
+# so rendering never needs the thread the ORM calls are bound to.
+async def _arender_snapshot(request, kind, slug=''):
+    snapshot = await aget_snapshot(kind, slug)
+    navigation = await sync_to_async(request_navigation)(request)
+    response, etag, last_modified = _conditional_response(request, snapshot, navigation)
+    if response is None:
+        response = await sync_to_async(render, thread_sensitive=False)(
+            request, PAGE_TEMPLATES[kind], snapshot.context
+        )
+    return _page_response(response, snapshot, etag, last_modified)
+
+@cache_public_page
+@read_from_replica
 def home(request):
-    home = Home.objects.first()
-    alternate_home = AlternateHome.objects.filter(home=home)
-    # Get services to display on homepage (limit to 3 for grid layout)
-    # Only query the fields we actually use in the template
-    services = ServiceCategory.objects.only(
-        'heading', 'small_description', 'image_m', 'image_t', 'image_d', 'alt', 'slug'
-    )[:3]
-    return render(request, 'index.html', {
-        'home': home, 
-        'alternate_home': alternate_home,
-        'services': services
-    })
+    return _render_snapshot(request, PageSnapshot.HOME)
 
+@cache_public_page
+@read_from_replica
 def service_category_detail(request, slug):
-    # Get the service category with optimized query
-    service_category = get_object_or_404(
-        ServiceCategory.objects.only(
-            'heading', 'small_description', 'content', 'image_m', 'image_t', 'image_d', 'alt',
-            'title', 'meta_description', 'meta_keywords', 'og_title', 
-            'og_description', 'og_image', 'slug'
-        ), 
-        slug=slug
-    )
-    
-    # Get services belonging to this category (ordered by order field)
-    services = Service.objects.filter(
-        service_category=service_category
-    ).only(
-        'heading', 'small_description', 'image_m', 'image_t', 'image_d', 'alt', 'slug', 'order'
-    ).order_by('order', 'heading')
-    
-    # Get service variants belonging to services in this category (ordered by order field)
-    service_variants = ServiceVariant.objects.filter(
-        service_category__service_category=service_category
-    ).select_related('service_category').only(
-        'heading', 'small_description', 'image_m', 'image_t', 'image_d', 'alt', 'slug', 'order',
-        'service_category__heading', 'service_category__slug'
-    ).order_by('order', 'heading')
-    
-    # Get service category content (additional content blocks)
-    service_category_contents = ServiceCategoryContent.objects.filter(
-        service_category=service_category
-    ).only(
-        'image_m', 'image_t', 'image_d', 'content', 'youtube_video_embed'
-    )
-    
-    # Get related service categories (excluding current one)
-    related_categories = ServiceCategory.objects.exclude(
-        id=service_category.id
-    ).only(
-        'heading', 'small_description', 'image_m', 'image_t', 'image_d', 'alt', 'slug'
-    )[:3]
-    
-    context = {
-        'service_category': service_category,
-        'services': services,
-        'service_variants': service_variants,
-        'service_category_contents': service_category_contents,
-        'related_categories': related_categories,
-    }
-    
-    return render(request, 'service_category_detail.html', context)
+    return _render_snapshot(request, PageSnapshot.SERVICE_CATEGORY, slug)
 
+@cache_public_page
+@read_from_replica
 def service_detail(request, slug):
-    # Get the service with optimized query
-    service = get_object_or_404(
-        Service.objects.select_related('service_category').only(
-            'heading', 'small_description', 'content', 'image_m', 'image_t', 'image_d', 'alt',
-            'title', 'meta_description', 'meta_keywords', 'og_title', 
-            'og_description', 'og_image', 'slug', 'schema',
-            'service_category__heading', 'service_category__slug'
-        ), 
-        slug=slug
-    )
-    
-    # Get service content (additional content blocks)
-    service_contents = ServiceContent.objects.filter(
-        service=service
-    ).only(
-        'image_m', 'image_t', 'image_d', 'content', 'youtube_video_embed'
-    )
-    
-    # Get service variants related to this service (if ServiceVariant has FK to Service)
-    service_variants = ServiceVariant.objects.filter(
-        service_category=service
-    ).only(
-        'heading', 'small_description', 'image_m', 'image_t', 'image_d', 'alt', 'slug', 'order'
-    ).order_by('order', 'heading')
-    
-    # Get related services from the same category (excluding current service)
-    related_services = Service.objects.filter(
-        service_category=service.service_category
-    ).exclude(
-        id=service.id
-    ).only(
-        'heading', 'small_description', 'image_m', 'image_t', 'image_d', 'alt', 'slug'
-    ).order_by('order', 'heading')[:3]
-    
-    # Get other services from different categories
-    other_services = Service.objects.exclude(
-        service_category=service.service_category
-    ).only(
-        'heading', 'small_description', 'image_m', 'image_t', 'image_d', 'alt', 'slug',
-        'service_category__heading'
-    ).select_related('service_category')[:3]
-    
-    context = {
-        'service': service,
-        'service_contents': service_contents,
-        'service_variants': service_variants,
-        'related_services': related_services,
-        'other_services': other_services,
-    }
-    
-    return render(request, 'service_detail.html', context)
+    return _render_snapshot(request, PageSnapshot.SERVICE, slug)
 
+@cache_public_page
+@read_from_replica
 def service_variant_detail(request, slug):
-    # Get the service variant with optimized query
-    service_variant = get_object_or_404(
-        ServiceVariant.objects.select_related('service_category__service_category').only(
-            'heading', 'small_description', 'content', 'image_m', 'image_t', 'image_d', 'alt',
-            'title', 'meta_description', 'meta_keywords', 'og_title', 
-            'og_description', 'og_image', 'slug', 'schema', 'canonical_url',
-            'service_category__heading', 'service_category__slug',
-            'service_category__service_category__heading', 'service_category__service_category__slug'
-        ), 
-        slug=slug
-    )
-    
-    # Get service variant content (additional content blocks)
-    service_variant_contents = ServiceVariantContent.objects.filter(
-        service_variant=service_variant
-    ).only(
-        'image_m', 'image_t', 'image_d', 'content', 'youtube_video_embed'
-    )
-    
-    # Get related service variants from the same service (excluding current variant)
-    related_variants = ServiceVariant.objects.filter(
-        service_category=service_variant.service_category
-    ).exclude(
-        id=service_variant.id
-    ).only(
-        'heading', 'small_description', 'image_m', 'image_t', 'image_d', 'alt', 'slug'
-    ).order_by('order', 'heading')[:3]
-    
-    # Get other service variants from different services
-    other_variants = ServiceVariant.objects.exclude(
-        service_category=service_variant.service_category
-    ).only(
-        'heading', 'small_description', 'image_m', 'image_t', 'image_d', 'alt', 'slug',
-        'service_category__heading'
-    ).select_related('service_category')[:3]
-    
-    context = {
-        'service_variant': service_variant,
-        'service_variant_contents': service_variant_contents,
-        'related_variants': related_variants,
-        'other_variants': other_variants,
-    }
-    
-    return render(request, 'service_variant_detail.html', context)
+    return _render_snapshot(request, PageSnapshot.SERVICE_VARIANT, slug)
 
+@cache_public_page
+@read_from_replica
 def about(request):
-    about = About.objects.first()
-    return render(request, 'about.html', {'about': about})
\ No newline at end of file
+    return _render_snapshot(request, PageSnapshot.ABOUT)
+
+@cache_public_page
+@read_from_replica
+async def ahome(request):
+    return await _arender_snapshot(request, PageSnapshot.HOME)
+
+@cache_public_page
+@read_from_replica
+async def aservice_category_detail(request, slug):
+    return await _arender_snapshot(request, PageSnapshot.SERVICE_CATEGORY, slug)
+
+@cache_public_page
+@read_from_replica
+async def aservice_detail(request, slug):
+    return await _arender_snapshot(request, PageSnapshot.SERVICE, slug)
+
+@cache_public_page
+@read_from_replica
+async def aservice_variant_detail(request, slug):
+    return await _arender_snapshot(request, PageSnapshot.SERVICE_VARIANT, slug)
+
+@cache_public_page
+@read_from_replica
+async def aabout(request):
+    return await _arender_snapshot(request, PageSnapshot.ABOUT)
+
+# URL name: (sync view, async view)
+PUBLIC_VIEWS = {
+    'home': (home, ahome),
+    'about': (about, aabout),
+    'service_category_detail': (service_category_detail, aservice_category_detail),
+    'service_detail': (service_detail, aservice_detail),
+    'service_variant_detail': (service_variant_detail, aservice_variant_detail),
+}
+
+SEARCH_RESULTS_PER_PAGE = 20
+
+
+@read_from_replica
+def search(request):
+    """Full-text search over the category, service and variant pages."""
+    query = request.GET.get('q', '').strip()[:200]
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    # One extra row tells whether there is a next page
+    try:
+        results = search_pages(query, SEARCH_RESULTS_PER_PAGE + 1, (page - 1) * SEARCH_RESULTS_PER_PAGE)
+    except OverflowError:
+        # An offset beyond the 64-bit integers of SQLite
+        results = []
+    if not results and page > 1:
+        # Past the end: the last page
+        page = max(1, -(-count_matches(query) // SEARCH_RESULTS_PER_PAGE))
+        results = search_pages(query, SEARCH_RESULTS_PER_PAGE + 1, (page - 1) * SEARCH_RESULTS_PER_PAGE)
+    for result in results:
+        result['url'] = page_path(result['kind'], result['slug'])
+    return render(request, 'search.html', {
+        'query': query,
+        'results': results[:SEARCH_RESULTS_PER_PAGE],
+        'page': page,
+        'has_next': len(results) > SEARCH_RESULTS_PER_PAGE,
+    })
+
+def sitemap(request, name='sitemap.xml'):
+    """Serve sitemap.xml and its shards from the files in SITEMAP_ROOT."""
+    root = ensure_sitemaps()
+    filename = os.path.join(root, name)
+    gzipped = 'gzip' in request.headers.get('Accept-Encoding', '')
+    try:
+        response = FileResponse(open(filename + '.gz' if gzipped else filename, 'rb'), content_type='application/xml', filename=name)
+    except FileNotFoundError:
+        raise Http404('No sitemap %s' % name)
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    response.headers['X-Robots-Tag'] = 'noindex, noodp, noarchive'
+    return response
+
+
+def metrics(request):
+    """
+    The request histograms of this process (see new/metrics.py), for staff
+    or a scraper sending ``Authorization: Bearer <METRICS_TOKEN>``.
+    """
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not request.user.is_staff and not (token and constant_time_compare(authorization, 'Bearer %s' % token)):
+        raise Http404
+    response = HttpResponse(expose_metrics(), content_type=METRICS_CONTENT_TYPE)
+    add_never_cache_headers(response)
+    return response
+
+
+def media(request, name):
+    """
+    Serve an uploaded file: through the front server with ``MEDIA_ACCEL``,
+    else from this process (see new/media.py).
+    """
+    filename = media_path(name)
+    if settings.MEDIA_ACCEL:
+        return accel_response(name, filename)
+    return file_response(request, name, filename)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tos.settings')
+# Async public views, see ASYNC_PUBLIC_VIEWS
+os.environ.setdefault('TOS_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -45,9 +45,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Server-Timing headers and the /metrics histograms (see new/metrics.py)
+    'new.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # 304s for pages served from the page cache (see new/views.py)
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -58,14 +62,23 @@ ROOT_URLCONF = 'tos.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's backend, timing the renders for new/metrics.py
+        'BACKEND': 'new.metrics.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Parsed templates are kept in memory; with DEBUG they are
+            # reloaded when a template file changes
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'new.navigation.navigation',
             ],
         },
     },
@@ -77,13 +90,53 @@ WSGI_APPLICATION = 'tos.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite tuned for many readers and one writer: in WAL mode the pages keep
+# rendering while the admin saves, IMMEDIATE transactions take the write
+# lock up front (instead of failing with "database is locked" when a read
+# transaction tries to write) and busy_timeout makes the next writer wait.
+# The pragmas run on every new connection; connections persist.
+
+SQLITE_DATABASE = BASE_DIR / 'db.sqlite3'
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32 * 1024,  # KiB
+    'busy_timeout': 20000,  # ms
+    'temp_store': 'MEMORY',
+}
+
+
+def _pragmas(pragmas):
+    return ';'.join('PRAGMA %s = %s' % item for item in pragmas.items())
+
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'NAME': SQLITE_DATABASE,
+        'OPTIONS': {
+            'init_command': _pragmas({'journal_mode': 'WAL', **SQLITE_PRAGMAS}),
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # Read-only connection to the same file for the public pages (see
+    # new/db.py); WAL readers never wait for the writer.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': '%s?mode=ro' % SQLITE_DATABASE.as_uri(),
+        'OPTIONS': {
+            'init_command': _pragmas({'query_only': 'ON', **SQLITE_PRAGMAS}),
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['new.db.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -123,6 +176,21 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# collectstatic writes content-hashed names with .gz/.br siblings; the
+# image fields store their uploads once per content (see new/storage.py)
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'new.storage.CompressedManifestStaticFilesStorage',
+    },
+    'uploads': {
+        'BACKEND': 'new.storage.ContentAddressedStorage',
+    },
+}
+STATIC_COMPRESS_WORKERS = 4
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -130,4 +198,105 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Who sends the media files (see new/media.py): 'nginx' (X-Accel-Redirect to
+# MEDIA_ACCEL_PREFIX, an internal location aliased to MEDIA_ROOT), 'sendfile'
+# (X-Sendfile, Apache mod_xsendfile) or None to stream them from Django
+MEDIA_ACCEL = os.environ.get('TOS_MEDIA_ACCEL') or None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Threads of collect_media_garbage (see new/uploads.py); the work is file
+# system calls
+MEDIA_GC_WORKERS = 8
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# The page cache is shared by all worker processes so that a save in the
+# admin evicts the affected pages everywhere.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
+    },
+    # Rendered image cards ({% cache %} in the templates); their keys
+    # change with their content, so each process keeps its own copy
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template-fragments',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
+PAGE_CACHE_ALIAS = 'default'
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+# Query parameters the cached public views read; any other query string
+# (utm_source, cache busters...) is served the page cached for the path
+PAGE_CACHE_QUERY_PARAMS = ()
+
+# Serve the public pages with the async views (new/views.py); tos/asgi.py
+# turns this on, WSGI and manage.py keep the sync views.
+ASYNC_PUBLIC_VIEWS = os.environ.get('TOS_ASYNC_VIEWS') == '1'
+
+# Responsive image renditions (see new/images.py)
+
+IMAGE_RENDITION_WIDTHS = {
+    'image_m': (320, 480, 640),
+    'image_t': (768, 1024),
+    'image_d': (1280, 1600, 1920),
+}
+IMAGE_RENDITION_OPTIONS = {
+    'avif': {'quality': 55},
+    'webp': {'quality': 80, 'method': 4},
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+IMAGE_RENDITION_WORKERS = 2
+# Encode in a process pool after the admin save; False encodes inline
+IMAGE_RENDITIONS_ASYNC = True
+
+# "Related" and "other" items per service and variant page (see new/related.py)
+
+RELATED_ITEMS = 3
+# Update the relatedness index in a background thread after a save
+RELATED_ITEMS_ASYNC = True
+
+# Catalog changelists count the unfiltered list from the span of its
+# primary keys instead of COUNT(*) (see new/admin.py)
+
+ADMIN_ESTIMATED_COUNTS = True
+
+# Scheme and host of the public site, for the absolute URLs of the
+# structured data (see new/structured_data.py)
+
+SITE_URL = 'https://theonesolution.co.in'
+
+# Bearer token of the Prometheus scraper of /metrics (see new/metrics.py);
+# without one only staff users can read it
+
+METRICS_TOKEN = os.environ.get('TOS_METRICS_TOKEN', '')
+
+# Server-Timing headers on every response; without it only staff users get
+# them (see new/metrics.py)
+
+SERVER_TIMING = DEBUG
+
+# Static export of the public pages for nginx (see new/export.py)
+
+STATIC_EXPORT_ROOT = BASE_DIR / 'export'
+STATIC_EXPORT_BASE_URL = SITE_URL
+STATIC_EXPORT_WORKERS = 4
+
+# Generated sitemap.xml files (see new/sitemaps.py)
+
+SITEMAP_ROOT = BASE_DIR / 'sitemaps'
+
+# Compiled Tailwind CSS (see new/css.py); the stylesheet is written to
+# TAILWIND_BUILD_DIR, which must be the css/ directory of STATICFILES_DIRS
 
+TAILWIND_CLI = 'tailwindcss'
+TAILWIND_INPUT = BASE_DIR / 'static' / 'src' / 'tailwind.css'
+TAILWIND_BUILD_DIR = BASE_DIR / 'static' / 'css'
@@ -14,14 +14,19 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from new.views import media, metrics, sitemap
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('sitemap.xml', sitemap, name='sitemap'),
+    re_path(r'^(?P<name>sitemap-[a-z]+-[0-9]+\.xml)$', sitemap, name='sitemap_shard'),
+    path('metrics', metrics, name='metrics'),
+    # Uploaded files, in production too (see new/media.py)
+    re_path(r'^%s(?P<name>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), media, name='media'),
     path('', include('new.urls')),
-    
-    
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]